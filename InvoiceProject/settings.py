@@ -128,4 +128,35 @@ STATICFILES_DIRS = [BASE_DIR / "static"]
 # Authentication settings
 LOGIN_URL = 'login'
 LOGIN_REDIRECT_URL = 'overview'
-LOGOUT_REDIRECT_URL = 'login'
\ No newline at end of file
+LOGOUT_REDIRECT_URL = 'login'
+
+# Server-side invoice PDFs
+# Rendered files are cached here, one directory per invoice
+INVOICE_PDF_CACHE_DIR = BASE_DIR / 'pdf_cache'
+# TrueType fonts with Lithuanian letters; without them the PDF falls back to core fonts
+INVOICE_PDF_FONT = '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'
+INVOICE_PDF_FONT_BOLD = '/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf'
+# Worker processes for bulk PDF downloads (None = CPU count)
+INVOICE_BULK_WORKERS = None
+
+# Shared by all worker processes on the host, so cached results and the tax
+# cache counters are not kept once per process; use Redis or Memcached when
+# running on several hosts. Version stamps of cached per-user results are
+# kept in the database (invoices.CacheVersion) either way
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'django_cache',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    }
+}
+
+# Cached tax calculations (see invoices/tax_cache.py), in seconds
+TAX_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Invoice drafts not updated for this many days are deleted by
+# `manage.py purge_invoice_drafts` (see invoices/drafts.py)
+INVOICE_DRAFT_MAX_AGE_DAYS = 30
+
+# Rendered invoice preview fragments (see invoices/preview.py), in seconds
+INVOICE_PREVIEW_CACHE_TIMEOUT = 60 * 60 * 24 * 7
@@ -1,11 +1,14 @@
-﻿from django.contrib import admin
-from .models import Client, SelfInfo, Invoice, LineItem, TaxSettings
+﻿import datetime
+
+from django.contrib import admin
+from .models import Client, SelfInfo, Invoice, LineItem, TaxSettings, MonthlyIncome
+from .utils import mark_invoices_paid
 
 @admin.register(Client)
 class ClientAdmin(admin.ModelAdmin):
-    list_display = ('company_name', 'first_name', 'last_name', 'phone', 'company_code')
+    list_display = ('company_name', 'first_name', 'last_name', 'phone', 'company_code', 'user')
     search_fields = ('company_name', 'first_name', 'last_name', 'company_code', 'pvm_code')
-    list_filter = ('company_name',)
+    list_filter = ('user',)
     ordering = ('company_name',)
 
 @admin.register(SelfInfo)
@@ -22,9 +25,9 @@ class TaxSettingsAdmin(admin.ModelAdmin):
 
 @admin.register(Invoice)
 class InvoiceAdmin(admin.ModelAdmin):
-    list_display = ('invoice_number', 'user', 'client', 'date', 'pay_until', 'total_amount', 'serija')
+    list_display = ('invoice_number', 'user', 'client', 'date', 'pay_until', 'total_amount', 'serija', 'status', 'paid_date')
     search_fields = ('invoice_number', 'client__company_name', 'user__username')
-    list_filter = ('user', 'date', 'serija', 'client')
+    list_filter = ('user', 'date', 'serija', 'status', 'client')
     date_hierarchy = 'date'
     ordering = ('-date',)
     readonly_fields = ('total_amount',)
@@ -39,7 +42,16 @@ class InvoiceAdmin(admin.ModelAdmin):
         ('Finansai', {
             'fields': ('total_amount',)
         }),
+        ('Apmokėjimas', {
+            'fields': ('status', 'paid_date')
+        }),
     )
+    actions = ['mark_paid']
+
+    @admin.action(description='Pažymėti apmokėtomis (šiandien)')
+    def mark_paid(self, request, queryset):
+        count = mark_invoices_paid(queryset, datetime.date.today())
+        self.message_user(request, f'Apmokėtomis pažymėta sąskaitų: {count}.')
 
 @admin.register(LineItem)
 class LineItemAdmin(admin.ModelAdmin):
@@ -47,3 +59,11 @@ class LineItemAdmin(admin.ModelAdmin):
     search_fields = ('service_name', 'invoice__invoice_number')
     list_filter = ('pcs_type', 'invoice__date')
     ordering = ('-invoice__date',)
+
+
+@admin.register(MonthlyIncome)
+class MonthlyIncomeAdmin(admin.ModelAdmin):
+    list_display = ('user', 'year', 'month', 'serija', 'invoice_count', 'total_amount')
+    list_filter = ('user', 'year', 'serija')
+    ordering = ('-year', '-month')
+    readonly_fields = ('user', 'year', 'month', 'serija', 'invoice_count', 'total_amount')
@@ -0,0 +1,136 @@
+"""
+Bulk download of invoice PDFs as a ZIP archive.
+
+PDFs are rendered in parallel by one ProcessPoolExecutor shared by all
+requests and created on first use. Workers write
+them into the PDF cache (see invoices/pdf.py) and return the file path.
+The parent process copies each file into the archive as soon as it is
+ready and yields the compressed bytes, so neither the PDFs nor the ZIP
+are ever held in memory as a whole.
+"""
+import os
+import re
+import threading
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+import django
+from django.apps import apps
+from django.conf import settings
+from django.db import connections
+
+from .models import Invoice
+
+# Characters allowed in a ZIP entry name part, anything else becomes '_'
+UNSAFE_NAME_CHARS = re.compile(r'[^A-Za-z0-9._-]')
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _init_worker():
+    # Forked workers must not reuse the parent's database connections
+    if not apps.ready:
+        django.setup()
+    connections.close_all()
+
+
+def _render_invoice_pdf(invoice_id):
+    from .pdf import get_invoice_pdf
+
+    invoice = Invoice.objects.select_related('client', 'user__self_info').get(id=invoice_id)
+    return str(get_invoice_pdf(invoice))
+
+
+def _get_executor():
+    """The shared worker pool, created on first use."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            max_workers = getattr(settings, 'INVOICE_BULK_WORKERS', None) or os.cpu_count()
+            _executor = ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker)
+        return _executor
+
+
+def _discard_executor(executor):
+    """Forget a pool whose worker died, so the next request starts a new one."""
+    global _executor
+    with _executor_lock:
+        if _executor is executor:
+            _executor = None
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+class _StreamBuffer:
+    """Write-only, unseekable buffer; zipfile then writes data descriptors instead of seeking back."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def _safe_name_part(value):
+    """Keep a user-entered value from adding directories or odd characters to a ZIP entry name."""
+    return UNSAFE_NAME_CHARS.sub('_', str(value))
+
+
+def _archive_names(invoices):
+    """Unique file names inside the archive, keyed by invoice id."""
+    names = {}
+    used = set()
+    for invoice_id, serija, invoice_number, date in invoices:
+        base = f"{date:%Y-%m}/{_safe_name_part(serija)}-{_safe_name_part(invoice_number)}"
+        name = f"{base}.pdf"
+        suffix = 2
+        while name in used:
+            name = f"{base}-{suffix}.pdf"
+            suffix += 1
+        used.add(name)
+        names[invoice_id] = name
+    return names
+
+
+def iter_invoice_zip(invoices):
+    """
+    Render the given invoices in parallel and yield a ZIP archive of the
+    PDFs in chunks, adding each file as soon as its render finishes.
+
+    The pool size is INVOICE_BULK_WORKERS or the CPU count.
+
+    Args:
+        invoices: Invoice queryset
+    """
+    names = _archive_names(invoices.values_list('id', 'serija', 'invoice_number', 'date'))
+
+    buffer = _StreamBuffer()
+    # Close our connection so that workers forked for this request open their own
+    connections.close_all()
+    executor = _get_executor()
+    futures = {}
+    try:
+        for invoice_id in names:
+            futures[executor.submit(_render_invoice_pdf, invoice_id)] = invoice_id
+        with zipfile.ZipFile(buffer, mode='w', compression=zipfile.ZIP_DEFLATED) as archive:
+            for future in as_completed(futures):
+                archive.write(future.result(), arcname=names[futures[future]])
+                yield buffer.pop()
+        yield buffer.pop()
+    except BrokenProcessPool:
+        _discard_executor(executor)
+        raise
+    finally:
+        # The pool outlives the request; drop renders nobody will read any more
+        for future in futures:
+            future.cancel()
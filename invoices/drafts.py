@@ -0,0 +1,203 @@
+"""
+Invoice drafts of the new invoice page.
+
+The draft lives in InvoiceDraft / DraftLineItem instead of the session:
+adding a line is one small INSERT, removing it one DELETE, and the draft
+follows the user across devices. Drafts untouched for
+INVOICE_DRAFT_MAX_AGE_DAYS are deleted by `manage.py purge_invoice_drafts`.
+"""
+import datetime
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max, Sum
+from django.utils import timezone
+
+from .models import DraftLineItem, Invoice, InvoiceDraft, LineItem
+from .search import index_invoices
+from .utils import allocate_invoice_numbers, line_item_total
+
+PURGE_BATCH_SIZE = 1000
+
+CENT = Decimal('0.01')
+
+
+def draft_max_age():
+    return datetime.timedelta(days=getattr(settings, 'INVOICE_DRAFT_MAX_AGE_DAYS', 30))
+
+
+def get_draft(user_id):
+    """The user's draft, created with default dates if there is none."""
+    today = datetime.date.today()
+    draft, _ = InvoiceDraft.objects.get_or_create(
+        user_id=user_id,
+        defaults={'date': today, 'pay_until': today + datetime.timedelta(days=14)},
+    )
+    return draft
+
+
+def draft_total(line_items):
+    return sum((item.total_amount for item in line_items), Decimal('0.00'))
+
+
+def stored_draft_total(draft):
+    """Total of the draft's lines, summed by the database."""
+    total = draft.line_items.aggregate(total=Sum('total_amount'))['total'] or Decimal('0.00')
+    return total.quantize(CENT)
+
+
+def update_draft_details(draft, **details):
+    """Save changed header fields (serija, client_id, invoice_number, date, pay_until) with one UPDATE."""
+    changed = [name for name, value in details.items() if getattr(draft, name) != value]
+    for name in changed:
+        setattr(draft, name, details[name])
+    # Touch updated_at even without changes, the draft is in use
+    draft.save(update_fields=changed + ['updated_at'])
+
+
+def touch_draft(draft):
+    """Mark the draft as in use, so purge_invoice_drafts keeps it."""
+    InvoiceDraft.objects.filter(pk=draft.pk).update(updated_at=timezone.now())
+
+
+def _cents(value):
+    # Round to the stored precision first so that the amount matches the saved values
+    return Decimal(str(value)).quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def add_draft_line(draft, service_name, quantity, pcs_type, price):
+    """Append a line to the draft; the amount is quantity × price rounded to cents."""
+    quantity = _cents(quantity)
+    price = _cents(price)
+    with transaction.atomic():
+        last = draft.line_items.aggregate(last=Max('position'))['last']
+        return DraftLineItem.objects.create(
+            draft=draft,
+            position=0 if last is None else last + 1,
+            service_name=service_name,
+            quantity=quantity,
+            pcs_type=pcs_type,
+            price=price,
+            total_amount=line_item_total(quantity, price),
+        )
+
+
+def update_draft_line(draft, line_id, **fields):
+    """
+    Change fields (service_name, quantity, pcs_type, price) of one line and
+    recompute its amount.
+
+    Returns:
+        The updated line, or None if the draft has no such line
+    """
+    line = DraftLineItem.objects.filter(draft=draft, id=line_id).first()
+    if line is None:
+        return None
+    for name in ('quantity', 'price'):
+        if name in fields:
+            fields[name] = _cents(fields[name])
+    for name, value in fields.items():
+        setattr(line, name, value)
+    line.total_amount = line_item_total(line.quantity, line.price)
+    line.save(update_fields=list(fields) + ['total_amount'])
+    return line
+
+
+def reorder_draft_lines(draft, line_ids):
+    """
+    Put the draft's lines in the order of line_ids. Lines missing from
+    line_ids keep their relative order after the listed ones; unknown ids
+    are ignored.
+
+    Returns:
+        Line ids in their new order
+    """
+    lines = list(draft.line_items.only('id', 'position'))
+    rank = {line_id: index for index, line_id in enumerate(dict.fromkeys(line_ids))}
+    lines.sort(key=lambda line: (rank.get(line.id, len(rank)), line.position, line.id))
+    changed = []
+    for position, line in enumerate(lines):
+        if line.position != position:
+            line.position = position
+            changed.append(line)
+    DraftLineItem.objects.bulk_update(changed, ['position'])
+    return [line.id for line in lines]
+
+
+def remove_draft_line(draft, line_id):
+    """Delete one line of the draft. Returns False if the draft has no such line."""
+    deleted, _ = DraftLineItem.objects.filter(draft=draft, id=line_id).delete()
+    return bool(deleted)
+
+
+def create_invoice_from_draft(draft, client_id, serija, invoice_number, date, pay_until, allocate_number=False):
+    """
+    Turn the draft into an invoice and delete the draft, in one transaction.
+
+    Line and invoice totals are recomputed from quantity and price, and all
+    line items are inserted with a single bulk_create.
+
+    Args:
+        draft: InvoiceDraft with at least one line
+        client_id, serija, date, pay_until: Invoice fields (dates as datetime.date)
+        invoice_number: Number typed by the user; ignored with allocate_number
+        allocate_number: Reserve the next number of the series instead
+
+    Returns:
+        The created Invoice
+    """
+    with transaction.atomic():
+        if allocate_number:
+            invoice_number = allocate_invoice_numbers(draft.user_id, serija, date.year)[0]
+        line_items = []
+        total_amount = Decimal('0.00')
+        for item in draft.line_items.all():
+            line_total = line_item_total(item.quantity, item.price)
+            total_amount += line_total
+            line_items.append(LineItem(
+                service_name=item.service_name,
+                quantity=item.quantity,
+                pcs_type=item.pcs_type,
+                price=item.price,
+                total_amount=line_total,
+            ))
+        invoice = Invoice.objects.create(
+            serija=serija,
+            user_id=draft.user_id,
+            client_id=client_id,
+            invoice_number=invoice_number,
+            date=date,
+            pay_until=pay_until,
+            total_amount=total_amount,
+        )
+        for line_item in line_items:
+            line_item.invoice = invoice
+        # Single INSERT for all line items; bulk_create sends no signals, so
+        # index the line item services explicitly
+        LineItem.objects.bulk_create(line_items)
+        index_invoices([invoice.id])
+        draft.delete()
+    return invoice
+
+
+def purge_expired_drafts(max_age=None, batch_size=PURGE_BATCH_SIZE, now=None):
+    """
+    Delete drafts not updated within max_age, batch_size drafts per
+    transaction, so the purge never holds long locks on a large table.
+
+    Returns:
+        Number of drafts deleted
+    """
+    if max_age is None:
+        max_age = draft_max_age()
+    cutoff = (now or timezone.now()) - max_age
+    deleted = 0
+    while True:
+        ids = list(InvoiceDraft.objects.filter(updated_at__lt=cutoff).order_by('id').values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        with transaction.atomic():
+            DraftLineItem.objects.filter(draft_id__in=ids).delete()
+            InvoiceDraft.objects.filter(id__in=ids).delete()
+        deleted += len(ids)
@@ -0,0 +1,71 @@
+"""
+Streaming export of invoices and their line items for accounting.
+Rows are read with QuerySet.iterator() and written one at a time, so
+memory use does not depend on the size of the export.
+"""
+import csv
+
+from openpyxl import Workbook
+
+from .models import Invoice
+from .utils import year_date_range
+
+EXPORT_CHUNK_SIZE = 2000
+
+EXPORT_HEADER = [
+    'Serija', 'Numeris', 'Data', 'Apmokėti iki',
+    'Klientas', 'Įmonės kodas', 'PVM kodas', 'Sąskaitos suma',
+    'Paslauga / prekė', 'Kiekis', 'Mato vnt.', 'Kaina', 'Eilutės suma',
+]
+
+EXPORT_FIELDS = [
+    'serija', 'invoice_number', 'date', 'pay_until',
+    'client__company_name', 'client__company_code', 'client__pvm_code', 'total_amount',
+    'line_items__service_name', 'line_items__quantity', 'line_items__pcs_type',
+    'line_items__price', 'line_items__total_amount',
+]
+
+
+def export_rows(user_id, year=None, client_id=None, serija=None):
+    """
+    Yield one tuple per line item (invoices without line items produce a
+    single row with empty line item columns), ordered by invoice date.
+    """
+    invoices = Invoice.objects.filter(user_id=user_id)
+    if year:
+        invoices = invoices.filter(date__range=year_date_range(int(year)))
+    if client_id:
+        invoices = invoices.filter(client_id=client_id)
+    if serija:
+        invoices = invoices.filter(serija=serija)
+    rows = invoices.order_by('date', 'id', 'line_items__id').values_list(*EXPORT_FIELDS)
+    return rows.iterator(chunk_size=EXPORT_CHUNK_SIZE)
+
+
+class _Echo:
+    """File-like object whose write() returns the value instead of buffering it."""
+
+    def write(self, value):
+        return value
+
+
+def iter_csv(rows):
+    """Yield CSV lines for the export header and rows."""
+    writer = csv.writer(_Echo())
+    # BOM so that spreadsheet programs detect UTF-8 (Lithuanian letters)
+    yield '\ufeff' + writer.writerow(EXPORT_HEADER)
+    for row in rows:
+        yield writer.writerow(['' if value is None else value for value in row])
+
+
+def write_xlsx(rows, fileobj):
+    """
+    Write the export into an XLSX workbook. openpyxl's write-only mode
+    streams rows to disk instead of memory.
+    """
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('Sąskaitos')
+    sheet.append(EXPORT_HEADER)
+    for row in rows:
+        sheet.append(list(row))
+    workbook.save(fileobj)
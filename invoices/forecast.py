@@ -0,0 +1,151 @@
+"""
+Year-end tax forecast from partial data.
+
+The months of the year that are not complete yet are projected from the
+monthly income series the dashboard already has (this year and last year,
+see get_dashboard_summary()), so a forecast needs no extra queries. Taxes
+are then calculated for the projected year with month-by-month PSD.
+"""
+import datetime
+from decimal import Decimal
+
+from .tax_rules import get_tax_rules
+from .utils import MONTH_NAMES, apply_monthly_psd, calculate_monthly_psd, calculate_taxes
+
+FORECAST_METHODS = {
+    'trailing_average': 'Paskutinių 3 mėn. vidurkis',
+    'last_year': 'Tie patys mėnesiai pernai',
+    'linear_trend': 'Tiesinė tendencija',
+}
+
+# Months of history used by the trailing average and by the trend line
+TRAILING_MONTHS = 3
+TREND_MONTHS = 12
+
+
+def complete_months(year, today):
+    """Number of months of the year that are over."""
+    if year < today.year:
+        return 12
+    if year > today.year:
+        return 0
+    return today.month - 1
+
+
+def _linear_trend(points, steps_ahead):
+    """Least-squares line through the points, evaluated steps_ahead after the last one."""
+    n = len(points)
+    if n == 0:
+        return Decimal('0')
+    if n == 1:
+        return points[0]
+    sum_x = Decimal(n * (n - 1) // 2)
+    sum_xx = Decimal((n - 1) * n * (2 * n - 1) // 6)
+    sum_y = sum(points, Decimal('0'))
+    sum_xy = sum((Decimal(x) * y for x, y in enumerate(points)), Decimal('0'))
+    slope = (n * sum_xy - sum_x * sum_y) / (n * sum_xx - sum_x * sum_x)
+    intercept = (sum_y - slope * sum_x) / n
+    return intercept + slope * (n - 1 + steps_ahead)
+
+
+def project_monthly_income(monthly_income, prev_monthly_income, months_done, method='trailing_average'):
+    """
+    Fill in the months after months_done with projected income.
+
+    Args:
+        monthly_income: 12 Decimals of this year's actual income
+        prev_monthly_income: 12 Decimals of last year's actual income
+        months_done: Number of complete months (actual values are kept for them)
+        method: One of FORECAST_METHODS
+
+    Returns:
+        List of 12 (income, projected) pairs. A projected month never shows
+        less than the income already invoiced in it.
+    """
+    if method not in FORECAST_METHODS:
+        raise ValueError(f"unknown forecast method '{method}'")
+    # Continuous series of actual months up to the last complete one,
+    # starting at the first month with any income
+    history = list(prev_monthly_income) + list(monthly_income[:months_done])
+    while history and not history[0]:
+        history.pop(0)
+    trailing = history[-TRAILING_MONTHS:]
+
+    months = []
+    for index in range(12):
+        actual = monthly_income[index]
+        if index < months_done:
+            months.append((actual, False))
+            continue
+        if method == 'trailing_average':
+            value = sum(trailing, Decimal('0')) / len(trailing) if trailing else Decimal('0')
+        elif method == 'last_year':
+            value = prev_monthly_income[index]
+        else:
+            value = _linear_trend(history[-TREND_MONTHS:], index - months_done + 1)
+        value = max(value, actual, Decimal('0')).quantize(Decimal('0.01'))
+        months.append((value, True))
+    return months
+
+
+def forecast_taxes(monthly_income, prev_monthly_income, year, method='trailing_average', today=None,
+                   activity_start_date=None, use_30_percent_rule=True):
+    """
+    Projected year-end income and taxes.
+
+    Args:
+        monthly_income: 12 Decimals of the year's actual income
+        prev_monthly_income: 12 Decimals of the previous year's income
+        year: Forecast year (selects the tax rules)
+        method: One of FORECAST_METHODS
+        today: Date that splits actual and projected months (defaults to today)
+        activity_start_date: Activity start date (for the VSDI exemption)
+        use_30_percent_rule: If True, use 30% expense rule
+
+    Returns:
+        Dictionary with the projected totals, taxes and a per-month breakdown
+        with income, PSD and whether the month is projected
+    """
+    if today is None:
+        today = datetime.date.today()
+    rules = get_tax_rules(year)
+    months_done = complete_months(year, today)
+    months = project_monthly_income(monthly_income, prev_monthly_income, months_done, method)
+
+    gross_income = sum((income for income, _ in months), Decimal('0.00'))
+    # Liabilities as of the end of the year
+    taxes = calculate_taxes(
+        gross_income,
+        use_30_percent_rule=use_30_percent_rule,
+        activity_start_date=activity_start_date,
+        current_date=datetime.date(year, 12, 31),
+        rules=rules,
+    )
+    monthly_psd = calculate_monthly_psd(
+        [(month, income) for month, (income, _) in enumerate(months, start=1)],
+        use_30_percent_rule,
+        rules=rules,
+    )
+    apply_monthly_psd(taxes, monthly_psd)
+
+    return {
+        'method': method,
+        'label': FORECAST_METHODS[method],
+        'complete_months': months_done,
+        'gross_income': gross_income,
+        'vsdi': taxes['vsdi'],
+        'psdi': taxes['psdi'],
+        'gpm': taxes['gpm'],
+        'total_taxes': taxes['total_taxes'],
+        'net_income': taxes['net_income'],
+        'months': [
+            {
+                'month': month,
+                'name': MONTH_NAMES[month - 1],
+                'income': income,
+                'projected': projected,
+                'psd': Decimal(str(breakdown['psd'])),
+            }
+            for month, ((income, projected), breakdown) in enumerate(zip(months, monthly_psd['monthly_breakdown']), start=1)
+        ],
+    }
@@ -10,7 +10,8 @@ class InvoiceForm(forms.ModelForm):
             'invoice_number': forms.TextInput(attrs={'class': 'input-field'}),
             'date': forms.DateInput(attrs={'class': 'input-field'}),
             'pay_until': forms.DateInput(attrs={'class': 'input-field'}),
-            'client': forms.Select(attrs={'class': 'input-field'}),
+            # Picked with the client typeahead, see components/client_typeahead.html
+            'client': forms.HiddenInput(),
         }
 
 class SelfInfoForm(forms.ModelForm):
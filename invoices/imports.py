@@ -0,0 +1,370 @@
+"""
+Bulk import of invoices and line items from CSV or JSON.
+
+Input is validated in a single streaming pass. The user's clients are resolved
+by company_code through one preloaded dictionary, and valid invoices are
+written with bulk_create in batches. Rows that fail validation are
+reported with their row number and skipped; the rest of the file is
+still imported. Invoice numbers already used in the series (by the user's
+invoices or earlier in the file) are reported the same way, and imported
+numbers move the series' InvoiceSequence past them.
+
+CSV files have one row per line item. Consecutive rows with the same
+serija, invoice number and date form one invoice. The columns produced
+by invoices/exports.py are accepted, so an export can be imported back.
+JSON input is either an array or JSON Lines of invoice objects with an
+optional "line_items" list. Arrays are decoded one element at a time, so
+large files are never held in memory whole.
+"""
+import csv
+import datetime
+import json
+from collections import defaultdict
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+from django.db import transaction
+
+from .exports import EXPORT_HEADER
+from .models import Client, Invoice, LineItem
+from .search import index_invoices
+from .tax_cache import bump_tax_version
+from .utils import (
+    adjust_monthly_income,
+    advance_invoice_sequence,
+    allocate_invoice_numbers,
+    line_item_total,
+    sequence_number,
+)
+
+IMPORT_BATCH_SIZE = 1000
+
+# Invoice numbers per duplicate lookup query
+DUPLICATE_CHECK_CHUNK = 500
+
+# Characters read at a time from a JSON array
+JSON_CHUNK_SIZE = 64 * 1024
+
+# Marks a JSON syntax error; nothing after it can be decoded
+JSON_SYNTAX_ERROR = object()
+
+INVOICE_KEYS = ['serija', 'invoice_number', 'date', 'pay_until', 'client_code', 'total_amount']
+LINE_ITEM_KEYS = ['service_name', 'quantity', 'pcs_type', 'price', 'line_total']
+
+# Column headers of the CSV export mapped to import keys
+EXPORT_HEADER_KEYS = dict(zip(EXPORT_HEADER, [
+    'serija', 'invoice_number', 'date', 'pay_until',
+    None, 'client_code', None, 'total_amount',
+    'service_name', 'quantity', 'pcs_type', 'price', 'line_total',
+]))
+
+SERIJA_VALUES = {value for value, _ in Invoice.SERIJA_CHOICES}
+PCS_TYPE_VALUES = {value for value, _ in LineItem.PCS_TYPE_CHOICES}
+
+
+class ImportRowError(ValueError):
+    pass
+
+
+def _iter_csv(lines):
+    """Yield (row_number, invoice_fields, [line_item_fields]) from CSV rows grouped per invoice."""
+    reader = csv.DictReader(lines)
+    current_key = None
+    current = None
+    for row_number, row in enumerate(reader, start=2):
+        row = {
+            EXPORT_HEADER_KEYS.get(column, column): (value or '').strip()
+            for column, value in row.items()
+            if column is not None
+        }
+        key = (row.get('serija'), row.get('invoice_number'), row.get('date'))
+        if current is None or key != current_key or not row.get('invoice_number'):
+            if current is not None:
+                yield current
+            current_key = key
+            current = (row_number, {k: row.get(k, '') for k in INVOICE_KEYS}, [])
+        if row.get('service_name'):
+            current[2].append({k: row.get(k, '') for k in LINE_ITEM_KEYS})
+    if current is not None:
+        yield current
+
+
+def _iter_json(stream):
+    """Yield (row_number, invoice_fields, [line_item_fields]) from a JSON array or JSON Lines."""
+    first = stream.read(1)
+    while first and first.isspace():
+        first = stream.read(1)
+    if first == '[':
+        objects = _iter_json_array(stream)
+    else:
+        objects = (
+            (number, _loads_or_none(line))
+            for number, line in enumerate(_prepend(first, stream), start=1)
+            if line.strip()
+        )
+    for number, obj in objects:
+        if obj is JSON_SYNTAX_ERROR:
+            yield number, JSON_SYNTAX_ERROR, []
+            return
+        if not isinstance(obj, dict):
+            yield number, None, []
+            continue
+        fields = {k: str(obj.get(k) if obj.get(k) is not None else '').strip() for k in INVOICE_KEYS}
+        line_items = [
+            {k: str(item.get(k) if item.get(k) is not None else '').strip() for k in LINE_ITEM_KEYS}
+            for item in obj.get('line_items') or []
+            if isinstance(item, dict)
+        ]
+        yield number, fields, line_items
+
+
+def _iter_json_array(stream):
+    """
+    Yield (element_number, object) from a JSON array whose '[' was already
+    read, decoding one element at a time. A syntax error yields
+    (element_number, JSON_SYNTAX_ERROR) and ends the array.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    eof = False
+    number = 0
+    need_comma = False
+    while True:
+        buffer = buffer.lstrip()
+        if buffer.startswith(']'):
+            return
+        if need_comma and buffer:
+            if buffer[0] != ',':
+                yield number + 1, JSON_SYNTAX_ERROR
+                return
+            buffer = buffer[1:]
+            need_comma = False
+            continue
+        decoded = None
+        if buffer:
+            try:
+                obj, end = decoder.raw_decode(buffer)
+                # A value ending at the end of the buffer may be cut off (e.g. a number)
+                decoded = end < len(buffer) or eof
+            except ValueError:
+                decoded = False
+        if decoded:
+            number += 1
+            yield number, obj
+            buffer = buffer[end:]
+            need_comma = True
+        elif eof:
+            yield number + 1, JSON_SYNTAX_ERROR
+            return
+        else:
+            chunk = stream.read(JSON_CHUNK_SIZE)
+            eof = not chunk
+            buffer += chunk
+
+
+def _loads_or_none(line):
+    try:
+        return json.loads(line)
+    except ValueError:
+        return None
+
+
+def _prepend(first, stream):
+    """Iterate over the lines of a stream whose first character was already read."""
+    first_line = first + stream.readline()
+    yield first_line
+    yield from stream
+
+
+def _parse_date(value, field):
+    try:
+        return datetime.date.fromisoformat(value)
+    except ValueError:
+        raise ImportRowError(f"{field}: invalid date '{value}'")
+
+
+def _parse_amount(value, field):
+    try:
+        amount = Decimal(value)
+    except InvalidOperation:
+        raise ImportRowError(f"{field}: invalid number '{value}'")
+    if not amount.is_finite():
+        raise ImportRowError(f"{field}: invalid number '{value}'")
+    return amount.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+
+
+def _build_invoice(user_id, fields, line_fields, client_ids):
+    """Validate one invoice and return unsaved (Invoice, [LineItem])."""
+    if fields is JSON_SYNTAX_ERROR:
+        raise ImportRowError("invalid JSON; this and all later elements were not imported")
+    if fields is None:
+        raise ImportRowError("not a valid JSON invoice object")
+    serija = fields['serija'] or 'AA'
+    if serija not in SERIJA_VALUES:
+        raise ImportRowError(f"serija: unknown series '{serija}'")
+    client_code = fields['client_code']
+    if client_code not in client_ids:
+        raise ImportRowError(f"client_code: no client with company code '{client_code}'")
+    date = _parse_date(fields['date'], 'date')
+    pay_until = _parse_date(fields['pay_until'], 'pay_until') if fields['pay_until'] else date + datetime.timedelta(days=30)
+
+    line_items = []
+    for item in line_fields:
+        pcs_type = item['pcs_type'] or 'val'
+        if pcs_type not in PCS_TYPE_VALUES:
+            # Accept the display form ('Vnt') as well as the stored value
+            pcs_type = pcs_type.lower()
+            if pcs_type not in PCS_TYPE_VALUES:
+                raise ImportRowError(f"pcs_type: unknown unit '{item['pcs_type']}'")
+        quantity = _parse_amount(item['quantity'] or '1', 'quantity')
+        price = _parse_amount(item['price'] or '0', 'price')
+        if item['line_total']:
+            line_total = _parse_amount(item['line_total'], 'line_total')
+        else:
+            line_total = line_item_total(quantity, price)
+        line_items.append(LineItem(
+            service_name=item['service_name'][:255],
+            quantity=quantity,
+            pcs_type=pcs_type,
+            price=price,
+            total_amount=line_total,
+        ))
+
+    if fields['total_amount']:
+        total_amount = _parse_amount(fields['total_amount'], 'total_amount')
+    elif line_items:
+        total_amount = sum((item.total_amount for item in line_items), Decimal('0.00'))
+    else:
+        raise ImportRowError("total_amount: missing and there are no line items to sum")
+
+    invoice = Invoice(
+        serija=serija,
+        user_id=user_id,
+        client_id=client_ids[client_code],
+        invoice_number=fields['invoice_number'][:50],
+        date=date,
+        pay_until=pay_until,
+        total_amount=total_amount,
+    )
+    return invoice, line_items
+
+
+def _save_batch(user_id, batch):
+    """Insert a batch of (Invoice, [LineItem]) pairs and update the MonthlyIncome rollup."""
+    with transaction.atomic():
+        # Imported numbers first move their series past them, then invoices
+        # without a number get consecutive numbers from their series
+        highest = {}
+        unnumbered = defaultdict(list)
+        for invoice, _ in batch:
+            series = (invoice.serija, invoice.date.year)
+            number = sequence_number(invoice.invoice_number)
+            if number is not None:
+                highest[series] = max(highest.get(series, 0), number)
+            elif not invoice.invoice_number:
+                unnumbered[series].append(invoice)
+        for (serija, year), number in highest.items():
+            advance_invoice_sequence(user_id, serija, year, number)
+        for (serija, year), invoices in unnumbered.items():
+            numbers = allocate_invoice_numbers(user_id, serija, year, count=len(invoices))
+            for invoice, number in zip(invoices, numbers):
+                invoice.invoice_number = number
+
+        invoices = Invoice.objects.bulk_create([invoice for invoice, _ in batch])
+        line_items = []
+        for invoice, (_, items) in zip(invoices, batch):
+            for item in items:
+                item.invoice = invoice
+                line_items.append(item)
+        LineItem.objects.bulk_create(line_items, batch_size=IMPORT_BATCH_SIZE)
+
+        # bulk_create does not send signals, so update the rollup, the search index and the tax cache here
+        deltas = defaultdict(lambda: [0, Decimal('0.00')])
+        for invoice in invoices:
+            delta = deltas[(invoice.date.replace(day=1), invoice.serija)]
+            delta[0] += 1
+            delta[1] += invoice.total_amount
+        for (month_start, serija), (count, amount) in deltas.items():
+            adjust_monthly_income(user_id, month_start, serija, count, amount)
+        index_invoices([invoice.id for invoice in invoices])
+        bump_tax_version(user_id)
+    return len(invoices), len(line_items)
+
+
+def _without_duplicates(user_id, batch, seen_numbers, errors):
+    """
+    Drop invoices whose number the series already has in the same year, in
+    the database or earlier in the file, reporting them as row errors; one
+    query per batch. Numbers restart every year, like the sequences.
+
+    Returns:
+        List of (Invoice, [LineItem]) pairs to save
+    """
+    numbers = sorted({invoice.invoice_number for _, invoice, _ in batch if invoice.invoice_number})
+    existing = set()
+    # Chunks keep the IN list under the database's parameter limit
+    for start in range(0, len(numbers), DUPLICATE_CHECK_CHUNK):
+        existing.update(Invoice.objects.filter(
+            user_id=user_id, invoice_number__in=numbers[start:start + DUPLICATE_CHECK_CHUNK],
+        ).values_list('serija', 'date__year', 'invoice_number'))
+    kept = []
+    for row_number, invoice, line_items in batch:
+        key = (invoice.serija, invoice.date.year, invoice.invoice_number)
+        if invoice.invoice_number:
+            if key in existing:
+                errors.append((row_number, f"invoice_number: {invoice.serija} {invoice.invoice_number} already exists in {invoice.date.year}"))
+                continue
+            if key in seen_numbers:
+                errors.append((row_number, f"invoice_number: {invoice.serija} {invoice.invoice_number} is repeated in {invoice.date.year} in the file"))
+                continue
+            seen_numbers.add(key)
+        kept.append((invoice, line_items))
+    return kept
+
+
+def import_invoices(user_id, stream, file_format='csv', batch_size=IMPORT_BATCH_SIZE, dry_run=False):
+    """
+    Import invoices for a user from a text stream.
+
+    Args:
+        user_id: Owner of the imported invoices
+        stream: Text file object with CSV or JSON content
+        file_format: 'csv' or 'json' (JSON array or JSON Lines)
+        batch_size: Invoices per bulk_create batch
+        dry_run: Only validate, do not write anything
+
+    Returns:
+        Dictionary with imported invoice/line item counts and a list of
+        (row_number, message) errors
+    """
+    client_ids = dict(Client.objects.filter(user_id=user_id).values_list('company_code', 'id'))
+    records = _iter_json(stream) if file_format == 'json' else _iter_csv(stream)
+
+    result = {'invoices': 0, 'line_items': 0, 'errors': []}
+    # (serija, invoice_number) pairs taken earlier in the file
+    seen_numbers = set()
+
+    def flush(batch):
+        batch = _without_duplicates(user_id, batch, seen_numbers, result['errors'])
+        if dry_run:
+            invoices, line_items = len(batch), sum(len(items) for _, items in batch)
+        elif batch:
+            invoices, line_items = _save_batch(user_id, batch)
+        else:
+            invoices, line_items = 0, 0
+        result['invoices'] += invoices
+        result['line_items'] += line_items
+
+    batch = []
+    for row_number, fields, line_fields in records:
+        try:
+            batch.append((row_number,) + _build_invoice(user_id, fields, line_fields, client_ids))
+        except ImportRowError as e:
+            result['errors'].append((row_number, str(e)))
+            continue
+        if len(batch) >= batch_size:
+            flush(batch)
+            batch = []
+    if batch:
+        flush(batch)
+    result['errors'].sort(key=lambda error: error[0])
+    return result
@@ -0,0 +1,72 @@
+import random
+import time
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.core.management.base import BaseCommand, CommandError
+
+from invoices.utils import amount_to_words, euro_words
+
+
+def legacy_amount_to_words(amount):
+    """The float based converter amount_to_words replaced, for comparison."""
+    from num2words import num2words
+    try:
+        amount = float(amount)
+        euros = int(amount)
+        cents = int(round((amount - euros) * 100))
+        words = num2words(euros, lang='lt')
+        return f"{words} eur ir {cents:02d} ct"
+    except Exception:
+        return ""
+
+
+def reference_amount_to_words(amount):
+    """Exact expected words: Decimal cents and num2words for the euros."""
+    from num2words import num2words
+    euros, cents = divmod(int(amount.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP) * 100), 100)
+    return f"{num2words(euros, lang='lt')} eur ir {cents:02d} ct"
+
+
+def _amount(rng, places):
+    """Random non-negative amount, mostly in typical invoice ranges."""
+    top = rng.choice([100, 2000, 30000, 1_000_000, 100_000_000])
+    return Decimal(rng.randrange(top * 10 ** places)).scaleb(-places)
+
+
+def _timed(function, amounts):
+    start = time.perf_counter()
+    results = [function(amount) for amount in amounts]
+    return results, time.perf_counter() - start
+
+
+class Command(BaseCommand):
+    help = "Check amount_to_words against num2words on random amounts and compare its speed with the float based converter."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=1_000_000, help="Number of random amounts")
+        parser.add_argument('--seed', type=int, default=1, help="Random seed")
+        parser.add_argument('--places', type=int, default=2, help="Decimal places of the amounts (3 shows float rounding errors)")
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        amounts = [_amount(rng, options['places']) for _ in range(options['count'])]
+
+        expected, reference_time = _timed(reference_amount_to_words, amounts)
+        euro_words.cache_clear()
+        results, new_time = _timed(amount_to_words, amounts)
+        legacy, legacy_time = _timed(legacy_amount_to_words, amounts)
+
+        count = len(amounts)
+        for name, seconds in (('amount_to_words', new_time), ('legacy (float)', legacy_time), ('num2words reference', reference_time)):
+            self.stdout.write(f"{name:20} {seconds:8.2f} s  {count / seconds:12,.0f} amounts/s")
+        info = euro_words.cache_info()
+        self.stdout.write(f"euro_words cache: {info.hits} hits, {info.misses} misses")
+
+        legacy_mismatches = sum(1 for got, want in zip(legacy, expected) if got != want)
+        self.stdout.write(f"Legacy converter wrong for {legacy_mismatches} of {count} amounts")
+        mismatches = [(amount, got, want) for amount, got, want in zip(amounts, results, expected) if got != want]
+        for amount, got, want in mismatches[:10]:
+            self.stderr.write(f"{amount}: {got!r} != {want!r}")
+        if mismatches:
+            raise CommandError(f"amount_to_words wrong for {len(mismatches)} of {count} amounts")
+        self.stdout.write(self.style.SUCCESS(f"All {count} amounts match num2words ({legacy_time / new_time:.1f}x faster than legacy)"))
@@ -0,0 +1,107 @@
+import datetime
+import statistics
+import time
+import uuid
+from contextlib import contextmanager
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models.signals import post_save
+from django.test.utils import CaptureQueriesContext
+
+from invoices.drafts import create_invoice_from_draft
+from invoices.models import Client, DraftLineItem, Invoice, InvoiceDraft, LineItem
+from invoices.signals import index_line_item_invoice, touch_line_item_invoice
+from invoices.utils import line_item_total
+
+DATE = datetime.date(2000, 1, 10)
+
+
+def _draft(user, line_count):
+    draft = InvoiceDraft.objects.create(user=user, date=DATE, pay_until=DATE + datetime.timedelta(days=14))
+    DraftLineItem.objects.bulk_create([
+        DraftLineItem(
+            draft=draft, position=position, service_name=f"Paslauga {position}",
+            quantity=Decimal('1.50'), pcs_type='val', price=Decimal('40.00'), total_amount=Decimal('60.00'),
+        )
+        for position in range(line_count)
+    ])
+    return draft
+
+
+# Per-line receivers added after the legacy code; it never ran them
+LINE_ITEM_SAVE_RECEIVERS = [index_line_item_invoice, touch_line_item_invoice]
+
+
+@contextmanager
+def _without_line_item_receivers():
+    for receiver in LINE_ITEM_SAVE_RECEIVERS:
+        post_save.disconnect(receiver, sender=LineItem)
+    try:
+        yield
+    finally:
+        for receiver in LINE_ITEM_SAVE_RECEIVERS:
+            post_save.connect(receiver, sender=LineItem)
+
+
+def legacy_create(draft, client_id, number):
+    """Invoice creation as it was before bulk_create: one INSERT per line item."""
+    with transaction.atomic(), _without_line_item_receivers():
+        items = list(draft.line_items.all())
+        invoice = Invoice.objects.create(
+            serija='AA', user_id=draft.user_id, client_id=client_id, invoice_number=number,
+            date=draft.date, pay_until=draft.pay_until,
+            total_amount=sum((item.total_amount for item in items), Decimal('0.00')),
+        )
+        for item in items:
+            LineItem.objects.create(
+                invoice=invoice, service_name=item.service_name, quantity=item.quantity,
+                pcs_type=item.pcs_type, price=item.price, total_amount=line_item_total(item.quantity, item.price),
+            )
+        draft.delete()
+
+
+def current_create(draft, client_id, number):
+    create_invoice_from_draft(draft, client_id, 'AA', number, draft.date, draft.pay_until)
+
+
+class Command(BaseCommand):
+    help = "Time invoice creation by line count: one INSERT per line (before) against bulk_create (now)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lines', type=int, nargs='+', default=[1, 10, 100, 500], help="Line counts to measure")
+        parser.add_argument('--repeat', type=int, default=5, help="Invoices created per line count and method")
+
+    def handle(self, *args, **options):
+        # Everything is rolled back at the end, the configured database keeps no benchmark rows
+        with transaction.atomic():
+            self._run(options)
+            transaction.set_rollback(True)
+
+    def _run(self, options):
+        user = get_user_model().objects.create_user(f"benchmark-{uuid.uuid4().hex[:12]}")
+        client = Client.objects.create(
+            user=user, company_name='Benchmark', company_code='0', address='-', first_name='-', last_name='-', phone='-',
+        )
+        number = 0
+        self.stdout.write(f"{'lines':>6} {'before ms':>10} {'queries':>8} {'now ms':>10} {'queries':>8} {'speedup':>8}")
+        for line_count in options['lines']:
+            results = {}
+            for name, create in (('before', legacy_create), ('now', current_create)):
+                timings = []
+                for _ in range(options['repeat']):
+                    draft = _draft(user, line_count)
+                    number += 1
+                    # The query log is capped; start each measurement from an empty one
+                    connection.queries_log.clear()
+                    with CaptureQueriesContext(connection) as queries:
+                        began = time.perf_counter()
+                        create(draft, client.id, f"{number:08d}")
+                        timings.append((time.perf_counter() - began) * 1000)
+                results[name] = (statistics.median(timings), len(queries.captured_queries))
+            (before_ms, before_queries), (now_ms, now_queries) = results['before'], results['now']
+            self.stdout.write(
+                f"{line_count:>6} {before_ms:>10.1f} {before_queries:>8} {now_ms:>10.1f} {now_queries:>8} {before_ms / now_ms:>7.1f}x"
+            )
@@ -0,0 +1,85 @@
+import statistics
+import threading
+import time
+import uuid
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from invoices.models import InvoiceSequence
+from invoices.utils import allocate_invoice_numbers
+
+
+def allocate_concurrently(user_id, serija, year, workers, allocations):
+    """
+    Allocate numbers from one series in `workers` threads, each with its own
+    database connection, `allocations` times per thread.
+
+    Returns:
+        (numbers, seconds) lists: every allocated number and the time each
+        allocation took
+    """
+    numbers, timings, errors = [], [], []
+    lock = threading.Lock()
+    start = threading.Barrier(workers)
+
+    def work():
+        own_numbers, own_timings = [], []
+        try:
+            start.wait()
+            for _ in range(allocations):
+                began = time.perf_counter()
+                own_numbers.extend(allocate_invoice_numbers(user_id, serija, year))
+                own_timings.append(time.perf_counter() - began)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            connection.close()
+        with lock:
+            numbers.extend(own_numbers)
+            timings.extend(own_timings)
+
+    threads = [threading.Thread(target=work) for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise errors[0]
+    return numbers, timings
+
+
+class Command(BaseCommand):
+    help = "Allocate invoice numbers from one series in parallel threads and check they are unique and gapless."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=8, help="Parallel threads")
+        parser.add_argument('--allocations', type=int, default=200, help="Numbers allocated per thread")
+
+    def handle(self, *args, **options):
+        workers, allocations = options['workers'], options['allocations']
+        # A throwaway user keeps the benchmark away from real series
+        user = get_user_model().objects.create_user(f"benchmark-{uuid.uuid4().hex[:12]}")
+        year = 2000
+        try:
+            began = time.perf_counter()
+            numbers, timings = allocate_concurrently(user.id, 'AA', year, workers, allocations)
+            elapsed = time.perf_counter() - began
+            last_number = InvoiceSequence.objects.get(user=user, serija='AA', year=year).last_number
+        finally:
+            user.delete()
+
+        total = workers * allocations
+        values = sorted(int(number) for number in numbers)
+        timings_ms = sorted(seconds * 1000 for seconds in timings)
+        self.stdout.write(f"{total} allocations in {workers} threads: {elapsed:.2f} s, {total / elapsed:,.0f} allocations/s")
+        self.stdout.write(
+            f"Per allocation: median {statistics.median(timings_ms):.2f} ms, "
+            f"p95 {timings_ms[int(len(timings_ms) * 0.95) - 1]:.2f} ms, max {timings_ms[-1]:.2f} ms"
+        )
+        if len(set(values)) != len(values):
+            raise CommandError(f"{len(values) - len(set(values))} duplicate number(s) allocated")
+        if values != list(range(1, total + 1)) or last_number != total:
+            raise CommandError(f"Numbers are not the contiguous range 1-{total} (sequence at {last_number})")
+        self.stdout.write(self.style.SUCCESS(f"All {total} numbers unique and contiguous"))
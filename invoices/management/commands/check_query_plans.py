@@ -0,0 +1,27 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from invoices.query_plans import hot_queries, query_plan
+
+
+class Command(BaseCommand):
+    help = "Run EXPLAIN QUERY PLAN for hot invoice queries and fail if any falls back to a full table scan (SQLite only)."
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError("check_query_plans only understands SQLite query plans")
+
+        failures = []
+        for name, queryset in hot_queries(user_id=1, year=datetime.date.today().year).items():
+            details, scans = query_plan(queryset)
+            self.stdout.write(f"{name}:")
+            for detail in details:
+                self.stdout.write(f"    {detail}")
+            if scans:
+                failures.append(name)
+
+        if failures:
+            raise CommandError(f"Full table scan in: {', '.join(failures)}")
+        self.stdout.write(self.style.SUCCESS("All hot queries use an index"))
@@ -0,0 +1,165 @@
+import datetime
+import json
+import random
+import shutil
+import subprocess
+from decimal import Decimal
+
+from django.contrib.staticfiles import finders
+from django.core.management.base import BaseCommand, CommandError
+
+from invoices.tax_rules import TAX_RULES
+from invoices.utils import apply_monthly_psd, calculate_monthly_psd, calculate_taxes
+
+# Reads {"rules": {...}, "cases": [...]} from stdin and prints the results
+NODE_SCRIPT = """
+const calculator = require(process.argv[1]);
+let input = '';
+process.stdin.on('data', chunk => { input += chunk; });
+process.stdin.on('end', () => {
+    const data = JSON.parse(input);
+    const rules = {};
+    for (const [year, raw] of Object.entries(data.rules)) {
+        rules[year] = calculator.compileRules(raw);
+    }
+    const results = data.cases.map(c => {
+        const yearRules = rules[c.year];
+        const result = calculator.calculateTaxes({
+            income: c.income,
+            expenses: c.expenses,
+            use30PercentRule: c.use_30_percent_rule,
+            activityStartDate: c.activity_start_date,
+            currentDate: c.current_date,
+            psdSelfPaid: c.psd_self_paid,
+        }, yearRules);
+        const monthlyPsd = calculator.calculateMonthlyPsd(c.monthly_income, c.use_30_percent_rule, yearRules);
+        const withMonthlyPsd = calculator.applyMonthlyPsd(Object.assign({}, result), monthlyPsd);
+        return {taxes: result, monthly_psd: monthlyPsd, with_monthly_psd: withMonthlyPsd};
+    });
+    process.stdout.write(JSON.stringify(results));
+});
+"""
+
+
+def _amount(rng):
+    """
+    Random amount, mostly around the MMA and GPM thresholds. Most have two
+    decimals; the rest are off the cent grid (three to five decimals, half
+    cents) or written as integers or with an exponent, as typed into a
+    number field.
+    """
+    cents = rng.choice([
+        rng.randint(0, 2000_00),
+        rng.randint(0, 30000_00),
+        rng.randint(0, 200000_00),
+        rng.randint(0, 5_000_000_00),
+    ])
+    form = rng.random()
+    if form < 0.6:
+        return str(Decimal(cents) / 100)
+    if form < 0.7:
+        return str(cents // 100)
+    if form < 0.8:
+        return f"{cents // 100}.{cents % 100:02d}5"
+    if form < 0.9:
+        places = rng.randint(3, 5)
+        return str(Decimal(cents * 10 ** (places - 2) + rng.randint(0, 10 ** (places - 2) - 1)).scaleb(-places))
+    return f"{Decimal(cents).scaleb(-2).normalize():E}"
+
+
+def _random_case(rng, years):
+    year = rng.choice(years)
+    current_date = datetime.date(year, rng.randint(1, 12), rng.randint(1, 28))
+    start = None
+    if rng.random() < 0.5:
+        start = current_date - datetime.timedelta(days=rng.randint(0, 1000))
+    return {
+        'year': year,
+        'income': _amount(rng),
+        'expenses': _amount(rng) if rng.random() < 0.8 else None,
+        'use_30_percent_rule': rng.random() < 0.5,
+        'psd_self_paid': rng.random() < 0.7,
+        'activity_start_date': start.isoformat() if start else None,
+        'current_date': current_date.isoformat(),
+        'monthly_income': [[month, _amount(rng) if rng.random() < 0.5 else str(rng.randint(0, 3000))] for month in range(1, 13)],
+    }
+
+
+def _to_json(value):
+    # Same conversion as the JSON views (_tax_result_json)
+    return json.loads(json.dumps(value, default=float))
+
+
+def _python_results(case):
+    rules = TAX_RULES[case['year']]
+    start = case['activity_start_date']
+    taxes = calculate_taxes(
+        case['income'],
+        expenses=case['expenses'],
+        use_30_percent_rule=case['use_30_percent_rule'],
+        activity_start_date=datetime.date.fromisoformat(start) if start else None,
+        current_date=datetime.date.fromisoformat(case['current_date']),
+        psd_self_paid=case['psd_self_paid'],
+        rules=rules,
+    )
+    monthly_psd = calculate_monthly_psd(case['monthly_income'], case['use_30_percent_rule'], rules=rules)
+    with_monthly_psd = dict(taxes)
+    apply_monthly_psd(with_monthly_psd, monthly_psd)
+    return _to_json({'taxes': taxes, 'monthly_psd': monthly_psd, 'with_monthly_psd': with_monthly_psd})
+
+
+def random_cases(count, seed):
+    rng = random.Random(seed)
+    years = sorted(TAX_RULES)
+    return [_random_case(rng, years) for _ in range(count)]
+
+
+def run_js_calculator(node, cases):
+    """Results of static/js/tax_calculator.js for the cases, run in Node.js."""
+    module = finders.find('js/tax_calculator.js')
+    if not module:
+        raise CommandError("static file js/tax_calculator.js not found")
+    payload = json.dumps({'rules': {year: rules.as_json() for year, rules in TAX_RULES.items()}, 'cases': cases})
+    process = subprocess.run([node, '-e', NODE_SCRIPT, module], input=payload, capture_output=True, text=True)
+    if process.returncode != 0:
+        raise CommandError(f"node failed: {process.stderr.strip()}")
+    return json.loads(process.stdout)
+
+
+def parity_differences(cases, js_results):
+    """Yield (case, part, python_result, js_result) for every part the two sides disagree on."""
+    for case, js_result in zip(cases, js_results):
+        for part, expected in _python_results(case).items():
+            if js_result[part] != expected:
+                yield case, part, expected, js_result[part]
+
+
+class Command(BaseCommand):
+    help = "Compare static/js/tax_calculator.js with the Python tax functions over random inputs (needs Node.js)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=5000, help='Number of random cases')
+        parser.add_argument('--seed', type=int, default=None, help='Random seed (printed when not given)')
+        parser.add_argument('--node', default='node', help='Node.js executable')
+
+    def handle(self, *args, **options):
+        node = shutil.which(options['node'])
+        if not node:
+            raise CommandError(f"Node.js executable '{options['node']}' not found")
+
+        seed = options['seed'] if options['seed'] is not None else random.randrange(2 ** 32)
+        cases = random_cases(options['count'], seed)
+        js_results = run_js_calculator(node, cases)
+
+        mismatches = 0
+        for case, part, expected, actual in parity_differences(cases, js_results):
+            mismatches += 1
+            if mismatches <= 10:
+                fields = sorted(key for key in set(expected) | set(actual) if expected.get(key) != actual.get(key))
+                self.stdout.write(f"{part} differs for {json.dumps(case)}")
+                for key in fields:
+                    self.stdout.write(f"    {key}: python={expected.get(key)!r} js={actual.get(key)!r}")
+
+        if mismatches:
+            raise CommandError(f"{mismatches} differences in {len(cases)} cases (seed {seed})")
+        self.stdout.write(self.style.SUCCESS(f"{len(cases)} cases match (seed {seed})"))
@@ -0,0 +1,37 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from invoices.exports import export_rows, iter_csv, write_xlsx
+
+
+class Command(BaseCommand):
+    help = "Export a user's invoices and line items as CSV (default) or XLSX."
+
+    def add_arguments(self, parser):
+        parser.add_argument('username', help="Owner of the invoices")
+        parser.add_argument('--format', choices=['csv', 'xlsx'], default='csv')
+        parser.add_argument('--year', type=int)
+        parser.add_argument('--client', type=int, help="Client id")
+        parser.add_argument('--serija', choices=['AA', 'VSP'])
+        parser.add_argument('--output', '-o', help="Output file (CSV defaults to stdout)")
+
+    def handle(self, *args, **options):
+        try:
+            user = get_user_model().objects.get(username=options['username'])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f"User '{options['username']}' does not exist")
+
+        rows = export_rows(user.id, year=options['year'], client_id=options['client'], serija=options['serija'])
+
+        if options['format'] == 'xlsx':
+            if not options['output']:
+                raise CommandError("XLSX export needs --output")
+            write_xlsx(rows, options['output'])
+            return
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8', newline='') as output:
+                output.writelines(iter_csv(rows))
+        else:
+            for line in iter_csv(rows):
+                self.stdout.write(line, ending='')
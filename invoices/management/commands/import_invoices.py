@@ -0,0 +1,37 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from invoices.imports import IMPORT_BATCH_SIZE, import_invoices
+
+
+class Command(BaseCommand):
+    help = "Bulk import invoices and line items for a user from a CSV or JSON file."
+
+    def add_arguments(self, parser):
+        parser.add_argument('username', help="Owner of the imported invoices")
+        parser.add_argument('path', help="CSV, JSON or JSON Lines file")
+        parser.add_argument('--format', choices=['csv', 'json'], help="Defaults to the file extension")
+        parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE)
+        parser.add_argument('--dry-run', action='store_true', help="Validate only, do not write anything")
+
+    def handle(self, *args, **options):
+        try:
+            user = get_user_model().objects.get(username=options['username'])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f"User '{options['username']}' does not exist")
+
+        path = options['path']
+        file_format = options['format'] or ('json' if path.endswith(('.json', '.jsonl')) else 'csv')
+        with open(path, encoding='utf-8-sig', newline='') as stream:
+            result = import_invoices(
+                user.id, stream, file_format=file_format,
+                batch_size=options['batch_size'], dry_run=options['dry_run'],
+            )
+
+        for row_number, message in result['errors']:
+            self.stderr.write(f"row {row_number}: {message}")
+        verb = "Validated" if options['dry_run'] else "Imported"
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {result['invoices']} invoice(s) with {result['line_items']} line item(s), "
+            f"{len(result['errors'])} error(s)"
+        ))
@@ -0,0 +1,18 @@
+import datetime
+
+from django.core.management.base import BaseCommand
+
+from invoices.drafts import PURGE_BATCH_SIZE, draft_max_age, purge_expired_drafts
+
+
+class Command(BaseCommand):
+    help = "Delete invoice drafts that were not updated for INVOICE_DRAFT_MAX_AGE_DAYS (or --days)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, help="Maximum draft age in days")
+        parser.add_argument('--batch-size', type=int, default=PURGE_BATCH_SIZE, help="Drafts deleted per transaction")
+
+    def handle(self, *args, **options):
+        max_age = datetime.timedelta(days=options['days']) if options['days'] is not None else draft_max_age()
+        count = purge_expired_drafts(max_age, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Deleted {count} expired draft(s)"))
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from invoices.utils import find_monthly_income_drift, rebuild_monthly_income
+
+
+class Command(BaseCommand):
+    help = "Rebuild the MonthlyIncome rollup from invoices, or check it for drift with --check."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, help="Only process invoices of this user id")
+        parser.add_argument('--check', action='store_true', help="Report drift without rewriting the rollup")
+
+    def handle(self, *args, **options):
+        user_id = options['user']
+
+        if options['check']:
+            drift = find_monthly_income_drift(user_id)
+            for (drift_user, year, month, serija), stored, expected in drift:
+                self.stdout.write(
+                    f"user {drift_user} {year}-{month:02d} {serija}: "
+                    f"stored {stored[0]} / {stored[1]}, expected {expected[0]} / {expected[1]}"
+                )
+            if drift:
+                raise CommandError(f"{len(drift)} MonthlyIncome row(s) out of sync, run without --check to rebuild")
+            self.stdout.write(self.style.SUCCESS("MonthlyIncome is in sync with invoices"))
+            return
+
+        count = rebuild_monthly_income(user_id)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {count} MonthlyIncome row(s)"))
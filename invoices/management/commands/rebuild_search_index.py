@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from invoices.search import rebuild_search_index, search_backend
+
+
+class Command(BaseCommand):
+    help = "Rebuild the invoice full-text search index (SQLite FTS5 or PostgreSQL tsvector)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, help="Only reindex invoices of this user id")
+
+    def handle(self, *args, **options):
+        if search_backend() is None:
+            raise CommandError("This database backend has no search index, search uses plain lookups")
+        count = rebuild_search_index(options['user'])
+        self.stdout.write(self.style.SUCCESS(f"Indexed {count} invoice(s)"))
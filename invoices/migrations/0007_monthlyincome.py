@@ -0,0 +1,57 @@
+# Generated by Django 5.2.7 on 2026-10-17 00:59
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import ExtractMonth, ExtractYear
+
+
+def populate_monthly_income(apps, schema_editor):
+    Invoice = apps.get_model('invoices', 'Invoice')
+    MonthlyIncome = apps.get_model('invoices', 'MonthlyIncome')
+    rows = (
+        Invoice.objects
+        .annotate(year=ExtractYear('date'), month=ExtractMonth('date'))
+        .values('user_id', 'year', 'month', 'serija')
+        .annotate(invoice_count=Count('id'), total=Sum('total_amount'))
+        .order_by()
+    )
+    MonthlyIncome.objects.bulk_create([
+        MonthlyIncome(
+            user_id=row['user_id'],
+            year=row['year'],
+            month=row['month'],
+            serija=row['serija'],
+            invoice_count=row['invoice_count'],
+            total_amount=row['total'] or 0,
+        )
+        for row in rows
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoices', '0006_selfinfo_activity_start_date_taxsettings'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MonthlyIncome',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.PositiveSmallIntegerField()),
+                ('month', models.PositiveSmallIntegerField()),
+                ('serija', models.CharField(choices=[('AA', 'AA'), ('VSP', 'VSP')], max_length=3)),
+                ('invoice_count', models.PositiveIntegerField(default=0)),
+                ('total_amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='monthly_incomes', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'year', 'month', 'serija'), name='unique_monthly_income')],
+            },
+        ),
+        migrations.RunPython(populate_monthly_income, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.7 on 2026-10-17 00:59
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoices', '0007_monthlyincome'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['user', 'date'], name='invoice_user_date_idx'),
+        ),
+    ]
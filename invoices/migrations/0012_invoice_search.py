@@ -0,0 +1,65 @@
+from django.db import migrations
+
+# Search index of invoices/search.py. The index is backend specific, so it
+# is created with raw SQL for the current database vendor only.
+
+SQLITE_FORWARD = [
+    """
+    CREATE VIRTUAL TABLE invoices_invoice_fts USING fts5(
+        owner, invoice_number, client, services,
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '2 3'
+    )
+    """,
+    """
+    INSERT INTO invoices_invoice_fts (rowid, owner, invoice_number, client, services)
+    SELECT i.id, 'u' || i.user_id, i.invoice_number,
+           c.company_name || ' ' || c.company_code || COALESCE(' ' || c.pvm_code, ''),
+           COALESCE((SELECT group_concat(l.service_name, ' ') FROM invoices_lineitem l WHERE l.invoice_id = i.id), '')
+    FROM invoices_invoice i JOIN invoices_client c ON c.id = i.client_id
+    """,
+]
+SQLITE_BACKWARD = ["DROP TABLE IF EXISTS invoices_invoice_fts"]
+
+POSTGRESQL_FORWARD = [
+    """
+    CREATE TABLE invoices_invoice_search (
+        invoice_id bigint PRIMARY KEY REFERENCES invoices_invoice (id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED,
+        user_id integer NOT NULL,
+        document tsvector NOT NULL
+    )
+    """,
+    "CREATE INDEX invoices_invoice_search_document_idx ON invoices_invoice_search USING GIN (document)",
+    "CREATE INDEX invoices_invoice_search_user_idx ON invoices_invoice_search (user_id)",
+    """
+    INSERT INTO invoices_invoice_search (invoice_id, user_id, document)
+    SELECT i.id, i.user_id,
+           setweight(to_tsvector('simple', i.invoice_number), 'A')
+           || setweight(to_tsvector('simple', concat_ws(' ', c.company_name, c.company_code, c.pvm_code)), 'B')
+           || setweight(to_tsvector('simple', COALESCE(
+                  (SELECT string_agg(l.service_name, ' ') FROM invoices_lineitem l WHERE l.invoice_id = i.id), '')), 'C')
+    FROM invoices_invoice i JOIN invoices_client c ON c.id = i.client_id
+    """,
+]
+POSTGRESQL_BACKWARD = ["DROP TABLE IF EXISTS invoices_invoice_search"]
+
+
+def _run(statements):
+    def run(apps, schema_editor):
+        for sql in statements.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(sql)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoices', '0011_invoice_status'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            _run({'sqlite': SQLITE_FORWARD, 'postgresql': POSTGRESQL_FORWARD}),
+            _run({'sqlite': SQLITE_BACKWARD, 'postgresql': POSTGRESQL_BACKWARD}),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.7 on 2026-10-17 01:31
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoices', '0012_invoice_search'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InvoiceDraft',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('serija', models.CharField(choices=[('AA', 'AA'), ('VSP', 'VSP')], default='AA', max_length=3)),
+                ('invoice_number', models.CharField(blank=True, max_length=50)),
+                ('date', models.DateField(blank=True, null=True)),
+                ('pay_until', models.DateField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True, db_index=True)),
+                ('client', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='invoices.client')),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='invoice_draft', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DraftLineItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.PositiveIntegerField()),
+                ('service_name', models.CharField(max_length=255)),
+                ('quantity', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('pcs_type', models.CharField(choices=[('val', 'val'), ('vnt', 'Vnt')], max_length=3)),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('total_amount', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('draft', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='line_items', to='invoices.invoicedraft')),
+            ],
+            options={
+                'ordering': ['position', 'id'],
+                'indexes': [models.Index(fields=['draft', 'position'], name='draft_line_position_idx')],
+            },
+        ),
+    ]
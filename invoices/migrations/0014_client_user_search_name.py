@@ -0,0 +1,83 @@
+# Generated by Django 5.2.7 on 2026-10-17 01:37
+
+import unicodedata
+from collections import Counter, defaultdict
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def search_key(text):
+    # Same as invoices.models.search_key at the time of this migration
+    decomposed = unicodedata.normalize('NFKD', text or '')
+    return ' '.join(''.join(c for c in decomposed if not unicodedata.combining(c)).lower().split())
+
+
+def assign_client_owners(apps, schema_editor):
+    """
+    Give every client an owner: the user with the most invoices for it.
+    Other users invoicing the same client get their own copy, and their
+    invoices and drafts are moved to it. Clients without invoices go to the
+    first superuser (or the first user).
+    """
+    Client = apps.get_model('invoices', 'Client')
+    Invoice = apps.get_model('invoices', 'Invoice')
+    InvoiceDraft = apps.get_model('invoices', 'InvoiceDraft')
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    fallback = (
+        User.objects.filter(is_superuser=True).order_by('id').values_list('id', flat=True).first()
+        or User.objects.order_by('id').values_list('id', flat=True).first()
+    )
+
+    usage = defaultdict(Counter)
+    rows = Invoice.objects.values_list('client_id', 'user_id').annotate(count=Count('id')).order_by()
+    for client_id, user_id, count in rows:
+        usage[client_id][user_id] = count
+
+    for client in Client.objects.order_by('id').iterator():
+        users = [user_id for user_id, _ in usage[client.id].most_common()] or [fallback]
+        client.user_id = users[0]
+        client.search_name = search_key(client.company_name)
+        client.save(update_fields=['user', 'search_name'])
+        for user_id in users[1:]:
+            original_id = client.id
+            client.pk = None
+            client.user_id = user_id
+            client.save()
+            Invoice.objects.filter(client_id=original_id, user_id=user_id).update(client_id=client.id)
+            InvoiceDraft.objects.filter(client_id=original_id, user_id=user_id).update(client_id=client.id)
+            client.pk = original_id
+        # Drafts of other users may not point at someone else's client
+        InvoiceDraft.objects.filter(client_id=client.id).exclude(user_id=users[0]).update(client_id=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoices', '0013_invoicedraft'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='client',
+            name='search_name',
+            field=models.CharField(blank=True, editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='client',
+            name='user',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='clients', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(assign_client_owners, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='client',
+            index=models.Index(fields=['user', 'search_name'], name='client_user_search_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='client',
+            index=models.Index(fields=['user', 'company_code'], name='client_user_company_code_idx'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+from django.db import migrations
+from django.db.models import BigIntegerField, Max
+from django.db.models.functions import Cast, ExtractYear
+
+# Same as invoices.utils.SEQUENCE_NUMBER_RE at the time of this migration
+SEQUENCE_NUMBER_RE = r'^[0-9]{1,9}$'
+
+
+def seed_invoice_sequences(apps, schema_editor):
+    """
+    Move every (user, serija, year) sequence past the highest number
+    already issued in it, with one grouped query, so numbers typed or
+    imported before sequences tracked them are never allocated again.
+    """
+    Invoice = apps.get_model('invoices', 'Invoice')
+    InvoiceSequence = apps.get_model('invoices', 'InvoiceSequence')
+    rows = (
+        Invoice.objects.filter(invoice_number__regex=SEQUENCE_NUMBER_RE)
+        .values('user_id', 'serija', year=ExtractYear('date'))
+        .annotate(highest=Max(Cast('invoice_number', BigIntegerField())))
+        .order_by()
+    )
+    for row in rows:
+        sequence, created = InvoiceSequence.objects.get_or_create(
+            user_id=row['user_id'], serija=row['serija'], year=row['year'],
+            defaults={'last_number': row['highest']},
+        )
+        if not created and sequence.last_number < row['highest']:
+            sequence.last_number = row['highest']
+            sequence.save(update_fields=['last_number'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoices', '0015_invoice_updated_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(seed_invoice_sequences, migrations.RunPython.noop),
+    ]
@@ -1,8 +1,19 @@
+import unicodedata
+
 from django.db import models
+from django.db.models import Q
 from django.contrib.auth import get_user_model
 
 
+def search_key(text):
+    """Lowercase text without diacritics and extra spaces, for prefix lookups (e.g. 'Ąžuolas  UAB' -> 'azuolas uab')."""
+    decomposed = unicodedata.normalize('NFKD', text or '')
+    return ' '.join(''.join(c for c in decomposed if not unicodedata.combining(c)).lower().split())
+
+
 class Client(models.Model):
+    # Owner; clients are only visible to the user who created them
+    user = models.ForeignKey(get_user_model(), on_delete=models.CASCADE, related_name='clients', blank=True, null=True)
     company_name = models.CharField(max_length=255)
     company_code = models.CharField(max_length=50)
     pvm_code = models.CharField(max_length=50, blank=True, null=True)
@@ -10,6 +21,22 @@ class Client(models.Model):
     first_name = models.CharField(max_length=100)
     last_name = models.CharField(max_length=100)
     phone = models.CharField(max_length=30)
+    # search_key(company_name), kept up to date in save()
+    search_name = models.CharField(max_length=255, blank=True, editable=False)
+
+    class Meta:
+        indexes = [
+            # Client typeahead: prefix range scans within one user's clients
+            models.Index(fields=['user', 'search_name'], name='client_user_search_name_idx'),
+            models.Index(fields=['user', 'company_code'], name='client_user_company_code_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.search_name = search_key(self.company_name)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'company_name' in update_fields:
+            kwargs['update_fields'] = set(update_fields) | {'search_name'}
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.company_name} ({self.first_name} {self.last_name})"
@@ -25,6 +52,8 @@ class SelfInfo(models.Model):
     phone = models.CharField(max_length=30)
     bank_account = models.CharField(max_length=100)
     activity_start_date = models.DateField(null=True, blank=True, help_text="Individualios veiklos pradžios data (VSDI lengvatai)")
+    # Part of the invoice preview ETag, the seller is printed on every invoice
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f"{self.first_name} {self.last_name}"
@@ -51,10 +80,63 @@ class Invoice(models.Model):
     pay_until = models.DateField()
     invoice_number = models.CharField(max_length=50)
     total_amount = models.DecimalField(max_digits=10, decimal_places=2)
+    STATUS_CHOICES = [
+        ('unpaid', 'Neapmokėta'),
+        ('paid', 'Apmokėta'),
+    ]
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='unpaid')
+    paid_date = models.DateField(blank=True, null=True)
+    # Last change of the invoice, its line items or its client (see
+    # signals.py); seller changes are tracked by SelfInfo.updated_at
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # Per-user date range filters and newest-first listings
+            models.Index(fields=['user', 'date'], name='invoice_user_date_idx'),
+            # Per-client aggregates (client analytics)
+            models.Index(fields=['user', 'client', 'date'], name='invoice_user_client_date_idx'),
+            # Receivables: only unpaid invoices, by due date
+            models.Index(fields=['user', 'pay_until'], condition=Q(status='unpaid'), name='invoice_unpaid_due_idx'),
+        ]
 
     def __str__(self):
         return f"Invoice {self.invoice_number} for {self.client}"
 
+class InvoiceSequence(models.Model):
+    """Last invoice number handed out per user, serija and year."""
+    user = models.ForeignKey(get_user_model(), on_delete=models.CASCADE, related_name='invoice_sequences')
+    serija = models.CharField(max_length=3, choices=Invoice.SERIJA_CHOICES)
+    year = models.PositiveSmallIntegerField()
+    last_number = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'serija', 'year'], name='unique_invoice_sequence'),
+        ]
+
+    def __str__(self):
+        return f"{self.user} {self.serija} {self.year}: {self.last_number}"
+
+class CacheVersion(models.Model):
+    """
+    Version stamp of one kind of cached per-user results (e.g. 'taxes').
+    Kept in the database so every process sees the same stamp, whatever
+    cache backend is configured (see tax_cache.py).
+    """
+    user = models.ForeignKey(get_user_model(), on_delete=models.CASCADE, related_name='cache_versions')
+    name = models.CharField(max_length=20)
+    version = models.BigIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'name'], name='unique_cache_version'),
+        ]
+
+    def __str__(self):
+        return f"{self.user} {self.name}: {self.version}"
+
+
 class LineItem(models.Model):
     PCS_TYPE_CHOICES = [
         ('val', 'val'),
@@ -70,3 +152,61 @@ class LineItem(models.Model):
     def __str__(self):
         return f"{self.service_name} ({self.quantity} {self.get_pcs_type_display()})"
 
+
+class MonthlyIncome(models.Model):
+    """
+    Per-user, per-month invoice totals for each serija.
+    Kept up to date by the Invoice signals in invoices/signals.py and
+    rebuilt with the rebuild_monthly_income management command.
+    """
+    user = models.ForeignKey(get_user_model(), on_delete=models.CASCADE, related_name='monthly_incomes')
+    year = models.PositiveSmallIntegerField()
+    month = models.PositiveSmallIntegerField()
+    serija = models.CharField(max_length=3, choices=Invoice.SERIJA_CHOICES)
+    invoice_count = models.PositiveIntegerField(default=0)
+    total_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'year', 'month', 'serija'], name='unique_monthly_income'),
+        ]
+
+    def __str__(self):
+        return f"{self.user} {self.year}-{self.month:02d} {self.serija}: {self.total_amount}"
+
+
+class InvoiceDraft(models.Model):
+    """
+    Invoice being filled in on the new invoice page, one per user.
+    Removed when the invoice is created; abandoned drafts are deleted by
+    the purge_invoice_drafts management command.
+    """
+    user = models.OneToOneField(get_user_model(), on_delete=models.CASCADE, related_name='invoice_draft')
+    serija = models.CharField(max_length=3, choices=Invoice.SERIJA_CHOICES, default='AA')
+    client = models.ForeignKey(Client, on_delete=models.SET_NULL, blank=True, null=True)
+    invoice_number = models.CharField(max_length=50, blank=True)
+    date = models.DateField(blank=True, null=True)
+    pay_until = models.DateField(blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    def __str__(self):
+        return f"Draft of {self.user} ({self.updated_at:%Y-%m-%d})"
+
+
+class DraftLineItem(models.Model):
+    draft = models.ForeignKey(InvoiceDraft, related_name='line_items', on_delete=models.CASCADE)
+    position = models.PositiveIntegerField()
+    service_name = models.CharField(max_length=255)
+    quantity = models.DecimalField(max_digits=10, decimal_places=2)
+    pcs_type = models.CharField(max_length=3, choices=LineItem.PCS_TYPE_CHOICES)
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+    total_amount = models.DecimalField(max_digits=10, decimal_places=2)
+
+    class Meta:
+        ordering = ['position', 'id']
+        indexes = [
+            models.Index(fields=['draft', 'position'], name='draft_line_position_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.service_name} ({self.quantity} {self.get_pcs_type_display()})"
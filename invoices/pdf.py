@@ -0,0 +1,224 @@
+"""
+Server-side PDF rendering of invoices with a content-addressed file cache.
+
+The PDF mirrors the invoice_preview.html layout and is drawn with fpdf2
+(pure Python). Rendered files are stored under
+settings.INVOICE_PDF_CACHE_DIR/<invoice id>/<fingerprint>.pdf, where the
+fingerprint hashes every value printed on the invoice. Any change to the
+invoice, its line items, the client or the seller's SelfInfo produces a
+new fingerprint, so an unchanged invoice is served straight from disk.
+"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import unicodedata
+from pathlib import Path
+
+from django.conf import settings
+from fpdf import FPDF
+from fpdf.enums import XPos, YPos
+from fpdf.fonts import FontFace
+
+from .utils import amount_to_words
+
+# Bump when the PDF layout changes so that cached files are re-rendered
+PDF_LAYOUT_VERSION = 2
+
+SELF_INFO_FIELDS = ['title', 'first_name', 'last_name', 'individual_code', 'address', 'phone', 'email', 'bank_account']
+CLIENT_FIELDS = ['company_name', 'company_code', 'pvm_code', 'address', 'first_name', 'last_name', 'phone']
+
+
+def get_cache_dir():
+    return Path(settings.INVOICE_PDF_CACHE_DIR)
+
+
+def invoice_document(invoice, line_items, client, self_info):
+    """Plain data of everything printed on the invoice."""
+    return {
+        'layout': PDF_LAYOUT_VERSION,
+        'invoice': {
+            'serija': invoice.serija,
+            'invoice_number': invoice.invoice_number,
+            'date': str(invoice.date),
+            'pay_until': str(invoice.pay_until),
+            'total_amount': str(invoice.total_amount),
+            # Part of the fingerprint, so a new amount_to_words() wording re-renders the file
+            'amount_in_words': amount_to_words(invoice.total_amount),
+        },
+        'line_items': [
+            {
+                'service_name': item.service_name,
+                'quantity': str(item.quantity),
+                'pcs_type': item.get_pcs_type_display(),
+                'price': str(item.price),
+                'total_amount': str(item.total_amount),
+            }
+            for item in line_items
+        ],
+        'client': {field: getattr(client, field) or '' for field in CLIENT_FIELDS},
+        'self_info': {field: (getattr(self_info, field) or '') if self_info else '' for field in SELF_INFO_FIELDS},
+    }
+
+
+def document_fingerprint(document):
+    payload = json.dumps(document, sort_keys=True, ensure_ascii=False).encode('utf-8')
+    return hashlib.sha256(payload).hexdigest()
+
+
+class InvoicePDF(FPDF):
+    """A4 invoice page using a Unicode TrueType font when one is configured."""
+
+    def __init__(self):
+        super().__init__(orientation='P', unit='mm', format='A4')
+        self.set_margins(15, 15, 15)
+        self.set_auto_page_break(auto=True, margin=15)
+        regular = getattr(settings, 'INVOICE_PDF_FONT', None)
+        bold = getattr(settings, 'INVOICE_PDF_FONT_BOLD', None) or regular
+        if regular and os.path.exists(regular) and os.path.exists(bold):
+            self.add_font('InvoiceFont', '', regular)
+            self.add_font('InvoiceFont', 'B', bold)
+            self.font_name = 'InvoiceFont'
+            self.unicode_font = True
+        else:
+            # Core fonts only cover Latin-1, Lithuanian letters lose their accents
+            self.font_name = 'helvetica'
+            self.unicode_font = False
+
+    def text_value(self, value):
+        text = '' if value is None else str(value)
+        if self.unicode_font:
+            return text
+        text = unicodedata.normalize('NFKD', text).replace('€', 'EUR')
+        return text.encode('latin-1', 'ignore').decode('latin-1')
+
+    def text_line(self, text, size=8, style='', align='L', width=0, height=4.5):
+        self.set_font(self.font_name, style, size)
+        self.cell(width, height, self.text_value(text), align=align, new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+
+
+def render_invoice_pdf(document):
+    """Draw the invoice described by invoice_document() and return the PDF bytes."""
+    invoice = document['invoice']
+    client = document['client']
+    seller = document['self_info']
+
+    pdf = InvoicePDF()
+    pdf.add_page()
+
+    # Header - centered title, series and number
+    pdf.text_line('SĄSKAITA FAKTŪRA', size=15, style='B', align='C', height=8)
+    pdf.text_line(f"Serija {invoice['serija']} Nr. {invoice['invoice_number'][2:]}", size=9, align='C', height=6)
+    pdf.ln(3)
+
+    # Date info - right aligned
+    pdf.text_line(f"Data: {invoice['date']}", style='B', align='R')
+    pdf.text_line(f"Apmokėti iki: {invoice['pay_until']}", style='B', align='R')
+    pdf.ln(6)
+
+    # Seller (left) and buyer (right) columns
+    top = pdf.get_y()
+    seller_lines = [
+        ('PARDAVĖJAS', 6, 'B'),
+        (seller['title'], 9, 'B'),
+        (f"Veiklos pažymos kodas: {seller['individual_code']}", 8, ''),
+        (seller['address'], 8, ''),
+        (f"{seller['first_name']} {seller['last_name']}", 8, ''),
+        (f"Tel. {seller['phone']}", 8, ''),
+        (f"El. paštas: {seller['email']}", 8, ''),
+        (f"A.s. Swedbank {seller['bank_account']}", 8, ''),
+    ]
+    buyer_lines = [
+        ('PIRKĖJAS', 6, 'B'),
+        (client['company_name'], 9, 'B'),
+        (f"Įmonės kodas: {client['company_code']}", 8, ''),
+    ]
+    if client['pvm_code']:
+        buyer_lines.append((f"PVM mokėtojo kodas: {client['pvm_code']}", 8, ''))
+    buyer_lines += [
+        (client['address'], 8, ''),
+        (f"{client['first_name']} {client['last_name']}", 8, ''),
+        (f"Tel. {client['phone']}", 8, ''),
+    ]
+    for text, size, style in seller_lines:
+        pdf.text_line(text, size=size, style=style, width=90)
+    seller_bottom = pdf.get_y()
+    pdf.set_y(top)
+    for text, size, style in buyer_lines:
+        pdf.set_x(105)
+        pdf.set_font(pdf.font_name, style, size)
+        pdf.cell(90, 4.5, pdf.text_value(text), align='R', new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+    pdf.set_y(max(seller_bottom, pdf.get_y()) + 6)
+
+    # Line items table
+    pdf.set_font(pdf.font_name, '', 7.5)
+    pdf.set_draw_color(209, 213, 219)
+    with pdf.table(
+        col_widths=(60, 10, 10, 10, 10),
+        text_align=('LEFT', 'CENTER', 'CENTER', 'RIGHT', 'RIGHT'),
+        borders_layout='HORIZONTAL_LINES',
+        headings_style=FontFace(emphasis='BOLD', fill_color=(243, 244, 246)),
+        line_height=5,
+    ) as table:
+        heading = table.row()
+        for title in ('Prekių, paslaugų pavadinimas', 'Kiekis', 'Mato vnt.', 'Kaina', 'Suma'):
+            heading.cell(pdf.text_value(title))
+        for item in document['line_items']:
+            row = table.row()
+            row.cell(pdf.text_value(item['service_name']))
+            row.cell(pdf.text_value(item['quantity']))
+            row.cell(pdf.text_value(item['pcs_type']))
+            row.cell(pdf.text_value(f"{item['price']} €"))
+            row.cell(pdf.text_value(f"{item['total_amount']} €"))
+    pdf.ln(4)
+
+    # Amount in words and total on the same line
+    amount_in_words = invoice['amount_in_words']
+    words = amount_in_words[:1].upper() + amount_in_words[1:]
+    top = pdf.get_y()
+    pdf.set_font(pdf.font_name, '', 7.5)
+    pdf.multi_cell(120, 4.5, pdf.text_value(f"Bendra suma žodžiais: {words}"), new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+    words_bottom = pdf.get_y()
+    pdf.set_xy(135, top)
+    pdf.set_font(pdf.font_name, 'B', 7.5)
+    pdf.cell(60, 4.5, pdf.text_value(f"Bendra suma: {invoice['total_amount']} €"), align='R', new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+    pdf.set_y(max(words_bottom, pdf.get_y()) + 6)
+
+    pdf.text_line(f"Išrašė {seller['first_name']} {seller['last_name']}", size=8)
+
+    return bytes(pdf.output())
+
+
+def get_invoice_pdf(invoice):
+    """
+    Path to the PDF of an invoice, rendering it only when no cached file
+    matches the current invoice data. Expects invoice.client and
+    invoice.user.self_info to be loaded (e.g. with select_related).
+    """
+    line_items = list(invoice.line_items.all())
+    self_info = getattr(invoice.user, 'self_info', None)
+    document = invoice_document(invoice, line_items, invoice.client, self_info)
+    fingerprint = document_fingerprint(document)
+
+    invoice_dir = get_cache_dir() / str(invoice.pk)
+    path = invoice_dir / f"{fingerprint}.pdf"
+    if path.exists():
+        return path
+
+    content = render_invoice_pdf(document)
+    invoice_dir.mkdir(parents=True, exist_ok=True)
+    # Write to a temporary file first so that readers never see a partial PDF
+    with tempfile.NamedTemporaryFile(dir=invoice_dir, suffix='.tmp', delete=False) as tmp:
+        tmp.write(content)
+    os.replace(tmp.name, path)
+
+    # Drop renders of earlier versions of this invoice
+    for stale in invoice_dir.glob('*.pdf'):
+        if stale != path:
+            stale.unlink(missing_ok=True)
+    return path
+
+
+def delete_invoice_pdfs(invoice_id):
+    shutil.rmtree(get_cache_dir() / str(invoice_id), ignore_errors=True)
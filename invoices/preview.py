@@ -0,0 +1,64 @@
+"""
+Invoice preview page: conditional GET and a cache of the rendered invoice.
+
+Invoice.updated_at changes whenever the invoice, its line items or the
+client change (see signals.py), SelfInfo.updated_at whenever the seller
+details change. The preview ETag is derived from both, so a repeat view
+is answered with 304 after a single indexed lookup, and the
+rendered invoice document is cached under the same ETag. Old fragments
+are never read again and simply expire.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from .models import Invoice
+from .utils import amount_to_words
+
+# Bump when components/invoice_document.html or the amount_to_words() wording
+# changes so cached fragments are re-rendered
+PREVIEW_LAYOUT_VERSION = 2
+
+
+def preview_etag(invoice_id, user_id, updated_at, seller_updated_at):
+    seller_stamp = seller_updated_at.isoformat() if seller_updated_at else ''
+    key = f"{PREVIEW_LAYOUT_VERSION}:{user_id}:{invoice_id}:{updated_at.isoformat()}:{seller_stamp}"
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()[:32]
+
+
+def render_invoice_document(invoice):
+    """HTML of the invoice document (seller, buyer, lines and totals)."""
+    return render_to_string('components/invoice_document.html', {
+        'invoice': invoice,
+        'client': invoice.client,
+        'line_items': invoice.line_items.all(),
+        'amount_in_words': amount_to_words(invoice.total_amount),
+    })
+
+
+def get_preview_document(invoice_id, etag):
+    """
+    Rendered invoice document, from the cache when the invoice is unchanged.
+
+    Args:
+        invoice_id: Invoice to render
+        etag: preview_etag() of the invoice's current state
+
+    Returns:
+        Safe HTML string
+    """
+    key = f"invoice_preview:{invoice_id}:{etag}"
+    html = cache.get(key)
+    if html is None:
+        invoice = (
+            Invoice.objects
+            .select_related('client', 'user__self_info')
+            .prefetch_related('line_items')
+            .get(id=invoice_id)
+        )
+        html = render_invoice_document(invoice)
+        cache.set(key, str(html), timeout=getattr(settings, 'INVOICE_PREVIEW_CACHE_TIMEOUT', 60 * 60 * 24 * 7))
+    return mark_safe(html)
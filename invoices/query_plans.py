@@ -0,0 +1,34 @@
+"""
+EXPLAIN QUERY PLAN checks of the hot per-user queries (SQLite only).
+
+Used by `manage.py check_query_plans` and by the test suite, so a lost
+index fails the tests instead of silently turning a lookup into a full
+table scan.
+"""
+from .models import Invoice, InvoiceSequence, MonthlyIncome
+from .utils import get_invoices_for_user_year
+
+
+def hot_queries(user_id, year):
+    """The per-user Invoice/MonthlyIncome lookups the app runs on every page load."""
+    return {
+        'invoices for user and year': get_invoices_for_user_year(user_id, year),
+        'invoice count for user and year': get_invoices_for_user_year(user_id, year).values('id'),
+        'user invoices newest first': Invoice.objects.filter(user_id=user_id).order_by('-date', '-id'),
+        'invoice number sequence': InvoiceSequence.objects.filter(user_id=user_id, serija='AA', year=year),
+        'monthly income for years': MonthlyIncome.objects.filter(user_id=user_id, year__in=[year - 1, year]),
+    }
+
+
+def query_plan(queryset):
+    """
+    Plan steps of a queryset and the ones that scan a whole table.
+
+    Returns:
+        (details, scans) lists of plan step descriptions
+    """
+    plan = queryset.explain()
+    # Plan rows look like "<id> <parent> <notused> SCAN invoices_invoice"
+    details = [line.split(' ', 3)[-1] for line in plan.splitlines() if line.strip()]
+    scans = [detail for detail in details if detail.startswith('SCAN ') and 'CONSTANT ROW' not in detail]
+    return details, scans
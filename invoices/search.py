@@ -0,0 +1,197 @@
+"""
+Full-text search over invoices.
+
+Each invoice is one search document made of its number, the client's
+company name, company code and PVM code, and the service names of its
+line items. The documents live in a backend-specific index created by
+migration 0012_invoice_search:
+
+- SQLite: the FTS5 virtual table invoices_invoice_fts (rowid = invoice id),
+  ranked with bm25(). The owner column holds "u<user_id>" so the user
+  filter is part of the MATCH and runs inside the index.
+- PostgreSQL: the table invoices_invoice_search with a weighted tsvector
+  and a GIN index, ranked with ts_rank().
+
+Other backends have no index and fall back to icontains lookups.
+
+Signals in signals.py keep the index in sync with Invoice, LineItem and
+Client changes. bulk_create does not send signals, so code that bulk
+creates invoices or line items calls index_invoices() itself.
+"""
+import re
+
+from django.db import connection
+from django.db.models import Q
+
+from .models import Invoice, LineItem
+
+SEARCH_PAGE_SIZE = 20
+INDEX_BATCH_SIZE = 500
+
+FTS_TABLE = 'invoices_invoice_fts'
+PG_TABLE = 'invoices_invoice_search'
+
+# bm25() weights of the owner, invoice_number, client and services columns
+FTS_WEIGHTS = (0.0, 10.0, 5.0, 1.0)
+
+TERM_PATTERN = re.compile(r'\w+')
+
+
+def search_backend():
+    """'sqlite', 'postgresql' or None when the database has no search index."""
+    return connection.vendor if connection.vendor in ('sqlite', 'postgresql') else None
+
+
+def search_terms(query):
+    """Words of a search query; everything else (quotes, operators) is dropped."""
+    return TERM_PATTERN.findall(query or '')[:10]
+
+
+def _chunks(values, size=INDEX_BATCH_SIZE):
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def _documents(invoice_ids):
+    """(invoice id, user id, invoice number, client text, services text) for each existing invoice."""
+    invoices = Invoice.objects.filter(id__in=invoice_ids).values_list(
+        'id', 'user_id', 'invoice_number', 'client__company_name', 'client__company_code', 'client__pvm_code'
+    )
+    services = {}
+    for invoice_id, service_name in LineItem.objects.filter(invoice_id__in=invoice_ids).values_list('invoice_id', 'service_name'):
+        services.setdefault(invoice_id, []).append(service_name)
+    return [
+        (invoice_id, user_id, number, ' '.join(filter(None, [name, code, pvm_code])), ' '.join(services.get(invoice_id, [])))
+        for invoice_id, user_id, number, name, code, pvm_code in invoices
+    ]
+
+
+def remove_invoices(invoice_ids):
+    """Drop invoices from the search index."""
+    backend = search_backend()
+    if backend is None:
+        return
+    table, column = (FTS_TABLE, 'rowid') if backend == 'sqlite' else (PG_TABLE, 'invoice_id')
+    with connection.cursor() as cursor:
+        for chunk in _chunks(invoice_ids):
+            placeholders = ', '.join(['%s'] * len(chunk))
+            cursor.execute(f"DELETE FROM {table} WHERE {column} IN ({placeholders})", chunk)
+
+
+def index_invoices(invoice_ids):
+    """
+    Write the search documents of invoices, replacing old ones. Ids of
+    invoices that no longer exist are removed from the index.
+
+    Args:
+        invoice_ids: Ids of the invoices to (re)index
+
+    Returns:
+        Number of invoices indexed
+    """
+    backend = search_backend()
+    if backend is None:
+        return 0
+    indexed = 0
+    with connection.cursor() as cursor:
+        for chunk in _chunks(invoice_ids):
+            documents = _documents(chunk)
+            remove_invoices(chunk)
+            if not documents:
+                continue
+            if backend == 'sqlite':
+                cursor.executemany(
+                    f"INSERT INTO {FTS_TABLE} (rowid, owner, invoice_number, client, services) VALUES (%s, %s, %s, %s, %s)",
+                    [(invoice_id, f'u{user_id}', number, client, services)
+                     for invoice_id, user_id, number, client, services in documents],
+                )
+            else:
+                cursor.executemany(
+                    f"INSERT INTO {PG_TABLE} (invoice_id, user_id, document) VALUES (%s, %s, "
+                    "setweight(to_tsvector('simple', %s), 'A') || "
+                    "setweight(to_tsvector('simple', %s), 'B') || "
+                    "setweight(to_tsvector('simple', %s), 'C'))",
+                    documents,
+                )
+            indexed += len(documents)
+    return indexed
+
+
+def rebuild_search_index(user_id=None):
+    """Reindex every invoice (of one user, if given). Returns the number of invoices indexed."""
+    invoices = Invoice.objects.order_by('id')
+    if user_id is not None:
+        invoices = invoices.filter(user_id=user_id)
+    backend = search_backend()
+    if backend is not None and user_id is None:
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {FTS_TABLE if backend == 'sqlite' else PG_TABLE}")
+    return index_invoices(invoices.values_list('id', flat=True).iterator())
+
+
+def _ranked_ids(user_id, terms, limit, offset):
+    """Invoice ids matching every term (as a prefix), best match first."""
+    backend = search_backend()
+    with connection.cursor() as cursor:
+        if backend == 'sqlite':
+            match = 'owner:"u%d" AND {invoice_number client services}: (%s)' % (
+                user_id, ' '.join(f'"{term}"*' for term in terms)
+            )
+            cursor.execute(
+                f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s "
+                f"ORDER BY bm25({FTS_TABLE}, {', '.join(map(str, FTS_WEIGHTS))}), rowid DESC LIMIT %s OFFSET %s",
+                [match, limit, offset],
+            )
+        else:
+            tsquery = ' & '.join(f"{term}:*" for term in terms)
+            cursor.execute(
+                f"SELECT invoice_id FROM {PG_TABLE}, to_tsquery('simple', %s) query "
+                "WHERE user_id = %s AND document @@ query "
+                "ORDER BY ts_rank(document, query) DESC, invoice_id DESC LIMIT %s OFFSET %s",
+                [tsquery, user_id, limit, offset],
+            )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def _fallback_ids(user_id, terms, limit, offset):
+    invoices = Invoice.objects.filter(user_id=user_id)
+    for term in terms:
+        invoices = invoices.filter(
+            Q(invoice_number__icontains=term)
+            | Q(client__company_name__icontains=term)
+            | Q(client__company_code__icontains=term)
+            | Q(client__pvm_code__icontains=term)
+            | Q(line_items__service_name__icontains=term)
+        )
+    return list(invoices.order_by('-date', '-id').values_list('id', flat=True).distinct()[offset:offset + limit])
+
+
+def search_invoices(user_id, query, page=1, page_size=SEARCH_PAGE_SIZE):
+    """
+    Ranked search over a user's invoices.
+
+    Args:
+        user_id: User whose invoices are searched
+        query: Search text; every word must match the start of a word in
+            the invoice number, client or line item services
+        page: 1-based page number
+        page_size: Results per page
+
+    Returns:
+        Tuple of (invoices of the page with their client, best match first,
+        whether there is a next page)
+    """
+    terms = search_terms(query)
+    if not terms:
+        return [], False
+    offset = (max(page, 1) - 1) * page_size
+    # One extra row tells whether there is a next page without a COUNT
+    if search_backend() is None:
+        ids = _fallback_ids(user_id, terms, page_size + 1, offset)
+    else:
+        ids = _ranked_ids(user_id, terms, page_size + 1, offset)
+    has_next = len(ids) > page_size
+    ids = ids[:page_size]
+    invoices = Invoice.objects.filter(id__in=ids, user_id=user_id).select_related('client').in_bulk()
+    return [invoices[invoice_id] for invoice_id in ids if invoice_id in invoices], has_next
@@ -0,0 +1,165 @@
+"""
+Model signal handlers for the invoices application.
+Keeps the MonthlyIncome rollup, the invoice number sequences and the
+search index in sync with Invoice changes, removes cached PDFs of deleted
+invoices, invalidates cached tax results and the client typeahead ETag,
+and touches Invoice.updated_at when a line item or the client of an
+invoice changes.
+"""
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Client, Invoice, LineItem, SelfInfo, TaxSettings
+from .pdf import delete_invoice_pdfs
+from .search import index_invoices, remove_invoices
+from .tax_cache import bump_client_version, bump_tax_version
+from .utils import adjust_monthly_income, advance_invoice_sequence, sequence_number
+
+
+def _rollup_state(invoice):
+    """Normalized (user_id, date, serija, total_amount) of an invoice instance."""
+    date = Invoice._meta.get_field('date').to_python(invoice.date)
+    return invoice.user_id, date, invoice.serija, Decimal(str(invoice.total_amount))
+
+
+@receiver(pre_save, sender=Invoice)
+def remember_previous_invoice_state(sender, instance, raw=False, **kwargs):
+    instance._rollup_previous = None
+    if raw or instance.pk is None:
+        return
+    previous = sender.objects.filter(pk=instance.pk).values('user_id', 'date', 'serija', 'total_amount').first()
+    if previous:
+        instance._rollup_previous = (previous['user_id'], previous['date'], previous['serija'], previous['total_amount'])
+
+
+@receiver(post_save, sender=Invoice)
+def update_monthly_income_on_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_rollup_previous', None)
+    current = _rollup_state(instance)
+    if previous == current:
+        return
+    with transaction.atomic():
+        if previous:
+            user_id, date, serija, amount = previous
+            adjust_monthly_income(user_id, date, serija, -1, -amount)
+        user_id, date, serija, amount = current
+        adjust_monthly_income(user_id, date, serija, 1, amount)
+
+
+# Invoice fields that decide which sequence number an invoice takes
+SEQUENCE_FIELDS = {'user', 'serija', 'date', 'invoice_number'}
+
+
+@receiver(post_save, sender=Invoice)
+def advance_sequence_on_save(sender, instance, raw=False, update_fields=None, **kwargs):
+    # Typed numbers (and admin edits) move the series past them, so that
+    # allocate_invoice_numbers() never issues the same number again
+    if raw or (update_fields and not SEQUENCE_FIELDS & set(update_fields)):
+        return
+    number = sequence_number(instance.invoice_number)
+    if number is not None:
+        user_id, date, serija, _ = _rollup_state(instance)
+        advance_invoice_sequence(user_id, serija, date.year, number)
+
+
+@receiver(post_delete, sender=Invoice)
+def update_monthly_income_on_delete(sender, instance, **kwargs):
+    user_id, date, serija, amount = _rollup_state(instance)
+    adjust_monthly_income(user_id, date, serija, -1, -amount)
+
+
+@receiver(post_delete, sender=Invoice)
+def delete_cached_invoice_pdfs(sender, instance, **kwargs):
+    invoice_id = instance.pk
+    transaction.on_commit(lambda: delete_invoice_pdfs(invoice_id))
+
+
+@receiver(post_save, sender=Invoice)
+@receiver(post_delete, sender=Invoice)
+@receiver(post_save, sender=SelfInfo)
+@receiver(post_delete, sender=SelfInfo)
+@receiver(post_save, sender=TaxSettings)
+@receiver(post_delete, sender=TaxSettings)
+def invalidate_cached_taxes(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    bump_tax_version(instance.user_id)
+    previous = getattr(instance, '_rollup_previous', None)
+    if previous and previous[0] != instance.user_id:
+        # Invoice moved to another user
+        bump_tax_version(previous[0])
+
+
+@receiver(post_save, sender=Client)
+@receiver(post_delete, sender=Client)
+def invalidate_client_search(sender, instance, raw=False, **kwargs):
+    # The client version is the ETag of the client typeahead
+    if raw or instance.user_id is None:
+        return
+    bump_client_version(instance.user_id)
+
+
+# Invoice fields that go into the search document
+SEARCH_FIELDS = {'user', 'client', 'invoice_number'}
+
+
+@receiver(post_save, sender=Invoice)
+def index_invoice_on_save(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw or (update_fields and not SEARCH_FIELDS & set(update_fields)):
+        return
+    index_invoices([instance.pk])
+
+
+@receiver(post_delete, sender=Invoice)
+def remove_invoice_from_index(sender, instance, **kwargs):
+    remove_invoices([instance.pk])
+
+
+def _deleted_with_invoice(origin):
+    """
+    True when a post_delete comes from deleting the line item's invoice (or
+    its client or user): the invoice is gone, so there is nothing to reindex
+    or touch, and doing it per line would cost queries per line.
+    """
+    return origin is not None and getattr(origin, 'model', type(origin)) is not LineItem
+
+
+@receiver(post_save, sender=LineItem)
+@receiver(post_delete, sender=LineItem)
+def index_line_item_invoice(sender, instance, raw=False, origin=None, **kwargs):
+    if raw or _deleted_with_invoice(origin):
+        return
+    index_invoices([instance.invoice_id])
+
+
+@receiver(post_save, sender=Client)
+def index_client_invoices(sender, instance, created, raw=False, **kwargs):
+    if raw or created:
+        return
+    index_invoices(Invoice.objects.filter(client=instance).values_list('id', flat=True))
+
+
+# Invoice.updated_at drives the preview ETag (see preview.py); line items
+# and the client are printed on the invoice too. The seller's SelfInfo has
+# its own updated_at in the ETag, so its changes touch no invoice rows
+
+@receiver(post_save, sender=LineItem)
+@receiver(post_delete, sender=LineItem)
+def touch_line_item_invoice(sender, instance, raw=False, origin=None, **kwargs):
+    if raw or _deleted_with_invoice(origin):
+        return
+    Invoice.objects.filter(pk=instance.invoice_id).update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=Client)
+def touch_client_invoices(sender, instance, created, raw=False, **kwargs):
+    if raw or created:
+        return
+    Invoice.objects.filter(client=instance).update(updated_at=timezone.now())
+
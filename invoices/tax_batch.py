@@ -0,0 +1,232 @@
+"""
+Batch version of utils.calculate_taxes() for many incomes at once.
+
+All money values are converted to integer cents and every
+Decimal.quantize(..., ROUND_HALF_UP) of the scalar function is replaced by
+an exact integer division that rounds half away from zero. Inputs are
+rounded half up to cents first, as calculate_taxes() does, so results
+match it to the cent.
+
+The whole batch is computed with NumPy array operations.
+"""
+import datetime
+from decimal import Decimal, ROUND_HALF_UP
+
+import numpy as np
+
+from .tax_rules import get_tax_rules
+
+# Fields holding integer cents in the batch result
+MONEY_FIELDS = [
+    'income', 'expenses', 'profit', 'vsdi_base', 'psdi_base', 'vsdi', 'psdi',
+    'gpm_base', 'gpm_taxable', 'gpm', 'total_taxes', 'total_taxes_to_deduct', 'net_income',
+]
+PERCENT_FIELDS = ['gpm_percent', 'vsdi_percent', 'psdi_percent', 'total_percent']
+
+
+def to_cents(amount):
+    """Convert an amount in euros (number, string or Decimal) to integer cents."""
+    return int((Decimal(str(amount)) * 100).quantize(Decimal('1'), rounding=ROUND_HALF_UP))
+
+
+def _cents_constant(amount):
+    return int(amount * 100)
+
+
+
+def _round_div(numerator, denominator):
+    """numerator / denominator rounded to an integer, halves away from zero (ROUND_HALF_UP)."""
+    magnitude = (2 * np.abs(numerator) + denominator) // (2 * denominator)
+    return np.where(numerator < 0, -magnitude, magnitude)
+
+
+def _mul_rate(cents, rate):
+    """cents * rate rounded to a cent. rate is an exact Decimal."""
+    numerator, denominator = rate.as_integer_ratio()
+    return _round_div(cents * numerator, denominator)
+
+
+def _percent(part, income):
+    """
+    part / income * 100 rounded to two decimals, as calculate_taxes() does
+    with the default decimal context (ROUND_HALF_EVEN), 0 for income <= 0.
+    Returned in hundredths of a percent.
+    """
+    positive = income > 0
+    safe_income = np.where(positive, income, 1)
+    numerator = np.abs(part) * 10000
+    quotient, remainder = numerator // safe_income, numerator % safe_income
+    round_up = (2 * remainder > safe_income) | ((2 * remainder == safe_income) & (quotient % 2 == 1))
+    quotient = quotient + np.where(round_up, 1, 0)
+    return np.where(positive, np.where(part < 0, -quotient, quotient), 0)
+
+
+def _compute(rules, income, actual_expenses, use_30_percent_rule, vsdi_exempt, psd_self_paid):
+    """The calculate_taxes() formulas in integer cents, on int64/bool arrays."""
+    mma = _cents_constant(rules.mma)
+    min_psd_annual = _cents_constant(rules.min_psd_annual)
+
+    expenses = np.where(use_30_percent_rule, _mul_rate(income, rules.expense_rate), actual_expenses)
+    profit = income - expenses
+    # VSDI and PSDI base = 50% of profit
+    contribution_base = _round_div(profit, 2)
+    vsdi = np.where(vsdi_exempt, 0, _mul_rate(contribution_base, rules.vsdi_rate))
+
+    monthly_income = _round_div(income, 12)
+    monthly_psdi = _mul_rate(_round_div(contribution_base, 12), rules.psdi_rate)
+    psdi = np.where(
+        monthly_income <= mma,
+        min_psd_annual,
+        np.where(psd_self_paid, monthly_psdi * 12, _mul_rate(contribution_base, rules.psdi_rate)),
+    )
+
+    # Self-paid PSD is not deducted from the GPM base
+    gpm_base = profit - vsdi - np.where(psd_self_paid, 0, psdi)
+    gpm_taxable = np.minimum(gpm_base, _cents_constant(rules.gpm_limit))
+    gpm = _mul_rate(gpm_taxable, rules.gpm_rate)
+
+    total_taxes = vsdi + psdi + gpm
+    total_taxes_to_deduct = np.where(psd_self_paid, vsdi + gpm, total_taxes)
+
+    return {
+        'income': income,
+        'expenses': expenses,
+        'profit': profit,
+        'vsdi_base': contribution_base,
+        'psdi_base': contribution_base,
+        'vsdi': vsdi,
+        'psdi': psdi,
+        'psdi_is_self_paid': psd_self_paid,
+        'monthly_income': monthly_income,
+        'monthly_psdi': monthly_psdi,
+        'psdi_minimal': monthly_income <= mma,
+        'gpm_base': gpm_base,
+        'gpm_taxable': gpm_taxable,
+        'gpm': gpm,
+        'total_taxes': total_taxes,
+        'total_taxes_to_deduct': total_taxes_to_deduct,
+        'net_income': income - expenses - total_taxes_to_deduct,
+        'vsdi_exempt': vsdi_exempt,
+        'income_below_mma': income <= mma,
+        'gpm_percent': _percent(gpm, income),
+        'vsdi_percent': _percent(vsdi, income),
+        'psdi_percent': _percent(psdi, income),
+        'total_percent': _percent(total_taxes, income),
+    }
+
+
+def _months_since(start, current_date):
+    return (current_date.year - start.year) * 12 + (current_date.month - start.month)
+
+
+def _as_list(value, size):
+    if isinstance(value, (list, tuple, np.ndarray)):
+        if len(value) != size:
+            raise ValueError(f"expected {size} values, got {len(value)}")
+        return list(value)
+    return [value] * size
+
+
+def calculate_taxes_batch(incomes, expenses=None, use_30_percent_rule=True, activity_start_dates=None,
+                          current_date=None, psd_self_paid=True, rules=None):
+    """
+    Calculate taxes for many incomes in one call.
+
+    Every argument except incomes and current_date may be a single value
+    applied to all rows or a sequence with one value per income.
+
+    Args:
+        incomes: Sequence of total incomes in euros
+        expenses: Actual expenses per income (used where the 30% rule is off)
+        use_30_percent_rule: If True, use 30% expense rule
+        activity_start_dates: Activity start date per income (None = no VSDI exemption)
+        current_date: Current calculation date (defaults to today)
+        psd_self_paid: If True, PSD is paid monthly by the user and not deducted
+        rules: TaxRules of the tax year, or one TaxRules per income (defaults
+            to the year of current_date)
+
+    Returns:
+        Dictionary of calculate_taxes() fields, one value per income, plus
+        the list of TaxRules per income under 'rules'. Money fields are integer cents,
+        *_percent fields are hundredths of a percent. Values are NumPy
+        int64/bool arrays. Use batch_result_row() to get one row in the
+        calculate_taxes() format.
+    """
+    if current_date is None:
+        current_date = datetime.date.today()
+    if rules is None:
+        rules = get_tax_rules(current_date.year)
+
+    income = [to_cents(value) for value in incomes]
+    size = len(income)
+    rules_per_row = _as_list(rules, size)
+    actual_expenses = [to_cents(value) if value else 0 for value in _as_list(expenses, size)]
+    use_30 = [bool(value) for value in _as_list(use_30_percent_rule, size)]
+    self_paid = [bool(value) for value in _as_list(psd_self_paid, size)]
+    vsdi_exempt = [
+        bool(start) and _months_since(start, current_date) < 12
+        for start in _as_list(activity_start_dates, size)
+    ]
+
+    columns = (
+        np.array(income, dtype=np.int64),
+        np.array(actual_expenses, dtype=np.int64),
+        np.array(use_30, dtype=bool),
+        np.array(vsdi_exempt, dtype=bool),
+        np.array(self_paid, dtype=bool),
+    )
+    distinct_rules = list(dict.fromkeys(rules_per_row))
+    if len(distinct_rules) <= 1:
+        result = _compute(distinct_rules[0] if distinct_rules else rules, *columns)
+    else:
+        # One vectorized pass per tax year, scattered back into row order
+        positions = {row_rules: index for index, row_rules in enumerate(distinct_rules)}
+        group = np.array([positions[row_rules] for row_rules in rules_per_row])
+        result = {}
+        for index, group_rules in enumerate(distinct_rules):
+            mask = group == index
+            part = _compute(group_rules, *(column[mask] for column in columns))
+            for field, values in part.items():
+                if field not in result:
+                    result[field] = np.empty(size, dtype=values.dtype)
+                result[field][mask] = values
+    result['rules'] = rules_per_row
+    return result
+
+
+def _euros(cents):
+    return (Decimal(int(cents)) / 100).quantize(Decimal('0.01'))
+
+
+def batch_result_row(result, index):
+    """One row of a calculate_taxes_batch() result in the calculate_taxes() format."""
+    rules = result['rules'][index]
+    row = {field: _euros(result[field][index]) for field in MONEY_FIELDS}
+    income_positive = row['income'] > 0
+    for field in PERCENT_FIELDS:
+        row[field] = int(result[field][index]) / 100 if income_positive else 0
+
+    monthly_income = _euros(result['monthly_income'][index])
+    self_paid = bool(result['psdi_is_self_paid'][index])
+    minimal = bool(result['psdi_minimal'][index])
+    if self_paid and minimal:
+        psdi_note = f"Minimalus savaimokestis {rules.min_psd_monthly}€/mėn × 12 mėn (vid. pajamos {monthly_income}€/mėn ≤ MMA)"
+    elif self_paid:
+        monthly_psdi = _euros(result['monthly_psdi'][index])
+        psdi_note = f"Savaimokestis {monthly_psdi}€/mėn × 12 mėn (vid. pajamos {monthly_income}€/mėn > MMA)"
+    elif minimal:
+        psdi_note = f"Minimalus PSD {rules.min_psd_monthly}€/mėn × 12 mėn"
+    else:
+        psdi_note = "Standartinis metinis skaičiavimas"
+
+    row.update({
+        'psdi_is_self_paid': self_paid,
+        'psdi_note': psdi_note,
+        'vsdi_exempt': bool(result['vsdi_exempt'][index]),
+        'income_vs_mma': 'below' if result['income_below_mma'][index] else 'above',
+        'tax_year': rules.year,
+        'mma': float(rules.mma),
+        'mma_2025': float(rules.mma),
+        'min_psd_monthly': float(rules.min_psd_monthly),
+    })
+    return row
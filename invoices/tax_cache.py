@@ -0,0 +1,101 @@
+"""
+Cache of per-user tax calculations in Django's cache framework.
+
+Every cache key contains a version stamp of the user. Signals bump the
+stamp when the user's invoices, SelfInfo or TaxSettings change (see
+signals.py), so old entries are never read again and simply expire. The
+stamp is a CacheVersion row rather than a cache entry, so all processes
+agree on it even with a per-process cache backend. The client typeahead
+has a stamp of its own, bumped only by client changes. Hits, misses and
+invalidations are counted in the cache (see CACHES in settings.py) and
+can be read with get_tax_cache_stats().
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+
+from .models import CacheVersion
+
+STAT_NAMES = ['hits', 'misses', 'invalidations']
+
+_MISSING = object()
+
+
+def _count(name):
+    key = f"taxes:stats:{name}"
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Counter not in the cache yet (or evicted)
+        if not cache.add(key, 1, timeout=None):
+            cache.incr(key)
+
+
+def get_cache_version(user_id, name):
+    """Current version stamp of the user's cached results of one kind."""
+    version = CacheVersion.objects.filter(user_id=user_id, name=name).values_list('version', flat=True).first()
+    if version is None:
+        # A new stamp starts from the clock, so a recreated stamp never
+        # brings back entries stored under an earlier version
+        version = CacheVersion.objects.get_or_create(user_id=user_id, name=name, defaults={'version': time.time_ns()})[0].version
+    return version
+
+
+def bump_cache_version(user_id, name, on_bump=None):
+    """Invalidate the user's cached results of one kind once the current transaction commits."""
+    def bump():
+        CacheVersion.objects.filter(user_id=user_id, name=name).update(version=F('version') + 1)
+        if on_bump:
+            on_bump()
+
+    transaction.on_commit(bump)
+
+
+def get_tax_version(user_id):
+    return get_cache_version(user_id, 'taxes')
+
+
+def bump_tax_version(user_id):
+    """Invalidate all cached tax results of a user once the current transaction commits."""
+    bump_cache_version(user_id, 'taxes', on_bump=lambda: _count('invalidations'))
+
+
+def get_client_version(user_id):
+    return get_cache_version(user_id, 'clients')
+
+
+def bump_client_version(user_id):
+    """Change the client typeahead ETag of a user once the current transaction commits."""
+    bump_cache_version(user_id, 'clients')
+
+
+def cached_for_user(user_id, name, key_parts, compute):
+    """
+    Return compute() for the user, cached under name and key_parts until the
+    user's tax version changes.
+
+    Args:
+        user_id: Owner of the data the result depends on
+        name: Kind of result (e.g. 'dashboard')
+        key_parts: Tuple of every other input the result depends on
+        compute: Function without arguments that calculates the result
+    """
+    digest = hashlib.sha256(repr(key_parts).encode('utf-8')).hexdigest()
+    key = f"taxes:{user_id}:{get_tax_version(user_id)}:{name}:{digest}"
+    result = cache.get(key, _MISSING)
+    if result is not _MISSING:
+        _count('hits')
+        return result
+    _count('misses')
+    result = compute()
+    cache.set(key, result, timeout=getattr(settings, 'TAX_CACHE_TIMEOUT', 60 * 60 * 24))
+    return result
+
+
+def get_tax_cache_stats():
+    values = cache.get_many([f"taxes:stats:{name}" for name in STAT_NAMES])
+    return {name: values.get(f"taxes:stats:{name}", 0) for name in STAT_NAMES}
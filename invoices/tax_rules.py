@@ -0,0 +1,64 @@
+"""
+Lithuanian self-employment tax rules per year.
+
+The rates and limits live in tax_rules.json next to this module. The file
+is read once at import time into frozen TaxRules objects, and the tax
+functions in utils.py and tax_batch.py take one of them as `rules`
+instead of building Decimal constants on every call.
+"""
+import datetime
+import json
+from dataclasses import dataclass, field
+from decimal import Decimal
+from pathlib import Path
+
+TAX_RULES_FILE = Path(__file__).resolve().parent / 'tax_rules.json'
+
+RULE_FIELDS = ['vsdi_rate', 'psdi_rate', 'gpm_rate', 'gpm_limit', 'expense_rate', 'mma', 'min_psd_monthly']
+
+
+@dataclass(frozen=True)
+class TaxRules:
+    year: int
+    vsdi_rate: Decimal        # VSDI rate on the contribution base
+    psdi_rate: Decimal        # PSDI rate on the contribution base
+    gpm_rate: Decimal         # GPM rate
+    gpm_limit: Decimal        # Only profit up to this amount is taxed at gpm_rate
+    expense_rate: Decimal     # Deemed expenses under the 30% rule
+    mma: Decimal              # Minimal monthly salary
+    min_psd_monthly: Decimal  # Minimal PSD per month if income <= MMA
+    min_psd_annual: Decimal = field(init=False)
+
+    def __post_init__(self):
+        object.__setattr__(self, 'min_psd_annual', self.min_psd_monthly * 12)
+
+    def as_json(self):
+        """Rule values as exact decimal strings, for static/js/tax_calculator.js."""
+        return {'year': self.year, **{name: str(getattr(self, name)) for name in RULE_FIELDS}}
+
+
+def load_tax_rules(path=TAX_RULES_FILE):
+    """Read a rule file into {year: TaxRules}."""
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+    return {
+        int(year): TaxRules(year=int(year), **{name: Decimal(value) for name, value in values.items()})
+        for year, values in data.items()
+    }
+
+
+TAX_RULES = load_tax_rules()
+
+
+def get_tax_rules(year=None):
+    """
+    Rules for a year (defaults to the current year). Years outside the
+    table use the nearest year that has rules.
+    """
+    if year is None:
+        year = datetime.date.today().year
+    year = int(year)
+    if year in TAX_RULES:
+        return TAX_RULES[year]
+    known = [known_year for known_year in TAX_RULES if known_year <= year]
+    return TAX_RULES[max(known) if known else min(TAX_RULES)]
@@ -1,3 +1,603 @@
-from django.test import TestCase
+import datetime
+import io
+import json
+import random
+import shutil
+import tempfile
+import unittest
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import IntegrityError, connection, transaction
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.test.utils import CaptureQueriesContext
+
+from invoices.bulk import _archive_names
+from invoices.drafts import add_draft_line, create_invoice_from_draft, get_draft
+from invoices.imports import import_invoices
+from invoices.management.commands.benchmark_invoice_numbers import allocate_concurrently
+from invoices.management.commands.check_tax_js_parity import parity_differences, random_cases, run_js_calculator
+from invoices.pdf import get_invoice_pdf
+from invoices.preview import PREVIEW_LAYOUT_VERSION
+from invoices.models import Client, Invoice, InvoiceDraft, InvoiceSequence, LineItem, MonthlyIncome, SelfInfo, TaxSettings
+from invoices.query_plans import hot_queries, query_plan
+from invoices.search import FTS_TABLE, index_invoices, search_backend
+from invoices.tax_batch import batch_result_row, calculate_taxes_batch
+from invoices.tax_cache import cached_for_user, get_client_version, get_tax_cache_stats, get_tax_version
+from invoices.tax_rules import TAX_RULES
+from invoices.utils import _highest_issued_number, allocate_invoice_numbers, calculate_taxes, find_monthly_income_drift
+
+User = get_user_model()
+
+
+def create_client(user, company_name='UAB Testas', company_code='100'):
+    return Client.objects.create(
+        user=user, company_name=company_name, company_code=company_code,
+        address='Vilnius', first_name='Jonas', last_name='Jonaitis', phone='+370',
+    )
+
+
+def create_invoice(user, client, invoice_number, date=datetime.date(2025, 3, 5), **fields):
+    return Invoice.objects.create(
+        user=user, client=client, invoice_number=invoice_number, date=date,
+        pay_until=date + datetime.timedelta(days=14), total_amount=fields.pop('total_amount', Decimal('100.00')), **fields
+    )
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', "Query plans are checked on SQLite only")
+class QueryPlanTests(TestCase):
+    def test_hot_queries_use_an_index(self):
+        for name, queryset in hot_queries(user_id=1, year=datetime.date.today().year).items():
+            with self.subTest(name):
+                details, scans = query_plan(queryset)
+                self.assertEqual(scans, [], f"Full table scan in {name}: {details}")
+
+
+class InvoiceNumberTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('jonas', password='slaptas')
+        self.client_obj = create_client(self.user)
+
+    def test_allocates_consecutive_numbers(self):
+        self.assertEqual(allocate_invoice_numbers(self.user.id, 'AA', 2025), ['00000001'])
+        self.assertEqual(allocate_invoice_numbers(self.user.id, 'AA', 2025, count=2), ['00000002', '00000003'])
+        self.assertEqual(allocate_invoice_numbers(self.user.id, 'VSP', 2025), ['00000001'])
+
+    def test_typed_number_advances_sequence(self):
+        allocate_invoice_numbers(self.user.id, 'AA', 2025)
+        create_invoice(self.user, self.client_obj, '00000050')
+        create_invoice(self.user, self.client_obj, 'KITAS-7')
+        self.assertEqual(allocate_invoice_numbers(self.user.id, 'AA', 2025), ['00000051'])
+
+    def test_new_sequence_is_seeded_with_one_query(self):
+        Invoice.objects.bulk_create([
+            Invoice(user=self.user, client=self.client_obj, invoice_number=number, date=datetime.date(2025, 1, 1),
+                    pay_until=datetime.date(2025, 1, 15), total_amount=1)
+            for number in ('00000007', '12', 'INV-2025-900')
+        ])
+        with self.assertNumQueries(1):
+            self.assertEqual(_highest_issued_number(self.user.id, 'AA', 2025), 12)
+        self.assertEqual(allocate_invoice_numbers(self.user.id, 'AA', 2025), ['00000013'])
+
+    def test_typed_duplicate_is_rejected(self):
+        create_invoice(self.user, self.client_obj, '00000005')
+        self.client.login(username='jonas', password='slaptas')
+        self.client.get('/new-invoice/')
+        self.client.post('/new-invoice/lines/', {
+            'new_service_name': 'Darbas', 'new_quantity': '1', 'new_pcs_type': 'vnt', 'new_price': '10',
+        })
+        response = self.client.post('/new-invoice/', {
+            'create_invoice': '1', 'client': self.client_obj.id, 'serija': 'AA', 'invoice_number': '00000005',
+            'suggested_invoice_number': '00000006', 'date': '2025-03-05', 'pay_until': '2025-03-19',
+        }, follow=True)
+        self.assertContains(response, 'jau išrašyta')
+        self.assertEqual(Invoice.objects.filter(invoice_number='00000005').count(), 1)
+
+    def test_typed_number_is_unique_per_year(self):
+        # Sequences restart every year, so 00000001 of 2025 does not block 00000001 of 2026
+        create_invoice(self.user, self.client_obj, '00000001', date=datetime.date(2025, 12, 30))
+        self.client.login(username='jonas', password='slaptas')
+        self.client.post('/new-invoice/lines/', {
+            'new_service_name': 'Darbas', 'new_quantity': '1', 'new_pcs_type': 'vnt', 'new_price': '10',
+            'date': '2026-01-02',
+        })
+        self.assertEqual(self.client.get('/new-invoice/').context['suggested_invoice_number'], '00000001')
+        self.client.post('/new-invoice/', {
+            'create_invoice': '1', 'client': self.client_obj.id, 'serija': 'AA', 'invoice_number': '00000001',
+            'suggested_invoice_number': '', 'date': '2026-01-02', 'pay_until': '2026-01-16',
+        })
+        self.assertEqual(
+            sorted(Invoice.objects.filter(invoice_number='00000001').values_list('date__year', flat=True)), [2025, 2026],
+        )
+        self.assertEqual(InvoiceSequence.objects.get(user=self.user, serija='AA', year=2026).last_number, 1)
+
+
+class CreateInvoiceTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('jonas', password='slaptas')
+        self.client_obj = create_client(self.user)
+        self.client.login(username='jonas', password='slaptas')
+
+    def post_create(self, **data):
+        data = {
+            'create_invoice': '1', 'client': self.client_obj.id, 'serija': 'AA', 'invoice_number': '00000001',
+            'suggested_invoice_number': '00000001', 'date': '2025-03-05', 'pay_until': '2025-03-19', **data,
+        }
+        return self.client.post('/new-invoice/', data, follow=True)
+
+    def create_with_lines(self, line_count, number):
+        draft = get_draft(self.user.id)
+        for index in range(line_count):
+            add_draft_line(draft, f'Eilutė {index}', Decimal('1.5'), 'val', Decimal('10.005'))
+        with CaptureQueriesContext(connection) as queries:
+            invoice = create_invoice_from_draft(draft, self.client_obj.id, 'AA', number, datetime.date(2025, 3, 5), datetime.date(2025, 3, 19))
+        return invoice, len(queries.captured_queries)
+
+    def test_query_count_does_not_grow_with_lines(self):
+        self.create_with_lines(1, '00000001')  # Creates the sequence and rollup rows
+        _, one_line = self.create_with_lines(1, '00000002')
+        invoice, many_lines = self.create_with_lines(60, '00000003')
+        self.assertEqual(one_line, many_lines)
+        self.assertEqual(invoice.line_items.count(), 60)
+        self.assertEqual(invoice.total_amount, Decimal('15.02') * 60)
+
+    def test_database_error_keeps_draft_and_shows_message(self):
+        add_draft_line(get_draft(self.user.id), 'Darbas', Decimal('1'), 'vnt', Decimal('10'))
+        with mock.patch('invoices.views.create_invoice_from_draft', side_effect=IntegrityError('boom')), \
+                self.assertLogs('invoices.views', 'ERROR'):
+            response = self.post_create()
+        self.assertContains(response, 'nepavyko')
+        self.assertFalse(Invoice.objects.exists())
+        self.assertEqual(get_draft(self.user.id).line_items.count(), 1)
+
+    def test_incomplete_form_shows_message(self):
+        response = self.post_create(date='')
+        self.assertContains(response, 'bent vieną eilutę')
+        self.assertFalse(Invoice.objects.exists())
+
+    def test_create_allocates_suggested_number(self):
+        add_draft_line(get_draft(self.user.id), 'Darbas', Decimal('1'), 'vnt', Decimal('10'))
+        self.post_create()
+        invoice = Invoice.objects.get()
+        self.assertEqual((invoice.invoice_number, invoice.total_amount), ('00000001', Decimal('10.00')))
+        self.assertFalse(InvoiceDraft.objects.filter(user=self.user).exists())
+
+
+class DraftLineFallbackTests(TestCase):
+    """Draft lines can be edited and removed without JavaScript, by posting the whole invoice form."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('juodrastis')
+        self.client.force_login(self.user)
+        self.draft = get_draft(self.user.id)
+        self.line = add_draft_line(self.draft, 'Konsultacija', Decimal('2'), 'val', Decimal('30'))
+
+    def form_data(self, **data):
+        line = self.line.id
+        return {
+            'serija': 'VSP', 'invoice_number': '', 'date': '2025-03-05', 'pay_until': '2025-03-19',
+            f'line_{line}_service_name': 'Konsultacija', f'line_{line}_quantity': '2',
+            f'line_{line}_pcs_type': 'val', f'line_{line}_price': '30', **data,
+        }
+
+    def test_form_has_line_buttons_without_javascript(self):
+        response = self.client.get(reverse('new_invoice'))
+        self.assertContains(response, f'formaction="{reverse("update_draft_line", args=[self.line.id])}"')
+        self.assertContains(response, f'formaction="{reverse("remove_draft_line", args=[self.line.id])}"')
+
+    def test_update_redirects_to_form(self):
+        response = self.client.post(
+            reverse('update_draft_line', args=[self.line.id]), self.form_data(**{f'line_{self.line.id}_quantity': '3'}),
+        )
+        self.assertRedirects(response, reverse('new_invoice'))
+        self.line.refresh_from_db()
+        self.assertEqual(self.line.total_amount, Decimal('90.00'))
+        self.draft.refresh_from_db()
+        self.assertEqual(self.draft.serija, 'VSP')
+
+    def test_invalid_update_shows_message(self):
+        response = self.client.post(
+            reverse('update_draft_line', args=[self.line.id]), self.form_data(**{f'line_{self.line.id}_price': 'x'}), follow=True,
+        )
+        self.assertEqual([str(message) for message in response.context['messages']], ['Neteisinga kaina'])
+        self.line.refresh_from_db()
+        self.assertEqual(self.line.price, Decimal('30.00'))
+
+    def test_remove_redirects_to_form(self):
+        response = self.client.post(reverse('remove_draft_line', args=[self.line.id]), self.form_data())
+        self.assertRedirects(response, reverse('new_invoice'))
+        self.assertFalse(self.draft.line_items.exists())
+
+    def test_ajax_requests_still_get_json(self):
+        response = self.client.post(
+            reverse('update_draft_line', args=[self.line.id]), {'quantity': '3'}, headers={'x-requested-with': 'XMLHttpRequest'},
+        )
+        self.assertEqual(response.json()['line']['total_amount'], '90.00')
+
+
+class MonthlyIncomeRollupTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('rollup')
+        self.client_obj = create_client(self.user)
+
+    def rollup(self):
+        return {
+            (row.year, row.month, row.serija): (row.invoice_count, row.total_amount)
+            for row in MonthlyIncome.objects.filter(user=self.user)
+            if row.invoice_count
+        }
+
+    def test_rollup_follows_updates_and_deletes(self):
+        march = create_invoice(self.user, self.client_obj, '1', total_amount=Decimal('100.00'))
+        create_invoice(self.user, self.client_obj, '2', total_amount=Decimal('50.50'))
+        moved = create_invoice(self.user, self.client_obj, '3', total_amount=Decimal('20.00'))
+
+        march.total_amount = Decimal('80.00')
+        march.save()
+        moved.date = datetime.date(2025, 4, 1)
+        moved.serija = 'VSP'
+        moved.save()
+        self.assertEqual(self.rollup(), {
+            (2025, 3, 'AA'): (2, Decimal('130.50')),
+            (2025, 4, 'VSP'): (1, Decimal('20.00')),
+        })
+
+        march.delete()
+        Invoice.objects.get(pk=moved.pk).delete()
+        self.assertEqual(self.rollup(), {(2025, 3, 'AA'): (1, Decimal('50.50'))})
+        self.assertEqual(find_monthly_income_drift(self.user.id), [])
+
+
+class LineItemSignalTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('eilutes')
+        self.client_obj = create_client(self.user)
+
+    def invoice_with_lines(self, invoice_number, count):
+        invoice = create_invoice(self.user, self.client_obj, invoice_number)
+        LineItem.objects.bulk_create([
+            LineItem(invoice=invoice, service_name=f"Paslauga {n}", quantity=1, price=10, total_amount=10)
+            for n in range(count)
+        ])
+        return invoice
+
+    def delete_queries(self, invoice):
+        with CaptureQueriesContext(connection) as queries:
+            invoice.delete()
+        return len(queries.captured_queries)
+
+    def test_invoice_delete_query_count_does_not_grow_with_lines(self):
+        self.assertEqual(
+            self.delete_queries(self.invoice_with_lines('1', 2)),
+            self.delete_queries(self.invoice_with_lines('2', 50)),
+        )
+
+    def test_client_delete_skips_line_signals_and_empties_index(self):
+        if search_backend() != 'sqlite':
+            self.skipTest("Checks the SQLite FTS5 index")
+        small = self.invoice_with_lines('1', 2)
+        self.client_obj = create_client(self.user, company_name='UAB Kitas', company_code='200')
+        large = self.invoice_with_lines('2', 50)
+        index_invoices([small.pk, large.pk])
+
+        self.assertEqual(self.delete_queries(small.client), self.delete_queries(large.client))
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT COUNT(*) FROM {FTS_TABLE} WHERE rowid IN (%s, %s)", [small.pk, large.pk])
+            self.assertEqual(cursor.fetchone()[0], 0)
+
+    def test_line_delete_touches_invoice(self):
+        invoice = self.invoice_with_lines('1', 2)
+        updated_at = Invoice.objects.get(pk=invoice.pk).updated_at
+        invoice.line_items.first().delete()
+        self.assertGreater(Invoice.objects.get(pk=invoice.pk).updated_at, updated_at)
+
+
+class InvoicePreviewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('pardavejas')
+        self.self_info = SelfInfo.objects.create(
+            user=self.user, first_name='Jonas', individual_code='123', phone='1', bank_account='LT00',
+        )
+        self.invoice = create_invoice(self.user, create_client(self.user), '1')
+        self.client.force_login(self.user)
+        self.url = reverse('invoice_preview', args=[self.invoice.pk])
+
+    def test_seller_change_invalidates_etag_without_touching_invoices(self):
+        first = self.client.get(self.url)
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304)
+
+        updated_at = Invoice.objects.get(pk=self.invoice.pk).updated_at
+        self.self_info.first_name = 'Petras'
+        self.self_info.save()
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], first['ETag'])
+        self.assertContains(response, 'Petras')
+        self.assertEqual(Invoice.objects.get(pk=self.invoice.pk).updated_at, updated_at)
+
+    def test_new_amount_wording_re_renders_cached_preview(self):
+        self.assertContains(self.client.get(self.url), 'Vienas šimtas eur ir 00 ct')
+        with mock.patch('invoices.preview.amount_to_words', return_value='nauji žodžiai'), \
+                mock.patch('invoices.preview.PREVIEW_LAYOUT_VERSION', PREVIEW_LAYOUT_VERSION + 1):
+            self.assertContains(self.client.get(self.url), 'Nauji žodžiai')
+
+    def test_new_amount_wording_re_renders_cached_pdf(self):
+        with tempfile.TemporaryDirectory() as cache_dir, override_settings(INVOICE_PDF_CACHE_DIR=cache_dir):
+            old = get_invoice_pdf(self.invoice)
+            self.assertEqual(get_invoice_pdf(self.invoice), old)
+            with mock.patch('invoices.pdf.amount_to_words', return_value='nauji žodžiai'):
+                new = get_invoice_pdf(self.invoice)
+            self.assertNotEqual(new, old)
+            self.assertTrue(new.exists())
+            self.assertFalse(old.exists())
+
+
+class ImportTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('jonas')
+        create_client(self.user, company_code='100')
+
+    def invoices_json(self, numbers, date='2025-02-03'):
+        return json.dumps([
+            {'invoice_number': number, 'client_code': '100', 'date': date,
+             'line_items': [{'service_name': 'Konsultacija', 'quantity': '2', 'price': '12.50'}]}
+            for number in numbers
+        ])
+
+    def test_imported_numbers_advance_sequence(self):
+        result = import_invoices(self.user.id, io.StringIO(self.invoices_json(['00000010', '00000004', ''])), 'json')
+        self.assertEqual((result['invoices'], result['errors']), (3, []))
+        self.assertTrue(Invoice.objects.filter(user=self.user, invoice_number='00000011').exists())
+        self.assertEqual(allocate_invoice_numbers(self.user.id, 'AA', 2025), ['00000012'])
+
+    def test_duplicate_numbers_are_row_errors(self):
+        import_invoices(self.user.id, io.StringIO(self.invoices_json(['00000001', '00000002'])), 'json')
+        result = import_invoices(self.user.id, io.StringIO(self.invoices_json(['00000002', '00000003', '00000003'])), 'json')
+        self.assertEqual(result['invoices'], 1)
+        self.assertEqual([row for row, _ in result['errors']], [1, 3])
+        self.assertEqual(Invoice.objects.filter(user=self.user).count(), 3)
+
+    def test_numbers_may_repeat_in_another_year(self):
+        import_invoices(self.user.id, io.StringIO(self.invoices_json(['00000001', '00000002'])), 'json')
+        result = import_invoices(self.user.id, io.StringIO(self.invoices_json(['00000001', '00000002'], date='2026-01-05')), 'json')
+        self.assertEqual((result['invoices'], result['errors']), (2, []))
+        self.assertEqual(allocate_invoice_numbers(self.user.id, 'AA', 2026), ['00000003'])
+
+    def test_json_array_is_decoded_incrementally(self):
+        text = self.invoices_json([f'{number:08d}' for number in range(1, 6)])
+        with mock.patch('invoices.imports.JSON_CHUNK_SIZE', 7):
+            result = import_invoices(self.user.id, io.StringIO(text), 'json', batch_size=2)
+        self.assertEqual((result['invoices'], result['errors']), (5, []))
+
+    def test_json_syntax_error_reports_its_element(self):
+        text = self.invoices_json(['00000001', '00000002', '00000003'])[:-40]
+        result = import_invoices(self.user.id, io.StringIO(text), 'json', batch_size=1)
+        self.assertEqual(result['invoices'], 2)
+        self.assertEqual(len(result['errors']), 1)
+        self.assertEqual(result['errors'][0][0], 3)
+
+
+class BulkArchiveNameTests(SimpleTestCase):
+    def test_user_values_cannot_leave_the_month_directory(self):
+        names = _archive_names([
+            (1, '../../etc', 'x/../y', datetime.date(2025, 3, 5)),
+            (2, 'AB', '1', datetime.date(2025, 3, 5)),
+            (3, 'AB', '1', datetime.date(2025, 3, 6)),
+            (4, 'Š Ž', '7\\8', datetime.date(2025, 4, 1)),
+        ])
+
+        self.assertEqual(names, {
+            1: '2025-03/.._.._etc-x_.._y.pdf',
+            2: '2025-03/AB-1.pdf',
+            3: '2025-03/AB-1-2.pdf',
+            4: '2025-04/___-7_8.pdf',
+        })
+
+
+class MarkInvoicesPaidTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('apmokejimai')
+        self.client_obj = create_client(self.user)
+        self.old = create_invoice(self.user, self.client_obj, '1', date=datetime.date(2024, 1, 10))
+        self.recent = create_invoice(self.user, self.client_obj, '2', date=datetime.date(2025, 6, 10))
+        other = User.objects.create_user('kitas')
+        self.foreign = create_invoice(other, create_client(other), '1', date=datetime.date(2024, 1, 10))
+        self.client.force_login(self.user)
+
+    def statuses(self):
+        return dict(Invoice.objects.values_list('id', 'status'))
+
+    def test_ticked_invoices_are_marked_paid(self):
+        response = self.client.post(reverse('mark_invoices_paid'), {
+            'invoice': [self.recent.id, self.foreign.id], 'paid_date': '2025-07-01',
+        })
+        self.assertRedirects(response, reverse('receivables'))
+        self.assertEqual(self.statuses(), {self.old.id: 'unpaid', self.recent.id: 'paid', self.foreign.id: 'unpaid'})
+        self.recent.refresh_from_db()
+        self.assertEqual(self.recent.paid_date, datetime.date(2025, 7, 1))
+
+    def test_invoices_due_before_a_date_are_marked_paid(self):
+        version = get_tax_version(self.user.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('mark_invoices_paid'), {'due_before': '2025-01-01', 'paid_date': '2025-01-01'})
+        self.assertEqual(self.statuses(), {self.old.id: 'paid', self.recent.id: 'unpaid', self.foreign.id: 'unpaid'})
+        self.assertNotEqual(get_tax_version(self.user.id), version)
+
+
+class TaxBatchParityTests(TestCase):
+    """calculate_taxes_batch() must match calculate_taxes() to the cent."""
+
+    CASES = 400
+
+    def random_cases(self, seed):
+        rng = random.Random(seed)
+        years = sorted(TAX_RULES)
+        cases = []
+        for _ in range(self.CASES):
+            year = rng.choice(years)
+            current_date = datetime.date(year, rng.randint(1, 12), rng.randint(1, 28))
+            top = rng.choice([2000_00, 30000_00, 200000_00, 5_000_000_00])
+            start = None
+            if rng.random() < 0.5:
+                start = current_date - datetime.timedelta(days=rng.randint(0, 1000))
+            cases.append({
+                'income': str(Decimal(rng.randint(0, top)) / 100),
+                'expenses': str(Decimal(rng.randint(0, top)) / 100) if rng.random() < 0.7 else None,
+                'use_30_percent_rule': rng.random() < 0.5,
+                'activity_start_date': start,
+                'current_date': current_date,
+                'psd_self_paid': rng.random() < 0.5,
+                'rules': TAX_RULES[year],
+            })
+        return cases
+
+    def assert_parity(self, seed):
+        cases = self.random_cases(seed)
+        # calculate_taxes_batch takes one current_date, so batch per date
+        by_date = {}
+        for case in cases:
+            by_date.setdefault(case['current_date'], []).append(case)
+        for current_date, group in by_date.items():
+            result = calculate_taxes_batch(
+                [case['income'] for case in group],
+                expenses=[case['expenses'] for case in group],
+                use_30_percent_rule=[case['use_30_percent_rule'] for case in group],
+                activity_start_dates=[case['activity_start_date'] for case in group],
+                current_date=current_date,
+                psd_self_paid=[case['psd_self_paid'] for case in group],
+                rules=[case['rules'] for case in group],
+            )
+            for index, case in enumerate(group):
+                expected = calculate_taxes(**case)
+                self.assertEqual(batch_result_row(result, index), expected, case)
+
+    def test_random_cases(self):
+        self.assert_parity(seed=11)
+
+    def test_inputs_are_rounded_to_cents(self):
+        # Same as toCents() in static/js/tax_calculator.js
+        current_date = datetime.date(max(TAX_RULES), 6, 15)
+        result = calculate_taxes('1000', expenses='100.005', use_30_percent_rule=False, current_date=current_date)
+        self.assertEqual(result['profit'], Decimal('899.99'))
+        self.assertEqual(calculate_taxes('1000.005', current_date=current_date)['income'], Decimal('1000.01'))
+        batch = calculate_taxes_batch(['1000'], expenses=['100.005'], use_30_percent_rule=False, current_date=current_date)
+        self.assertEqual(batch_result_row(batch, 0), result)
+
+    def test_one_date_many_rows(self):
+        # One vectorized call with every row on the same date and year rules
+        rng = random.Random(13)
+        current_date = datetime.date(max(TAX_RULES), 6, 15)
+        incomes = [str(Decimal(rng.randint(0, 100000_00)) / 100) for _ in range(1000)]
+        result = calculate_taxes_batch(incomes, use_30_percent_rule=True, current_date=current_date)
+        for index in range(0, 1000, 37):
+            self.assertEqual(batch_result_row(result, index), calculate_taxes(incomes[index], current_date=current_date))
+
+
+@unittest.skipIf(shutil.which('node') is None, "Node.js is not installed")
+class TaxJsParityTests(SimpleTestCase):
+    """static/js/tax_calculator.js must match the Python tax functions (see check_tax_js_parity)."""
+
+    def test_random_cases_match(self):
+        cases = random_cases(500, seed=15)
+        js_results = run_js_calculator(shutil.which('node'), cases)
+        self.assertEqual(len(js_results), len(cases))
+        self.assertEqual(list(parity_differences(cases, js_results))[:5], [])
+
+
+class TaxCacheInvalidationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('mokesciai')
+        self.other = User.objects.create_user('kitas')
+        self.client_obj = create_client(self.user)
+
+    def assert_bumps(self, change):
+        before, other_before = get_tax_version(self.user.id), get_tax_version(self.other.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            change()
+        self.assertNotEqual(get_tax_version(self.user.id), before)
+        self.assertEqual(get_tax_version(self.other.id), other_before)
+
+    def test_invoice_changes_bump_version(self):
+        invoice = create_invoice(self.user, self.client_obj, '1')
+        self.assert_bumps(lambda: create_invoice(self.user, self.client_obj, '2'))
+        invoice.total_amount = Decimal('50.00')
+        self.assert_bumps(invoice.save)
+        self.assert_bumps(invoice.delete)
+
+    def test_self_info_and_tax_settings_changes_bump_version(self):
+        self.assert_bumps(lambda: SelfInfo.objects.create(user=self.user, individual_code='1', phone='+370', bank_account='LT1'))
+        self.assert_bumps(lambda: TaxSettings.objects.create(user=self.user, use_30_percent_rule=False))
+
+    def test_rolled_back_change_keeps_version(self):
+        before = get_tax_version(self.user.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(ValueError):
+                with transaction.atomic():
+                    create_invoice(self.user, self.client_obj, '1')
+                    raise ValueError
+        self.assertEqual(get_tax_version(self.user.id), before)
+
+    def test_cached_result_is_recomputed_after_invalidation(self):
+        compute = mock.Mock(side_effect=[1, 2])
+        self.assertEqual(cached_for_user(self.user.id, 'test', (), compute), 1)
+        self.assertEqual(cached_for_user(self.user.id, 'test', (), compute), 1)
+        invalidations = get_tax_cache_stats()['invalidations']
+        with self.captureOnCommitCallbacks(execute=True):
+            create_invoice(self.user, self.client_obj, '1')
+        self.assertEqual(cached_for_user(self.user.id, 'test', (), compute), 2)
+        self.assertEqual(get_tax_cache_stats()['invalidations'], invalidations + 1)
+
+    def test_version_does_not_live_in_the_cache(self):
+        # Another process starts with its own (here: emptied) cache and must
+        # still see the same stamp
+        version = get_tax_version(self.user.id)
+        cache.clear()
+        self.assertEqual(get_tax_version(self.user.id), version)
+
+
+class ClientSearchTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('paieska')
+        self.client_obj = create_client(self.user, company_name='Ąžuolas UAB')
+        self.client.force_login(self.user)
+
+    def search(self, **headers):
+        return self.client.get(reverse('client_search'), {'q': 'azu'}, headers=headers)
+
+    def test_unchanged_results_are_not_modified(self):
+        response = self.search()
+        self.assertEqual([row['id'] for row in response.json()['results']], [self.client_obj.id])
+        self.assertEqual(self.search(if_none_match=response['ETag']).status_code, 304)
+
+    def test_only_client_changes_change_etag(self):
+        etag = self.search()['ETag']
+        version = get_client_version(self.user.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            create_invoice(self.user, self.client_obj, '1')
+            SelfInfo.objects.create(user=self.user, individual_code='1', phone='+370', bank_account='LT1')
+            TaxSettings.objects.create(user=self.user)
+        self.assertEqual(get_client_version(self.user.id), version)
+        self.assertEqual(self.search(if_none_match=etag).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            create_client(self.user, company_name='Ąžuolynas')
+        self.assertEqual(self.search(if_none_match=etag).status_code, 200)
+
+
+@unittest.skipIf(
+    connection.vendor == 'sqlite' and connection.creation.is_in_memory_db(connection.settings_dict['TEST'].get('NAME') or ':memory:'),
+    "Threads cannot share an in-memory SQLite test database; run manage.py benchmark_invoice_numbers instead",
+)
+class ConcurrentInvoiceNumberTests(TransactionTestCase):
+    def test_parallel_allocations_are_unique_and_gapless(self):
+        user = User.objects.create_user('lygiagretus')
+        numbers, timings = allocate_concurrently(user.id, 'AA', 2025, workers=8, allocations=25)
+        self.assertEqual(sorted(int(number) for number in numbers), list(range(1, 201)))
+        self.assertEqual(len(timings), 200)
+        self.assertEqual(InvoiceSequence.objects.get(user=user, serija='AA', year=2025).last_number, 200)
@@ -1,5 +1,5 @@
 from django.urls import path
-from .views import clients, overview, new_invoice, remove_line_item, user_invoices, invoice_preview, my_info, upload_invoice, calculate_taxes_ajax
+from .views import clients, overview, compare_years, client_analytics, new_invoice, add_draft_line_ajax, update_draft_line_ajax, remove_draft_line_ajax, reorder_draft_lines_ajax, user_invoices, receivables, mark_invoice_paid, mark_invoices_paid_bulk, invoice_preview, my_info, client_search, upload_invoice, tax_forecast, tax_cache_stats, export_invoices, invoice_pdf, download_invoices_zip, import_invoices_upload
 from .auth_views import user_login, user_logout
 
 urlpatterns = [
@@ -9,12 +9,26 @@ urlpatterns = [
     
     # Main app views
     path('', overview, name='overview'),
+    path('compare-years/', compare_years, name='compare_years'),
+    path('client-analytics/', client_analytics, name='client_analytics'),
     path('new-invoice/', new_invoice, name='new_invoice'),
-    path('remove-line-item/', remove_line_item, name='remove_line_item'),
+    path('new-invoice/lines/', add_draft_line_ajax, name='add_draft_line'),
+    path('new-invoice/lines/reorder/', reorder_draft_lines_ajax, name='reorder_draft_lines'),
+    path('new-invoice/lines/<int:line_id>/', update_draft_line_ajax, name='update_draft_line'),
+    path('new-invoice/lines/<int:line_id>/remove/', remove_draft_line_ajax, name='remove_draft_line'),
     path('user-invoices/', user_invoices, name='user_invoices'),
+    path('receivables/', receivables, name='receivables'),
     path('upload-invoice/', upload_invoice, name='upload_invoice'),
+    path('import-invoices/', import_invoices_upload, name='import_invoices'),
+    path('export-invoices/', export_invoices, name='export_invoices'),
+    path('download-invoices/', download_invoices_zip, name='download_invoices_zip'),
     path('invoice/<int:invoice_id>/preview/', invoice_preview, name='invoice_preview'),
+    path('invoice/<int:invoice_id>/pdf/', invoice_pdf, name='invoice_pdf'),
+    path('invoice/<int:invoice_id>/mark-paid/', mark_invoice_paid, name='mark_invoice_paid'),
+    path('invoices/mark-paid/', mark_invoices_paid_bulk, name='mark_invoices_paid'),
     path('my-info/', my_info, name='my_info'),
     path('clients/', clients, name='clients'),
-    path('calculate-taxes/', calculate_taxes_ajax, name='calculate_taxes'),
+    path('clients/search/', client_search, name='client_search'),
+    path('tax-forecast/', tax_forecast, name='tax_forecast'),
+    path('tax-cache-stats/', tax_cache_stats, name='tax_cache_stats'),
 ]
\ No newline at end of file
@@ -1,61 +1,326 @@
-from num2words import num2words
-from invoices.models import Invoice
-from decimal import Decimal, ROUND_HALF_UP
-from django.db.models import Sum
+from invoices.models import Client, Invoice, InvoiceSequence, MonthlyIncome, search_key
+from invoices.tax_batch import batch_result_row, calculate_taxes_batch
+from invoices.tax_cache import bump_tax_version
+from invoices.tax_rules import get_tax_rules
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+from functools import lru_cache
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Avg, BigIntegerField, Count, F, Max, Q, Sum
+from django.db.models.functions import Cast, ExtractMonth, ExtractYear
+import datetime
+import logging
 import re
 
-def generate_invoice_number(user_id=None):
+logger = logging.getLogger(__name__)
+
+MONTH_NAMES = ['Sau', 'Vas', 'Kov', 'Bal', 'Geg', 'Bir', 'Lie', 'Rgp', 'Rgs', 'Spa', 'Lap', 'Gru']
+
+INVOICE_NUMBER_DIGITS = 8
+
+def format_invoice_number(number):
+    """Format a sequence number with leading zeros (e.g., 00000001)."""
+    return str(number).zfill(INVOICE_NUMBER_DIGITS)
+
+# Invoice numbers that can collide with allocated ones: digits only, and
+# small enough for InvoiceSequence.last_number
+SEQUENCE_NUMBER_RE = r'^[0-9]{1,9}$'
+
+def sequence_number(invoice_number):
+    """Numeric value of an invoice number in the sequence format (e.g. '00000042' -> 42), else None."""
+    if invoice_number and re.match(SEQUENCE_NUMBER_RE, invoice_number):
+        return int(invoice_number)
+    return None
+
+def _highest_issued_number(user_id, serija, year):
+    """Highest sequence-format invoice number already issued in a series, used to seed a new sequence."""
+    highest = Invoice.objects.filter(
+        user_id=user_id, serija=serija, date__range=year_date_range(year),
+        invoice_number__regex=SEQUENCE_NUMBER_RE,
+    ).aggregate(highest=Max(Cast('invoice_number', BigIntegerField())))['highest']
+    return highest or 0
+
+def _ensure_invoice_sequence(user_id, serija, year):
+    lookup = {'user_id': user_id, 'serija': serija, 'year': year}
+    if InvoiceSequence.objects.filter(**lookup).exists():
+        return
+    try:
+        with transaction.atomic():
+            InvoiceSequence.objects.create(last_number=_highest_issued_number(user_id, serija, year), **lookup)
+    except IntegrityError:
+        # Created concurrently by another request
+        pass
+
+def advance_invoice_sequence(user_id, serija, year, number):
     """
-    Generate a sequential invoice number as an integer string with leading zeros (e.g., 00000001).
-    Finds the latest invoice for the given user and increments its number by 1.
-    If user_id is None, falls back to all invoices.
+    Make sure the (user, serija, year) series never hands out `number` or
+    anything below it again; used when an invoice is saved with a number
+    that was typed or imported instead of allocated.
     """
-    digit_count = 8
+    lookup = {'user_id': user_id, 'serija': serija, 'year': year}
+    with transaction.atomic():
+        if InvoiceSequence.objects.filter(last_number__lt=number, **lookup).update(last_number=number):
+            return
+        _ensure_invoice_sequence(user_id, serija, year)
+        InvoiceSequence.objects.filter(last_number__lt=number, **lookup).update(last_number=number)
 
-    if user_id:
-        last_invoice = Invoice.objects.filter(user_id=user_id).order_by('-id').first()
-    else:
-        last_invoice = Invoice.objects.order_by('-id').first()
+def allocate_invoice_numbers(user_id, serija='AA', year=None, count=1):
+    """
+    Atomically reserve `count` consecutive invoice numbers in the
+    (user, serija, year) series and return them formatted.
 
-    if not last_invoice or not last_invoice.invoice_number:
-        return '1'.zfill(digit_count)
+    The counter is bumped with a single UPDATE, which holds the row lock
+    until the surrounding transaction commits, so concurrent callers never
+    receive the same number. Call it inside the transaction that saves the
+    invoices: if that transaction rolls back, the numbers are released and
+    the series stays gapless.
+    """
+    if year is None:
+        year = datetime.date.today().year
+    lookup = {'user_id': user_id, 'serija': serija, 'year': year}
+    with transaction.atomic():
+        # UPDATE first: the transaction takes the write lock before reading,
+        # so concurrent SQLite writers queue up instead of failing
+        if not InvoiceSequence.objects.filter(**lookup).update(last_number=F('last_number') + count):
+            _ensure_invoice_sequence(user_id, serija, year)
+            InvoiceSequence.objects.filter(**lookup).update(last_number=F('last_number') + count)
+        last_number = InvoiceSequence.objects.filter(**lookup).values_list('last_number', flat=True).get()
+    return [format_invoice_number(number) for number in range(last_number - count + 1, last_number + 1)]
 
-    last_number = last_invoice.invoice_number
-    # Strip all non-digit characters to get the numeric part
-    numeric_part_str = re.sub(r'\D', '', last_number)
+def generate_invoice_number(user_id, serija='AA', year=None):
+    """
+    Preview the next invoice number of the (user, serija, year) series
+    without reserving it. The number is only handed out by
+    allocate_invoice_numbers() when the invoice is saved.
+    """
+    if year is None:
+        year = datetime.date.today().year
+    last_number = InvoiceSequence.objects.filter(
+        user_id=user_id, serija=serija, year=year
+    ).values_list('last_number', flat=True).first()
+    if last_number is None:
+        last_number = _highest_issued_number(user_id, serija, year)
+    return format_invoice_number(last_number + 1)
 
-    try:
-        numeric_part = int(numeric_part_str)
-        next_number = numeric_part + 1
-        new_invoice_number = str(next_number).zfill(digit_count)
-        return new_invoice_number
-    except (ValueError, IndexError):
-        return '1'.zfill(digit_count)
-    
+def line_item_total(quantity, price):
+    """Line item amount (quantity × price) rounded to cents."""
+    return (Decimal(str(quantity)) * Decimal(str(price))).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+
+# Scale words (singular, plural, genitive plural) of the thousands groups,
+# as num2words spells them
+SCALE_WORDS = [
+    None,
+    ('tūkstantis', 'tūkstančiai', 'tūkstančių'),
+    ('milijonas', 'milijonai', 'milijonų'),
+    ('milijardas', 'milijardai', 'milijardų'),
+]
+
+@lru_cache(maxsize=1000)
+def _group_words(number):
+    """Words of 1-999 in Lithuanian."""
+    # num2words is imported on first use, most requests never need it
+    from num2words import num2words
+    return num2words(number, lang='lt')
+
+def _scale_word(group, forms):
+    ones, tens = group % 10, group // 10 % 10
+    if tens == 1 or ones == 0:
+        return forms[2]
+    return forms[0] if ones == 1 else forms[1]
+
+@lru_cache(maxsize=4096)
+def euro_words(euros):
+    """
+    Words of a non-negative whole number of euros, same as
+    num2words(euros, lang='lt') but built from cached 0-999 groups.
+    """
+    if euros == 0:
+        return 'nulis'
+    groups = []
+    rest = euros
+    while rest:
+        rest, group = divmod(rest, 1000)
+        groups.append(group)
+    if len(groups) > len(SCALE_WORDS):
+        from num2words import num2words
+        return num2words(euros, lang='lt')
+    words = []
+    for scale in range(len(groups) - 1, -1, -1):
+        group = groups[scale]
+        if group:
+            words.append(_group_words(group))
+            if scale:
+                words.append(_scale_word(group, SCALE_WORDS[scale]))
+    return ' '.join(words)
 
 def amount_to_words(amount):
     """
-    Convert a number to words in Lithuanian using num2words,
-    formatted as '<words> eur ir <cents> ct'.
+    Amount in words in Lithuanian, formatted as '<words> eur ir <cents> ct'.
+
+    The amount is converted with Decimal arithmetic (rounded half up to
+    cents), so values such as 0.285 never lose a cent to float rounding.
+
+    Args:
+        amount: Decimal, int, float or numeric string
+
+    Returns:
+        Words, or "" if the amount is not a finite number
     """
     try:
-        amount = float(amount)
-        euros = int(amount)
-        cents = int(round((amount - euros) * 100))
-        words = num2words(euros, lang='lt')
-        return f"{words} eur ir {cents:02d} ct"
-    except Exception as e:
-        print(f"num2words error: {e}")
+        total_cents = int(Decimal(str(amount)).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP) * 100)
+    except (InvalidOperation, TypeError, ValueError):
+        logger.warning("Cannot convert amount %r to words", amount)
         return ""
+    euros, cents = divmod(abs(total_cents), 100)
+    sign = 'minus ' if total_cents < 0 else ''
+    return f"{sign}{euro_words(euros)} eur ir {cents:02d} ct"
+
+def year_date_range(year):
+    """First and last day of a year, for index-friendly date range filters."""
+    return datetime.date(year, 1, 1), datetime.date(year, 12, 31)
+
+CLIENT_SEARCH_LIMIT = 10
+CLIENT_SEARCH_MAX_LIMIT = 50
+
+def _prefix_filter(field, prefix):
+    """Index-friendly "field starts with prefix" lookup."""
+    if connection.vendor == 'sqlite' and ord(prefix[-1]) < 0x10FFFF:
+        # LIKE is case-insensitive on SQLite and cannot use a plain index,
+        # the equivalent range on the (binary collated) column can
+        upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+        return Q(**{f'{field}__gte': prefix, f'{field}__lt': upper})
+    return Q(**{f'{field}__startswith': prefix})
+
+def search_clients(user_id, query, limit=CLIENT_SEARCH_LIMIT):
+    """
+    Clients of a user for a typeahead, best matches first.
+
+    Clients whose name (without diacritics, any case) or company code
+    starts with the query come first, via the (user, search_name) and
+    (user, company_code) indexes. When they are fewer than limit, clients
+    whose name contains the query (3+ characters) fill up the list.
+
+    Args:
+        user_id: Owner of the clients
+        query: Typed text
+        limit: Maximum number of results
+
+    Returns:
+        List of dictionaries with id, company_name, company_code and pvm_code
+    """
+    fields = ('id', 'company_name', 'company_code', 'pvm_code')
+    clients = Client.objects.filter(user_id=user_id)
+    key = search_key(query)
+    if not key:
+        return list(clients.order_by('search_name', 'id').values(*fields)[:limit])
+
+    code = query.strip()
+    results = list(
+        clients.filter(_prefix_filter('search_name', key) | _prefix_filter('company_code', code))
+        .order_by('search_name', 'id').values(*fields)[:limit]
+    )
+    if len(results) < limit and len(key) >= 3:
+        results += clients.filter(search_name__contains=key).exclude(
+            id__in=[client['id'] for client in results]
+        ).order_by('search_name', 'id').values(*fields)[:limit - len(results)]
+    return results
 
 def get_invoices_for_user_year(user_id, year):
-    return Invoice.objects.filter(user_id=user_id, date__year=year)
+    return Invoice.objects.filter(user_id=user_id, date__range=year_date_range(year))
 
 def get_total_gross_income(user_id, year):
-    invoices = get_invoices_for_user_year(user_id, year)
-    return invoices.aggregate(total=Sum('total_amount'))['total'] or Decimal('0.00')
+    rollup = MonthlyIncome.objects.filter(user_id=user_id, year=year)
+    return rollup.aggregate(total=Sum('total_amount'))['total'] or Decimal('0.00')
 
-def calculate_taxes(income, expenses=None, use_30_percent_rule=True, activity_start_date=None, current_date=None, psd_self_paid=True):
+def adjust_monthly_income(user_id, date, serija, count_delta, amount_delta):
+    """
+    Apply an invoice count/amount change to the MonthlyIncome row for the
+    month of `date`, creating the row if it does not exist yet.
+    """
+    lookup = {'user_id': user_id, 'year': date.year, 'month': date.month, 'serija': serija}
+    with transaction.atomic():
+        updated = MonthlyIncome.objects.filter(**lookup).update(
+            invoice_count=F('invoice_count') + count_delta,
+            total_amount=F('total_amount') + amount_delta,
+        )
+        if updated:
+            return
+        try:
+            with transaction.atomic():
+                MonthlyIncome.objects.create(invoice_count=count_delta, total_amount=amount_delta, **lookup)
+        except IntegrityError:
+            # Another transaction created the row first
+            MonthlyIncome.objects.filter(**lookup).update(
+                invoice_count=F('invoice_count') + count_delta,
+                total_amount=F('total_amount') + amount_delta,
+            )
+
+def compute_monthly_income(user_id=None):
+    """
+    Aggregate MonthlyIncome values straight from the Invoice table.
+
+    Returns:
+        Dictionary {(user_id, year, month, serija): (invoice_count, total_amount)}
+    """
+    invoices = Invoice.objects.all()
+    if user_id:
+        invoices = invoices.filter(user_id=user_id)
+    rows = (
+        invoices
+        .annotate(year=ExtractYear('date'), month=ExtractMonth('date'))
+        .values('user_id', 'year', 'month', 'serija')
+        .annotate(invoice_count=Count('id'), total=Sum('total_amount'))
+        .order_by()
+    )
+    return {
+        (row['user_id'], row['year'], row['month'], row['serija']): (row['invoice_count'], row['total'] or Decimal('0.00'))
+        for row in rows
+    }
+
+def rebuild_monthly_income(user_id=None):
+    """Replace MonthlyIncome rows with values recomputed from invoices. Returns the row count."""
+    expected = compute_monthly_income(user_id)
+    with transaction.atomic():
+        rollup = MonthlyIncome.objects.all()
+        if user_id:
+            rollup = rollup.filter(user_id=user_id)
+        user_ids = set(rollup.values_list('user_id', flat=True)) | {key[0] for key in expected}
+        rollup.delete()
+        MonthlyIncome.objects.bulk_create([
+            MonthlyIncome(user_id=key[0], year=key[1], month=key[2], serija=key[3], invoice_count=count, total_amount=total)
+            for key, (count, total) in expected.items()
+        ], batch_size=1000)
+        for rebuilt_user_id in user_ids:
+            bump_tax_version(rebuilt_user_id)
+    return len(expected)
+
+def find_monthly_income_drift(user_id=None):
+    """
+    Compare MonthlyIncome with the Invoice table.
+
+    Returns:
+        List of (key, stored, expected) tuples where stored/expected are
+        (invoice_count, total_amount) pairs; missing rows count as (0, 0).
+    """
+    expected = compute_monthly_income(user_id)
+    rollup = MonthlyIncome.objects.all()
+    if user_id:
+        rollup = rollup.filter(user_id=user_id)
+    stored = {
+        (row.user_id, row.year, row.month, row.serija): (row.invoice_count, row.total_amount)
+        for row in rollup
+    }
+    empty = (0, Decimal('0.00'))
+    drift = []
+    for key in sorted(set(expected) | set(stored)):
+        if stored.get(key, empty) != expected.get(key, empty):
+            drift.append((key, stored.get(key, empty), expected.get(key, empty)))
+    return drift
+
+def _money(amount):
+    """Amount in euros rounded half up to cents, as toCents() in static/js/tax_calculator.js does."""
+    return Decimal(str(amount)).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+
+def calculate_taxes(income, expenses=None, use_30_percent_rule=True, activity_start_date=None, current_date=None, psd_self_paid=True, rules=None):
     """
     Calculate Lithuanian self-employment taxes according to official rules.
     
@@ -66,6 +331,7 @@ def calculate_taxes(income, expenses=None, use_30_percent_rule=True, activity_st
         activity_start_date: Date when individual activity started (for VSDI exemption)
         current_date: Current calculation date (defaults to today)
         psd_self_paid: If True, user pays PSD monthly themselves (excludes from total tax calculation) - DEFAULT TRUE
+        rules: TaxRules of the tax year (defaults to the year of current_date)
     
     Returns:
         Dictionary with all tax calculations
@@ -76,22 +342,16 @@ def calculate_taxes(income, expenses=None, use_30_percent_rule=True, activity_st
     
     if current_date is None:
         current_date = datetime.now().date()
+    if rules is None:
+        rules = get_tax_rules(current_date.year)
     
-    # Tax rates and constants (2025)
-    VSDI_RATE = Decimal('0.1252')  # 12.52%
-    PSDI_RATE = Decimal('0.0698')   # 6.98%
-    GPM_RATE = Decimal('0.05')      # 5%
-    GPM_LIMIT = Decimal('11900.00') # Only up to €11,900 is taxed at 5%
-    MMA_2025 = Decimal('1038.00')   # Minimal monthly salary 2025
-    MIN_PSD_MONTHLY = Decimal('72.45')  # Minimal PSD per month if income <= MMA
-    
-    income = Decimal(str(income))
+    income = _money(income)
     
     # Calculate expenses
     if use_30_percent_rule:
-        expenses = (income * Decimal('0.30')).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+        expenses = (income * rules.expense_rate).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
     else:
-        expenses = Decimal(str(expenses)) if expenses else Decimal('0.00')
+        expenses = _money(expenses) if expenses else Decimal('0.00')
     
     # Calculate profit
     profit = (income - expenses).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
@@ -108,7 +368,7 @@ def calculate_taxes(income, expenses=None, use_30_percent_rule=True, activity_st
         vsdi_exempt = months_since_start < 12
     
     # Calculate VSDI (0 if first-year exemption applies)
-    vsdi = Decimal('0.00') if vsdi_exempt else (vsdi_base * VSDI_RATE).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+    vsdi = Decimal('0.00') if vsdi_exempt else (vsdi_base * rules.vsdi_rate).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
     
     # Calculate PSDI with special logic
     psdi_is_self_paid = False
@@ -121,28 +381,28 @@ def calculate_taxes(income, expenses=None, use_30_percent_rule=True, activity_st
         # Calculate monthly average income
         monthly_income = (income / Decimal('12')).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
         
-        if monthly_income <= MMA_2025:
+        if monthly_income <= rules.mma:
             # Use minimal PSD payment × 12 months
-            psdi = MIN_PSD_MONTHLY * Decimal('12')
-            psdi_note = f"Minimalus savaimokestis {MIN_PSD_MONTHLY}€/mėn × 12 mėn (vid. pajamos {monthly_income}€/mėn ≤ MMA)"
+            psdi = rules.min_psd_annual
+            psdi_note = f"Minimalus savaimokestis {rules.min_psd_monthly}€/mėn × 12 mėn (vid. pajamos {monthly_income}€/mėn ≤ MMA)"
         else:
             # Calculate annual PSD: 6.98% of PSDI base
             # This represents what you should pay monthly based on declared base to Sodra
             monthly_psdi_base = (psdi_base / Decimal('12')).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
-            monthly_psdi = (monthly_psdi_base * PSDI_RATE).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+            monthly_psdi = (monthly_psdi_base * rules.psdi_rate).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
             psdi = monthly_psdi * Decimal('12')  # Annual total
             psdi_note = f"Savaimokestis {monthly_psdi}€/mėn × 12 mėn (vid. pajamos {monthly_income}€/mėn > MMA)"
     else:
         # Normal PSDI calculation
         monthly_income = (income / Decimal('12')).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
         
-        if monthly_income <= MMA_2025:
+        if monthly_income <= rules.mma:
             # Use minimal PSD payment × 12 months
-            psdi = MIN_PSD_MONTHLY * Decimal('12')
-            psdi_note = f"Minimalus PSD {MIN_PSD_MONTHLY}€/mėn × 12 mėn"
+            psdi = rules.min_psd_annual
+            psdi_note = f"Minimalus PSD {rules.min_psd_monthly}€/mėn × 12 mėn"
         else:
             # Standard calculation - annual
-            psdi = (psdi_base * PSDI_RATE).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+            psdi = (psdi_base * rules.psdi_rate).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
             psdi_note = "Standartinis metinis skaičiavimas"
     
     # Calculate GPM base
@@ -153,8 +413,8 @@ def calculate_taxes(income, expenses=None, use_30_percent_rule=True, activity_st
         gpm_base = (profit - vsdi - psdi).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
     
     # Apply GPM limit (only up to €11,900 is taxed)
-    gpm_taxable = min(gpm_base, GPM_LIMIT)
-    gpm = (gpm_taxable * GPM_RATE).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+    gpm_taxable = min(gpm_base, rules.gpm_limit)
+    gpm = (gpm_taxable * rules.gpm_rate).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
     
     # Calculate total taxes
     # If PSD is self-paid, it's not included in the total to deduct
@@ -185,9 +445,11 @@ def calculate_taxes(income, expenses=None, use_30_percent_rule=True, activity_st
         'total_taxes_to_deduct': total_taxes,  # Actual amount to deduct from income
         'net_income': net_income,
         'vsdi_exempt': vsdi_exempt,
-        'income_vs_mma': 'below' if income <= MMA_2025 else 'above',
-        'mma_2025': float(MMA_2025),
-        'min_psd_monthly': float(MIN_PSD_MONTHLY),
+        'income_vs_mma': 'below' if income <= rules.mma else 'above',
+        'tax_year': rules.year,
+        'mma': float(rules.mma),
+        'mma_2025': float(rules.mma),  # Old key name, kept for existing callers
+        'min_psd_monthly': float(rules.min_psd_monthly),
         'gpm_percent': float((gpm / income * 100).quantize(Decimal('0.01'))) if income > 0 else 0,
         'vsdi_percent': float((vsdi / income * 100).quantize(Decimal('0.01'))) if income > 0 else 0,
         'psdi_percent': float((psdi / income * 100).quantize(Decimal('0.01'))) if income > 0 else 0,
@@ -195,7 +457,7 @@ def calculate_taxes(income, expenses=None, use_30_percent_rule=True, activity_st
     }
 
 
-def calculate_monthly_psd(monthly_invoices_data, use_30_percent_rule=True):
+def calculate_monthly_psd(monthly_invoices_data, use_30_percent_rule=True, rules=None):
     """
     Calculate PSD month by month based on actual monthly income.
     Each month is calculated independently against MMA threshold.
@@ -203,23 +465,23 @@ def calculate_monthly_psd(monthly_invoices_data, use_30_percent_rule=True):
     Args:
         monthly_invoices_data: List of tuples (month_number, monthly_income)
         use_30_percent_rule: If True, use 30% expense rule
+        rules: TaxRules of the tax year (defaults to the current year)
     
     Returns:
         Dictionary with monthly breakdown and annual total
     """
-    MMA_2025 = Decimal('1038.00')
-    MIN_PSD_MONTHLY = Decimal('72.45')
-    PSDI_RATE = Decimal('0.0698')
+    if rules is None:
+        rules = get_tax_rules()
     
     monthly_psd_breakdown = []
     annual_psd_total = Decimal('0.00')
     
     for month_num, income in monthly_invoices_data:
-        income = Decimal(str(income))
+        income = _money(income)
         
         # Calculate monthly profit
         if use_30_percent_rule:
-            expenses = (income * Decimal('0.30')).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+            expenses = (income * rules.expense_rate).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
         else:
             expenses = Decimal('0.00')
         
@@ -227,16 +489,16 @@ def calculate_monthly_psd(monthly_invoices_data, use_30_percent_rule=True):
         psdi_base = (profit * Decimal('0.50')).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
         
         # Check if this month's income is above MMA
-        if income <= MMA_2025:
+        if income <= rules.mma:
             # Use minimal PSD
-            monthly_psd = MIN_PSD_MONTHLY
+            monthly_psd = rules.min_psd_monthly
             calculation_type = "minimal"
         else:
             # Calculate based on actual income
-            monthly_psd = (psdi_base * PSDI_RATE).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+            monthly_psd = (psdi_base * rules.psdi_rate).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
             # But never less than minimum
-            if monthly_psd < MIN_PSD_MONTHLY:
-                monthly_psd = MIN_PSD_MONTHLY
+            if monthly_psd < rules.min_psd_monthly:
+                monthly_psd = rules.min_psd_monthly
                 calculation_type = "minimal"
             else:
                 calculation_type = "calculated"
@@ -250,19 +512,35 @@ def calculate_monthly_psd(monthly_invoices_data, use_30_percent_rule=True):
             'psdi_base': float(psdi_base),
             'psd': float(monthly_psd),
             'calculation_type': calculation_type,
-            'above_mma': income > MMA_2025
+            'above_mma': income > rules.mma
         })
     
     return {
         'monthly_breakdown': monthly_psd_breakdown,
         'annual_total': float(annual_psd_total),
-        'mma_2025': float(MMA_2025),
-        'min_psd_monthly': float(MIN_PSD_MONTHLY)
+        'tax_year': rules.year,
+        'mma': float(rules.mma),
+        'mma_2025': float(rules.mma),
+        'min_psd_monthly': float(rules.min_psd_monthly)
     }
 
+def apply_monthly_psd(result, monthly_psd_data):
+    """Replace the annual PSD estimate of a calculate_taxes() result with the month-by-month PSD."""
+    result['psdi'] = Decimal(str(monthly_psd_data['annual_total']))
+    result['psdi_note'] = f"Savaimokestis skaičiuojamas kiekvieną mėnesį pagal faktines pajamas (suma: {monthly_psd_data['annual_total']}€/metus)"
+    result['psdi_monthly_breakdown'] = monthly_psd_data['monthly_breakdown']
+    
+    # Recalculate totals with the accurate monthly PSD
+    result['total_taxes'] = result['vsdi'] + result['psdi'] + result['gpm']
+    result['total_taxes_to_deduct'] = result['vsdi'] + result['gpm']  # PSD not deducted
+    result['net_income'] = result['income'] - result['expenses'] - result['total_taxes_to_deduct']
+
 def get_total_taxes(user_id, year):
     """Legacy function - uses simplified 30% rule calculation"""
-    gross = get_total_gross_income(user_id, year)
+    return get_taxes_for_gross(get_total_gross_income(user_id, year), year)
+
+def get_taxes_for_gross(gross, year=None):
+    """Summarize taxes for an already aggregated gross income (30% rule) in a tax year."""
     if gross == 0:
         return {
             'gpm': Decimal('0.00'),
@@ -276,7 +554,7 @@ def get_total_taxes(user_id, year):
         }
     
     # Use the new calculation function
-    result = calculate_taxes(gross, use_30_percent_rule=True)
+    result = calculate_taxes(gross, use_30_percent_rule=True, rules=get_tax_rules(year))
     
     return {
         'gpm': result['gpm'],
@@ -294,9 +572,330 @@ def get_net_income(user_id, year):
     taxes = get_total_taxes(user_id, year)
     return (gross - taxes['total']).quantize(Decimal('0.01'))
 
-def get_invoice_stats(user_id, year):
+def get_monthly_totals(user_id, years):
+    """
+    Gross income and invoice count per (year, month) for the given years,
+    read from the MonthlyIncome rollup with a single grouped query.
+
+    Returns:
+        Dictionary {(year, month): {'income': Decimal, 'count': int}}
+    """
+    return get_monthly_totals_from(MonthlyIncome.objects.filter(user_id=user_id, year__in=list(years)))
+
+def get_monthly_totals_from(rollup):
+    """Group a MonthlyIncome queryset by (year, month) in one query."""
+    rows = rollup.values('year', 'month').annotate(income=Sum('total_amount'), count=Sum('invoice_count')).order_by()
+    return {
+        (row['year'], row['month']): {'income': row['income'] or Decimal('0.00'), 'count': row['count']}
+        for row in rows
+    }
+
+def get_dashboard_summary(user_id, year):
+    """
+    Everything the overview dashboard needs for a year, derived in memory
+    from one grouped query covering the year and the previous year.
+    """
+    totals = get_monthly_totals(user_id, [year - 1, year])
+    empty = {'income': Decimal('0.00'), 'count': 0}
+
+    monthly_income = [totals.get((year, month), empty)['income'] for month in range(1, 13)]
+    prev_monthly_income = [totals.get((year - 1, month), empty)['income'] for month in range(1, 13)]
+    invoice_count = sum(totals.get((year, month), empty)['count'] for month in range(1, 13))
+
+    gross_income = sum(monthly_income, Decimal('0.00'))
+    taxes = get_taxes_for_gross(gross_income, year)
+    net_income = (gross_income - taxes['total']).quantize(Decimal('0.01'))
+
+    prev_gross = sum(prev_monthly_income, Decimal('0.00'))
+    prev_taxes = get_taxes_for_gross(prev_gross, year - 1)
+    prev_net = (prev_gross - prev_taxes['total']).quantize(Decimal('0.01'))
+
+    gross_income_growth = (
+        ((gross_income - prev_gross) / prev_gross * 100) if prev_gross > 0 else 100 if gross_income > 0 else 0
+    )
+    net_income_growth = (
+        ((net_income - prev_net) / prev_net * 100) if prev_net > 0 else 100 if net_income > 0 else 0
+    )
+
+    # Monthly data for charts, taxes split proportionally to monthly income
+    monthly_data = []
+    for month, month_income in enumerate(monthly_income, start=1):
+        if gross_income > 0:
+            month_tax_amount = (month_income / gross_income) * taxes['total']
+        else:
+            month_tax_amount = Decimal('0.00')
+        monthly_data.append({
+            'month': MONTH_NAMES[month - 1],
+            'income': float(month_income),
+            'taxes': float(month_tax_amount),
+            'net': float(month_income - month_tax_amount)
+        })
+
+    return {
+        'gross_income': gross_income,
+        'net_income': net_income,
+        'taxes': taxes,
+        'prev_gross': prev_gross,
+        'prev_net': prev_net,
+        'gross_income_growth': gross_income_growth,
+        'net_income_growth': net_income_growth,
+        'invoice_count': invoice_count,
+        'monthly_income': monthly_income,
+        'prev_monthly_income': prev_monthly_income,
+        'monthly_data': monthly_data,
+    }
+
+def get_income_years(user_id):
+    """Years in which the user has invoices, oldest first."""
+    return sorted(
+        MonthlyIncome.objects
+        .filter(user_id=user_id, invoice_count__gt=0)
+        .values_list('year', flat=True)
+        .distinct()
+        .order_by()
+    )
+
+def get_year_comparison(user_id, years=None):
+    """
+    Income, taxes and monthly series per year for a side-by-side comparison,
+    from one grouped MonthlyIncome query and one batch tax calculation.
+
+    Args:
+        user_id: User whose invoices are compared
+        years: Years to compare (defaults to every year with invoices)
+
+    Returns:
+        List of dictionaries per year, oldest first, with the same totals
+        as get_dashboard_summary() (gross and net income, taxes, growth
+        against the previous year, invoice count) and the monthly income
+    """
+    rollup = MonthlyIncome.objects.filter(user_id=user_id)
+    if years is not None:
+        years = sorted(set(years))
+        # Previous years are needed for the growth figures
+        rollup = rollup.filter(year__in=set(years) | {year - 1 for year in years})
+    totals = get_monthly_totals_from(rollup)
+    if years is None:
+        years = sorted({year for (year, month), values in totals.items() if values['count']})
+    if not years:
+        return []
+
+    all_years = sorted(set(years) | {year - 1 for year in years})
+    empty = {'income': Decimal('0.00'), 'count': 0}
+    monthly = {
+        year: [totals.get((year, month), empty)['income'] for month in range(1, 13)]
+        for year in all_years
+    }
+    gross = {year: sum(monthly[year], Decimal('0.00')) for year in all_years}
+
+    # Same rules as get_taxes_for_gross(): 30% rule, PSD self-paid, each year's rates
+    batch = calculate_taxes_batch(
+        [gross[year] for year in all_years],
+        rules=[get_tax_rules(year) for year in all_years],
+    )
+    taxes = {}
+    for index, year in enumerate(all_years):
+        if gross[year] == 0:
+            taxes[year] = get_taxes_for_gross(Decimal('0.00'))
+            continue
+        row = batch_result_row(batch, index)
+        taxes[year] = {
+            'gpm': row['gpm'],
+            'vsd': row['vsdi'],
+            'psd': row['psdi'],
+            'total': row['total_taxes'],
+            'gpm_percent': row['gpm_percent'],
+            'vsd_percent': row['vsdi_percent'],
+            'psd_percent': row['psdi_percent'],
+            'total_percent': row['total_percent'],
+        }
+    net = {year: (gross[year] - taxes[year]['total']).quantize(Decimal('0.01')) for year in all_years}
+
+    def growth(current, previous):
+        return ((current - previous) / previous * 100) if previous > 0 else 100 if current > 0 else 0
+
+    return [
+        {
+            'year': year,
+            'gross_income': gross[year],
+            'net_income': net[year],
+            'taxes': taxes[year],
+            'invoice_count': sum(totals.get((year, month), empty)['count'] for month in range(1, 13)),
+            'gross_income_growth': growth(gross[year], gross[year - 1]),
+            'net_income_growth': growth(net[year], net[year - 1]),
+            'monthly_income': monthly[year],
+        }
+        for year in years
+    ]
+
+TOP_CLIENTS = 10
+
+def get_client_analytics(user_id, year=None, top=TOP_CLIENTS):
+    """
+    Revenue per client from two grouped queries over the (user, client, date)
+    index: one row per client with totals, and monthly revenue of the top
+    clients.
+
+    Args:
+        user_id: User whose invoices are analysed
+        year: Limit to one year (None for all invoices)
+        top: Number of clients that get a monthly series
+
+    Returns:
+        Dictionary with 'clients' (per client: invoice count, revenue, share
+        of the total, average payment term in days, last invoice date),
+        sorted by revenue, the overall 'total_revenue' and 'invoice_count',
+        'months' as (year, month) pairs and 'series' with the monthly
+        revenue of the top clients
+    """
+    invoices = Invoice.objects.filter(user_id=user_id)
+    if year is not None:
+        invoices = invoices.filter(date__range=year_date_range(year))
+
+    rows = list(
+        invoices.values('client_id', 'client__company_name', 'client__company_code')
+        .annotate(
+            invoice_count=Count('id'),
+            revenue=Sum('total_amount'),
+            payment_term=Avg(F('pay_until') - F('date')),
+            last_date=Max('date'),
+        )
+        .order_by('-revenue', 'client__company_name')
+    )
+    total_revenue = sum((row['revenue'] for row in rows), Decimal('0.00'))
+    clients = [
+        {
+            'client_id': row['client_id'],
+            'company_name': row['client__company_name'],
+            'company_code': row['client__company_code'],
+            'invoice_count': row['invoice_count'],
+            'revenue': row['revenue'],
+            'share': (row['revenue'] / total_revenue * 100).quantize(Decimal('0.01')) if total_revenue > 0 else Decimal('0.00'),
+            'payment_term_days': (
+                round(row['payment_term'].total_seconds() / 86400, 1) if row['payment_term'] is not None else None
+            ),
+            'last_date': row['last_date'],
+        }
+        for row in rows
+    ]
+
+    top_clients = clients[:top]
+    series_rows = []
+    if top_clients:
+        series_rows = (
+            invoices.filter(client_id__in=[client['client_id'] for client in top_clients])
+            .annotate(year=ExtractYear('date'), month=ExtractMonth('date'))
+            .values('client_id', 'year', 'month')
+            .annotate(revenue=Sum('total_amount'))
+            .order_by()
+        )
+    revenue = {(row['client_id'], row['year'], row['month']): row['revenue'] for row in series_rows}
+
+    if year is not None:
+        months = [(year, month) for month in range(1, 13)]
+    elif revenue:
+        first = min((y, m) for _, y, m in revenue)
+        last = max((y, m) for _, y, m in revenue)
+        months = []
+        current = first
+        while current <= last:
+            months.append(current)
+            current = (current[0] + 1, 1) if current[1] == 12 else (current[0], current[1] + 1)
+    else:
+        months = []
+
+    return {
+        'clients': clients,
+        'total_revenue': total_revenue,
+        'invoice_count': sum(client['invoice_count'] for client in clients),
+        'months': months,
+        'series': [
+            {
+                'client_id': client['client_id'],
+                'company_name': client['company_name'],
+                'revenue': [revenue.get((client['client_id'], y, m), Decimal('0.00')) for y, m in months],
+            }
+            for client in top_clients
+        ],
+    }
+
+def get_invoice_stats(user_id, year, total=None):
     invoices = get_invoices_for_user_year(user_id, year)
-    total = invoices.count()
-    paid = invoices.filter(status='paid').count() if hasattr(Invoice, 'status') else 0
+    if total is None:
+        total = invoices.count()
+    paid = invoices.filter(status='paid').count()
     unpaid = total - paid
-    return {'total': total, 'paid': paid, 'unpaid': unpaid}
\ No newline at end of file
+    return {'total': total, 'paid': paid, 'unpaid': unpaid}
+
+# (key, label, fewest and most days overdue); None means open-ended
+AGING_BUCKETS = [
+    ('not_due', 'Dar nepradelsta', None, -1),
+    ('0_30', '0–30 d.', 0, 30),
+    ('31_60', '31–60 d.', 31, 60),
+    ('61_90', '61–90 d.', 61, 90),
+    ('90_plus', 'Daugiau nei 90 d.', 91, None),
+]
+
+def unpaid_invoices(user_id):
+    """Unpaid invoices of a user; filters on status so invoice_unpaid_due_idx applies."""
+    return Invoice.objects.filter(user_id=user_id, status='unpaid')
+
+def mark_invoices_paid(invoices, paid_date):
+    """
+    Mark the unpaid invoices of a queryset paid on paid_date with one UPDATE.
+    Returns the number of invoices marked.
+    """
+    invoices = invoices.filter(status='unpaid')
+    with transaction.atomic():
+        user_ids = set(invoices.order_by().values_list('user_id', flat=True).distinct())
+        count = invoices.update(status='paid', paid_date=paid_date)
+        # update() sends no signals; the cached dashboard stats count paid invoices
+        for user_id in user_ids:
+            bump_tax_version(user_id)
+    return count
+
+def get_receivables_aging(user_id, today=None):
+    """
+    Unpaid invoices grouped by days overdue, in one aggregate query over the
+    partial index of unpaid invoices.
+
+    Args:
+        user_id: User whose receivables are reported
+        today: Date the days overdue are counted to (defaults to today)
+
+    Returns:
+        Dictionary with 'buckets' (key, label, invoice count and amount per
+        AGING_BUCKETS entry), the unpaid 'count' and 'amount', and the
+        'overdue_count' and 'overdue_amount' of invoices past pay_until
+    """
+    if today is None:
+        today = datetime.date.today()
+    aggregates = {}
+    for key, _, fewest, most in AGING_BUCKETS:
+        # Days overdue d means pay_until == today - d
+        condition = Q()
+        if fewest is not None:
+            condition &= Q(pay_until__lte=today - datetime.timedelta(days=fewest))
+        if most is not None:
+            condition &= Q(pay_until__gte=today - datetime.timedelta(days=most))
+        aggregates[f'{key}_count'] = Count('id', filter=condition)
+        aggregates[f'{key}_amount'] = Sum('total_amount', filter=condition)
+    totals = unpaid_invoices(user_id).aggregate(**aggregates)
+
+    buckets = [
+        {
+            'key': key,
+            'label': label,
+            'count': totals[f'{key}_count'],
+            'amount': totals[f'{key}_amount'] or Decimal('0.00'),
+        }
+        for key, label, _, _ in AGING_BUCKETS
+    ]
+    overdue = [bucket for bucket in buckets if bucket['key'] != 'not_due']
+    return {
+        'buckets': buckets,
+        'count': sum(bucket['count'] for bucket in buckets),
+        'amount': sum((bucket['amount'] for bucket in buckets), Decimal('0.00')),
+        'overdue_count': sum(bucket['count'] for bucket in overdue),
+        'overdue_amount': sum((bucket['amount'] for bucket in overdue), Decimal('0.00')),
+    }
\ No newline at end of file
@@ -1,25 +1,74 @@
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import User
 from django.shortcuts import render, redirect, get_object_or_404
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
-from django.db import transaction
+from django.contrib import messages
+from django.db import DatabaseError, transaction
 from decimal import Decimal
 import json
-from .models import Client, Invoice, LineItem, SelfInfo, TaxSettings
+from .models import Client, Invoice, LineItem, SelfInfo, TaxSettings, search_key
 from .forms import ClientForm, InvoiceForm, SelfInfoForm
+from .exports import export_rows, iter_csv, write_xlsx
+from .imports import import_invoices
+from .pdf import get_invoice_pdf
+from .preview import get_preview_document, preview_etag
+from .bulk import iter_invoice_zip
+from .drafts import (
+    add_draft_line,
+    create_invoice_from_draft,
+    draft_total,
+    get_draft,
+    remove_draft_line,
+    reorder_draft_lines,
+    stored_draft_total,
+    touch_draft,
+    update_draft_details,
+    update_draft_line,
+)
+from .search import search_invoices
+from .forecast import FORECAST_METHODS, forecast_taxes
+from .tax_cache import cached_for_user, get_client_version, get_tax_cache_stats
+from .tax_rules import get_tax_rules
 from .utils import (
-    amount_to_words,
+    MONTH_NAMES,
     generate_invoice_number,
-    get_total_gross_income,
-    get_total_taxes,
-    get_net_income,
+    get_client_analytics,
+    get_dashboard_summary,
+    get_income_years,
     get_invoice_stats,
-    calculate_taxes,
+    get_receivables_aging,
+    mark_invoices_paid,
+    get_year_comparison,
+    unpaid_invoices,
+    year_date_range,
+    search_clients,
+    CLIENT_SEARCH_LIMIT,
+    CLIENT_SEARCH_MAX_LIMIT,
 )
-import uuid
+import calendar
 import datetime
-from django.http import JsonResponse
-from django.views.decorators.http import require_POST
+import hashlib
+import io
+import logging
+import tempfile
+from django.core.paginator import Paginator
+from django.http import FileResponse, Http404, JsonResponse, StreamingHttpResponse
+from django.template.loader import render_to_string
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, quote_etag, url_has_allowed_host_and_scheme
+from django.views.decorators.http import condition, require_POST
+
+logger = logging.getLogger(__name__)
+
+
+def _dashboard(user_id, year):
+    """Dashboard summary and invoice stats of a year, cached until the user's data changes."""
+    def compute():
+        summary = get_dashboard_summary(user_id, year)
+        return summary, get_invoice_stats(user_id, year, total=summary['invoice_count'])
+
+    return cached_for_user(user_id, 'dashboard', (year,), compute)
 
 
 @login_required
@@ -29,25 +78,29 @@ def overview(request):
     
     # Default to current year
     year = int(request.GET.get('year', datetime.date.today().year))
-    # Years for dropdown (last 5 years)
-    years = list(range(datetime.date.today().year, datetime.date.today().year - 5, -1))
-
-    # Get financial data for the logged-in user
-    gross_income = get_total_gross_income(current_user.id, year)
-    net_income = get_net_income(current_user.id, year)
-    taxes = get_total_taxes(current_user.id, year)
-    invoice_stats = get_invoice_stats(current_user.id, year)
-
-    # Calculate growth compared to previous year
-    prev_gross = get_total_gross_income(current_user.id, year - 1)
-    prev_net = get_net_income(current_user.id, year - 1)
-    gross_income_growth = (
-        ((gross_income - prev_gross) / prev_gross * 100) if prev_gross > 0 else 100 if gross_income > 0 else 0
-    )
-    net_income_growth = (
-        ((net_income - prev_net) / prev_net * 100) if prev_net > 0 else 100 if net_income > 0 else 0
-    )
+    # Years for dropdown: every year with invoices plus the current one
+    income_years = cached_for_user(current_user.id, 'income_years', (), lambda: get_income_years(current_user.id))
+    years = sorted(set(income_years) | {datetime.date.today().year, year}, reverse=True)
+
+    # Financial data for the logged-in user, aggregated in a single query
+    # and cached until the user's invoices or tax settings change
+    summary, invoice_stats = _dashboard(current_user.id, year)
+    gross_income = summary['gross_income']
+    taxes = summary['taxes']
     taxes_percent = (taxes['total'] / gross_income * 100) if gross_income > 0 else 0
+    activity_start_date = (
+        SelfInfo.objects.filter(user=current_user).values_list('activity_start_date', flat=True).first()
+    )
+
+    # Year-end forecast with every method, projected from the same monthly series
+    today = datetime.date.today()
+    forecasts = []
+    if year >= today.year:
+        forecasts = [
+            forecast_taxes(summary['monthly_income'], summary['prev_monthly_income'], year, method,
+                           today=today, activity_start_date=activity_start_date)
+            for method in FORECAST_METHODS
+        ]
 
     # Invoice stats percentages
     total = invoice_stats['total'] or 1
@@ -55,43 +108,26 @@ def overview(request):
     invoice_stats['paid_percent'] = round(invoice_stats['paid'] / total * 100, 2)
     invoice_stats['unpaid_percent'] = round(invoice_stats['unpaid'] / total * 100, 2)
 
-    # Monthly data for charts
-    monthly_data = []
-    month_names = ['Sau', 'Vas', 'Kov', 'Bal', 'Geg', 'Bir', 'Lie', 'Rgp', 'Rgs', 'Spa', 'Lap', 'Gru']
-    
-    for month in range(1, 13):
-        month_invoices = Invoice.objects.filter(
-            user_id=current_user.id,
-            date__year=year,
-            date__month=month
-        )
-        month_income = sum(inv.total_amount for inv in month_invoices)
-        month_taxes = get_total_taxes(current_user.id, year)
-        # Calculate proportional taxes for the month
-        if gross_income > 0:
-            month_tax_amount = (month_income / gross_income) * taxes['total']
-        else:
-            month_tax_amount = Decimal('0.00')
-        
-        monthly_data.append({
-            'month': month_names[month - 1],
-            'income': float(month_income),
-            'taxes': float(month_tax_amount),
-            'net': float(month_income - month_tax_amount)
-        })
-
     context = {
         'active_page': 'overview',
         'year': year,
         'years': years,
         'gross_income': gross_income,
-        'net_income': net_income,
+        'net_income': summary['net_income'],
         'taxes': taxes,
         'invoice_stats': invoice_stats,
-        'gross_income_growth': round(gross_income_growth, 2),
-        'net_income_growth': round(net_income_growth, 2),
+        'gross_income_growth': round(summary['gross_income_growth'], 2),
+        'net_income_growth': round(summary['net_income_growth'], 2),
         'taxes_percent': round(taxes_percent, 2),
-        'monthly_data': json.dumps(monthly_data),  # Convert to JSON string
+        'monthly_data': json.dumps(summary['monthly_data']),  # Convert to JSON string
+        'forecasts': forecasts,
+        # Inputs of the client-side tax calculator (static/js/tax_calculator.js)
+        'tax_rules': get_tax_rules(year).as_json(),
+        'tax_inputs': {
+            'monthly_income': [str(income) for income in summary['monthly_income']],
+            'activity_start_date': activity_start_date.isoformat() if activity_start_date else None,
+            'today': datetime.date.today().isoformat(),
+        },
         # Optionally add due dates if you want to show them in the table
         'gpm_due_date': None,
         'vsd_due_date': None,
@@ -99,6 +135,102 @@ def overview(request):
     }
     return render(request, 'overview.html', context)
 
+@login_required
+def compare_years(request):
+    """
+    Side-by-side comparison of years: totals, taxes and monthly income.
+
+    ?years=N limits the comparison to the last N years with invoices,
+    ?format=json returns the data as JSON.
+    """
+    income_years = cached_for_user(request.user.id, 'income_years', (), lambda: get_income_years(request.user.id))
+    try:
+        last = int(request.GET.get('years') or 0)
+    except ValueError:
+        last = 0
+    years = income_years[-last:] if last > 0 else income_years
+    comparison = cached_for_user(
+        request.user.id, 'year_comparison', tuple(years), lambda: get_year_comparison(request.user.id, years)
+    )
+
+    if request.GET.get('format') == 'json':
+        return JsonResponse({'years': [
+            {
+                **{k: float(v) if isinstance(v, Decimal) else v for k, v in entry.items() if k not in ('taxes', 'monthly_income')},
+                'taxes': {k: float(v) if isinstance(v, Decimal) else v for k, v in entry['taxes'].items()},
+                'monthly_income': [float(income) for income in entry['monthly_income']],
+            }
+            for entry in comparison
+        ]})
+
+    chart_series = [
+        {'name': str(entry['year']), 'data': [float(income) for income in entry['monthly_income']]}
+        for entry in comparison
+    ]
+    context = {
+        'active_page': 'compare_years',
+        'comparison': list(reversed(comparison)),
+        'income_years': income_years,
+        'selected_last': last,
+        'chart_series': chart_series,
+        'month_names': MONTH_NAMES,
+    }
+    return render(request, 'compare_years.html', context)
+
+
+@login_required
+def client_analytics(request):
+    """
+    Revenue per client: top clients, monthly series, average payment terms.
+
+    ?year=YYYY limits the report to one year (?year=all for every year),
+    ?format=json returns the data as JSON.
+    """
+    today = datetime.date.today()
+    year_param = request.GET.get('year', str(today.year))
+    try:
+        year = None if year_param == 'all' else int(year_param)
+    except ValueError:
+        year = today.year
+    income_years = cached_for_user(request.user.id, 'income_years', (), lambda: get_income_years(request.user.id))
+    years = sorted(set(income_years) | {today.year} | ({year} if year else set()), reverse=True)
+    analytics = get_client_analytics(request.user.id, year)
+
+    if request.GET.get('format') == 'json':
+        return JsonResponse({
+            'year': year,
+            'total_revenue': float(analytics['total_revenue']),
+            'invoice_count': analytics['invoice_count'],
+            'clients': [
+                {
+                    **{k: float(v) if isinstance(v, Decimal) else v for k, v in client.items() if k != 'last_date'},
+                    'last_date': client['last_date'].isoformat() if client['last_date'] else None,
+                }
+                for client in analytics['clients']
+            ],
+            'months': [f"{y}-{m:02d}" for y, m in analytics['months']],
+            'series': [
+                {**entry, 'revenue': [float(value) for value in entry['revenue']]}
+                for entry in analytics['series']
+            ],
+        })
+
+    context = {
+        'active_page': 'client_analytics',
+        'year': year,
+        'years': years,
+        'analytics': analytics,
+        'chart_series': [
+            {'name': entry['company_name'], 'data': [float(value) for value in entry['revenue']]}
+            for entry in analytics['series']
+        ],
+        'chart_categories': [
+            MONTH_NAMES[m - 1] if year else f"{y}-{m:02d}" for y, m in analytics['months']
+        ],
+    }
+    return render(request, 'client_analytics.html', context)
+
+
 @login_required
 def new_invoice(request):
     # Handle POST requests
@@ -112,95 +244,89 @@ def new_invoice(request):
         return redirect('new_invoice')
 
     # Handle GET requests
-    # Initialize session data if not present
-    if 'invoice_data' not in request.session:
-        request.session['invoice_data'] = {
-            'client': '',
-            'date': datetime.date.today().strftime('%Y-%m-%d'),
-            'pay_until': (datetime.date.today() + datetime.timedelta(days=14)).strftime('%Y-%m-%d'),
-            'line_items': []
-        }
-
-    # Generate invoice number for the logged-in user
-    invoice_number = generate_invoice_number(user_id=request.user.id)
+    # The draft is kept in the database (see invoices/drafts.py)
+    draft = get_draft(request.user.id)
 
-    # Get data from session
-    invoice_data = request.session.get('invoice_data', {})
+    # Preview the next invoice number for the logged-in user; it is only
+    # reserved when the invoice is created
+    invoice_number = generate_invoice_number(
+        user_id=request.user.id, serija=draft.serija, year=draft.date.year if draft.date else None,
+    )
 
     # Prepare initial data for form
     initial_data = {
-        'serija': invoice_data.get('serija', 'AA'),
-        'client': invoice_data.get('client', ''),
-        'invoice_number': invoice_data.get('invoice_number', invoice_number),
-        'date': invoice_data.get('date', datetime.date.today().strftime('%Y-%m-%d')),
-        'pay_until': invoice_data.get('pay_until', (datetime.date.today() + datetime.timedelta(days=14)).strftime('%Y-%m-%d'))
+        'serija': draft.serija,
+        'client': draft.client_id or '',
+        'invoice_number': draft.invoice_number or invoice_number,
+        'date': draft.date.isoformat() if draft.date else '',
+        'pay_until': draft.pay_until.isoformat() if draft.pay_until else '',
     }
 
     # Create form with initial data
     form = InvoiceForm(initial=initial_data)
 
-    # Get clients for dropdown
-    clients = Client.objects.all()
-
-    # Get line items from session
-    line_items = invoice_data.get('line_items', [])
+    # Only the selected client is loaded, others are found with the typeahead
+    selected_client = Client.objects.filter(id=draft.client_id, user=request.user).first() if draft.client_id else None
 
-    # Calculate total amount
-    total_amount = Decimal('0.00')
-    for item in line_items:
-        total_amount += Decimal(item.get('total_amount', '0'))
+    line_items = list(draft.line_items.all())
 
     context = {
         'form': form,
-        'clients': clients,
-        'selected_client': invoice_data.get('client', ''),
-        'invoice_number': invoice_data.get('invoice_number', invoice_number),
-        'date': invoice_data.get('date', ''),
-        'pay_until': invoice_data.get('pay_until', ''),
+        'selected_client': selected_client,
+        'invoice_number': initial_data['invoice_number'],
+        'suggested_invoice_number': invoice_number,
+        'date': initial_data['date'],
+        'pay_until': initial_data['pay_until'],
         'line_items': line_items,
-        'total_amount': total_amount,
+        'total_amount': draft_total(line_items),
         'active_page': 'new_invoice',
     }
 
     return render(request, 'new_invoice.html', context)
 
 
-def _add_line_item(request):
-    service_name = request.POST.get('new_service_name')
-    quantity = request.POST.get('new_quantity')
-    pcs_type = request.POST.get('new_pcs_type')
-    price = request.POST.get('new_price')
+def _parse_date(value):
+    try:
+        return datetime.date.fromisoformat(value or '')
+    except ValueError:
+        return None
+
 
-    if service_name and quantity and price:
+def _save_draft_details(request, draft):
+    """Keep the header fields typed so far on the draft; fields missing from the POST are left alone."""
+    data = request.POST
+    details = {}
+    if 'client' in data:
         try:
-            quantity = Decimal(quantity)
-            price = Decimal(price)
-            total = quantity * price
-
-            # Generate a temporary ID for this item
-            item_id = str(uuid.uuid4())
-
-            # Add to session
-            line_items = request.session['invoice_data'].get('line_items', [])
-            line_items.append({
-                'id': item_id,
-                'service_name': service_name,
-                'quantity': str(quantity),
-                'pcs_type': pcs_type,
-                'price': str(price),
-                'total_amount': str(total)
-            })
-            request.session['invoice_data']['line_items'] = line_items
-
-            # Update other form fields in session
-            request.session['invoice_data'].update({
-                'client': request.POST.get('client', ''),
-                'date': request.POST.get('date', ''),
-                'pay_until': request.POST.get('pay_until', '')
-            })
-            request.session.modified = True
-        except (ValueError, TypeError):
-            pass  # Handle invalid number inputs
+            client_id = int(data['client'] or 0) or None
+        except ValueError:
+            client_id = None
+        if client_id and client_id != draft.client_id and not Client.objects.filter(pk=client_id, user=request.user).exists():
+            client_id = None
+        details['client_id'] = client_id
+    if data.get('serija') in dict(Invoice.SERIJA_CHOICES):
+        details['serija'] = data['serija']
+    if 'invoice_number' in data:
+        # An unchanged suggestion is not stored, it may be taken by the time the invoice is created
+        details['invoice_number'] = '' if data['invoice_number'] == data.get('suggested_invoice_number') else data['invoice_number']
+    for name in ('date', 'pay_until'):
+        if name in data:
+            details[name] = _parse_date(data[name])
+    update_draft_details(draft, **details)
+
+
+DRAFT_LINE_FIELDS = {'service_name', 'quantity', 'pcs_type', 'price'}
+
+
+def _add_line_item(request):
+    draft = get_draft(request.user.id)
+    _save_draft_details(request, draft)
+    try:
+        fields = _draft_line_fields(request.POST, prefix='new_')
+    except ValueError:
+        fields = {}  # Handle invalid inputs
+    if set(fields) == DRAFT_LINE_FIELDS:
+        add_draft_line(draft, **fields)
 
     return redirect('new_invoice')
 
@@ -209,77 +335,455 @@ def _create_invoice(request):
     serija = request.POST.get('serija', 'AA')
     client_id = request.POST.get('client')
     invoice_number = request.POST.get('invoice_number')
-    date = request.POST.get('date')
-    pay_until = request.POST.get('pay_until')
-    line_items = request.session['invoice_data'].get('line_items', [])
-
-    if client_id and invoice_number and date and pay_until and line_items:
-        try:
-            with transaction.atomic():
-                total_amount = sum(Decimal(item['total_amount']) for item in line_items)
-                invoice = Invoice.objects.create(
-                    serija=serija,
-                    user_id=request.user.id,  # Use logged-in user
-                    client_id=client_id,
-                    invoice_number=invoice_number,
-                    date=date,
-                    pay_until=pay_until,
-                    total_amount=total_amount
-                )
-                for item in line_items:
-                    LineItem.objects.create(
-                        invoice=invoice,
-                        service_name=item['service_name'],
-                        quantity=item['quantity'],
-                        pcs_type=item['pcs_type'],
-                        price=item['price'],
-                        total_amount=item['total_amount']
-                    )
-                if 'invoice_data' in request.session:
-                    del request.session['invoice_data']
-                return redirect('user_invoices')
-        except Exception as e:
-            print(e)
-            return redirect('user_invoices')
+    suggested_invoice_number = request.POST.get('suggested_invoice_number')
+    date = _parse_date(request.POST.get('date'))
+    pay_until = _parse_date(request.POST.get('pay_until'))
+    draft = get_draft(request.user.id)
+
+    if client_id and not Client.objects.filter(pk=client_id, user=request.user).exists():
+        client_id = None
+    if serija not in dict(Invoice.SERIJA_CHOICES):
+        serija = None
+
+    if not (client_id and serija and invoice_number and date and pay_until and draft.line_items.exists()):
+        messages.error(request, 'Pasirinkite klientą, įveskite numerį ir datas bei pridėkite bent vieną eilutę.')
+        return redirect('new_invoice')
+    # The suggested number was kept: reserve the real next one, so that two
+    # open forms never issue the same number
+    allocate_number = invoice_number == suggested_invoice_number
+    # Numbers restart every year (see allocate_invoice_numbers), so they are unique per user, serija and year
+    if not allocate_number and Invoice.objects.filter(
+        user_id=request.user.id, serija=serija, date__range=year_date_range(date.year), invoice_number=invoice_number
+    ).exists():
+        messages.error(request, f'Sąskaita {serija} {invoice_number} jau išrašyta {date.year} m.')
+        return redirect('new_invoice')
+    try:
+        create_invoice_from_draft(draft, client_id, serija, invoice_number, date, pay_until, allocate_number)
+    except DatabaseError:
+        logger.exception("Creating an invoice for user %s failed", request.user.id)
+        messages.error(request, 'Sąskaitos sukurti nepavyko, bandykite dar kartą. Juodraštis išsaugotas.')
+        return redirect('new_invoice')
     return redirect('user_invoices')
 
+def _draft_line_fields(data, prefix=''):
+    """
+    Line item fields present in POST data, validated. Raises ValueError
+    with a message for the user on invalid input.
+    """
+    fields = {}
+    if prefix + 'service_name' in data:
+        fields['service_name'] = data[prefix + 'service_name'].strip()
+        if not fields['service_name']:
+            raise ValueError('Įveskite pavadinimą')
+    if prefix + 'pcs_type' in data:
+        fields['pcs_type'] = data[prefix + 'pcs_type']
+        if fields['pcs_type'] not in dict(LineItem.PCS_TYPE_CHOICES):
+            raise ValueError('Neteisingas vienetas')
+    for name, error in (('quantity', 'Neteisingas kiekis'), ('price', 'Neteisinga kaina')):
+        if prefix + name in data:
+            try:
+                fields[name] = Decimal(data[prefix + name])
+            except ArithmeticError:
+                raise ValueError(error)
+            if not fields[name].is_finite() or abs(fields[name]) >= 10 ** 8:
+                raise ValueError(error)
+    return fields
+
+
+def _draft_line_response(request, line, draft, status=200):
+    return JsonResponse({
+        'line': {
+            'id': line.id,
+            'position': line.position,
+            'service_name': line.service_name,
+            'quantity': str(line.quantity),
+            'pcs_type': line.pcs_type,
+            'price': str(line.price),
+            'total_amount': str(line.total_amount),
+        },
+        'html': render_to_string('components/draft_line_row.html', {'item': line}, request=request),
+        'total': str(stored_draft_total(draft)),
+    }, status=status)
+
+
 @login_required
-def remove_line_item(request):
-    if request.method == 'POST':
-        item_id = request.POST.get('item_id')
-        if item_id and 'invoice_data' in request.session:
-            line_items = request.session['invoice_data'].get('line_items', [])
-            request.session['invoice_data']['line_items'] = [item for item in line_items if item['id'] != item_id]
-            request.session.modified = True
+@require_POST
+def add_draft_line_ajax(request):
+    """Add a line to the draft; returns the new table row and the draft total."""
+    draft = get_draft(request.user.id)
+    _save_draft_details(request, draft)
+    try:
+        fields = _draft_line_fields(request.POST, prefix='new_')
+        if set(fields) != DRAFT_LINE_FIELDS:
+            raise ValueError('Užpildykite visus laukus')
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    line = add_draft_line(draft, **fields)
+    return _draft_line_response(request, line, draft, status=201)
+
+
+@login_required
+@require_POST
+def update_draft_line_ajax(request, line_id):
+    """
+    Change fields of a draft line; returns the updated row and the draft
+    total. Without JavaScript the whole invoice form is posted here, with
+    the line's fields named line_<id>_<field>, and the form is shown again.
+    """
+    draft = get_draft(request.user.id)
+    ajax = request.headers.get('x-requested-with') == 'XMLHttpRequest'
+    if not ajax:
+        _save_draft_details(request, draft)
+    try:
+        fields = _draft_line_fields(request.POST, prefix='' if ajax else f'line_{line_id}_')
+    except ValueError as e:
+        if not ajax:
+            messages.error(request, str(e))
+            return redirect('new_invoice')
+        return JsonResponse({'error': str(e)}, status=400)
+    line = update_draft_line(draft, line_id, **fields)
+    if line is None:
+        if not ajax:
+            messages.error(request, 'Eilutė nerasta')
+            return redirect('new_invoice')
+        return JsonResponse({'error': 'Eilutė nerasta'}, status=404)
+    touch_draft(draft)
+    if not ajax:
+        return redirect('new_invoice')
+    return _draft_line_response(request, line, draft)
+
+
+@login_required
+@require_POST
+def remove_draft_line_ajax(request, line_id):
+    """Delete a draft line; returns the draft total, or without JavaScript shows the invoice form again."""
+    draft = get_draft(request.user.id)
+    ajax = request.headers.get('x-requested-with') == 'XMLHttpRequest'
+    if not ajax:
+        _save_draft_details(request, draft)
+    if not remove_draft_line(draft, line_id):
+        if not ajax:
+            messages.error(request, 'Eilutė nerasta')
+            return redirect('new_invoice')
+        return JsonResponse({'error': 'Eilutė nerasta'}, status=404)
+    touch_draft(draft)
+    if not ajax:
+        return redirect('new_invoice')
+    return JsonResponse({'id': line_id, 'total': str(stored_draft_total(draft))})
+
+
+@login_required
+@require_POST
+def reorder_draft_lines_ajax(request):
+    """Reorder the draft lines (POST 'order': line ids); returns the ids in their new order."""
+    try:
+        line_ids = [int(line_id) for line_id in request.POST.getlist('order')]
+    except ValueError:
+        return JsonResponse({'error': 'Neteisinga tvarka'}, status=400)
+    draft = get_draft(request.user.id)
+    order = reorder_draft_lines(draft, line_ids)
+    touch_draft(draft)
+    return JsonResponse({'order': order})
+
+INVOICES_PAGE_SIZE = 30
+
+
+def _parse_invoice_cursor(cursor):
+    """Parse a '<YYYY-MM-DD>_<id>' keyset cursor, returning None if it is missing or malformed."""
+    try:
+        date_str, invoice_id = cursor.split('_')
+        return datetime.date.fromisoformat(date_str), int(invoice_id)
+    except (AttributeError, ValueError):
+        return None
+
+
+def _invoice_json(invoice):
+    return {
+        'id': invoice.id,
+        'invoice_number': invoice.invoice_number,
+        'date': invoice.date.isoformat(),
+        'pay_until': invoice.pay_until.isoformat(),
+        'client': str(invoice.client),
+        'total_amount': str(invoice.total_amount),
+        'status': invoice.status,
+        'paid_date': invoice.paid_date.isoformat() if invoice.paid_date else None,
+    }
+
+
+def _search_user_invoices(request, query):
+    """?q= mode of user_invoices: ranked full-text results, one page at a time."""
+    try:
+        page = max(int(request.GET.get('page', 1)), 1)
+    except ValueError:
+        page = 1
+    invoices, has_next = search_invoices(request.user.id, query, page)
+
+    if request.GET.get('format') == 'json':
+        html = ''.join(
+            render_to_string('components/invoice_card.html', {'invoice': invoice}, request=request)
+            for invoice in invoices
+        )
+        return JsonResponse({
+            'query': query,
+            'page': page,
+            'invoices': [_invoice_json(invoice) for invoice in invoices],
+            'html': html,
+            'next_page': page + 1 if has_next else None,
+        })
+
+    context = {
+        'invoices': invoices,
+        'query': query,
+        'page': page,
+        'next_page': page + 1 if has_next else None,
+        'previous_page': page - 1 if page > 1 else None,
+        'months': range(1, 13),
+        'active_page': 'all_invoices',
+    }
+    return render(request, 'user_invoices.html', context)
 
-    return redirect('new_invoice')
 
 @login_required
 def user_invoices(request):
-    # Get invoices for the logged-in user only
-    invoices = Invoice.objects.filter(user=request.user).order_by('-date')
-    clients = Client.objects.all().order_by('company_name')
-    
+    query = request.GET.get('q', '').strip()
+    if query:
+        return _search_user_invoices(request, query)
+
+    # Get invoices for the logged-in user only, newest first, one page at a time
+    invoices = (
+        Invoice.objects
+        .filter(user=request.user)
+        .select_related('client')
+        .only(
+            'id', 'invoice_number', 'date', 'pay_until', 'total_amount', 'status', 'paid_date',
+            'client__company_name', 'client__first_name', 'client__last_name',
+        )
+        .order_by('-date', '-id')
+    )
+    cursor = _parse_invoice_cursor(request.GET.get('after'))
+    if cursor:
+        # Keyset pagination: continue strictly after the last (date, id) shown
+        cursor_date, cursor_id = cursor
+        invoices = invoices.filter(date__lte=cursor_date).exclude(date=cursor_date, id__gte=cursor_id)
+
+    invoices = list(invoices[:INVOICES_PAGE_SIZE + 1])
+    next_cursor = None
+    if len(invoices) > INVOICES_PAGE_SIZE:
+        invoices = invoices[:INVOICES_PAGE_SIZE]
+        last = invoices[-1]
+        next_cursor = f"{last.date.isoformat()}_{last.id}"
+
+    if request.GET.get('format') == 'json':
+        html = ''.join(
+            render_to_string('components/invoice_card.html', {'invoice': invoice}, request=request)
+            for invoice in invoices
+        )
+        return JsonResponse({
+            'invoices': [_invoice_json(invoice) for invoice in invoices],
+            'html': html,
+            'next_cursor': next_cursor,
+        })
+
     context = {
         'invoices': invoices,
-        'clients': clients,
+        'next_cursor': next_cursor,
+        'months': range(1, 13),
         'active_page': 'all_invoices',
     }
     return render(request, 'user_invoices.html', context)
 
+RECEIVABLES_LIST_SIZE = 50
+
+
 @login_required
-def invoice_preview(request, invoice_id):
-    invoice = get_object_or_404(Invoice, id=invoice_id)
-    line_items = invoice.line_items.all()  # Use the related_name
-    client = invoice.client
-    amount_in_words = amount_to_words(invoice.total_amount)
+def receivables(request):
+    """
+    Unpaid invoices: aging buckets and the oldest due invoices.
+
+    Both come from the partial index of unpaid invoices, so the page does
+    not depend on how many paid invoices the user has. ?format=json returns
+    the data as JSON.
+    """
+    today = datetime.date.today()
+    aging = get_receivables_aging(request.user.id, today)
+    invoices = list(
+        unpaid_invoices(request.user.id)
+        .select_related('client')
+        .only('id', 'invoice_number', 'date', 'pay_until', 'total_amount', 'client__company_name')
+        .order_by('pay_until', 'id')[:RECEIVABLES_LIST_SIZE]
+    )
+    for invoice in invoices:
+        invoice.days_overdue = (today - invoice.pay_until).days
+
+    if request.GET.get('format') == 'json':
+        return JsonResponse({
+            'count': aging['count'],
+            'amount': float(aging['amount']),
+            'overdue_count': aging['overdue_count'],
+            'overdue_amount': float(aging['overdue_amount']),
+            'buckets': [{**bucket, 'amount': float(bucket['amount'])} for bucket in aging['buckets']],
+            'invoices': [
+                {
+                    'id': invoice.id,
+                    'invoice_number': invoice.invoice_number,
+                    'client': invoice.client.company_name,
+                    'date': invoice.date.isoformat(),
+                    'pay_until': invoice.pay_until.isoformat(),
+                    'days_overdue': invoice.days_overdue,
+                    'total_amount': str(invoice.total_amount),
+                }
+                for invoice in invoices
+            ],
+        })
+
     context = {
-        'invoice': invoice,
-        'client': client,
-        'line_items': line_items,
-        'amount_in_words': amount_in_words,
+        'active_page': 'receivables',
+        'aging': aging,
+        'invoices': invoices,
+        'more_count': aging['count'] - len(invoices),
+        'today': today,
     }
-    return render(request, 'invoice_preview.html', context)
+    return render(request, 'receivables.html', context)
+
+
+@login_required
+@require_POST
+def mark_invoice_paid(request, invoice_id):
+    """Mark an invoice paid (on paid_date, default today) or, with status=unpaid, unpaid again."""
+    invoice = get_object_or_404(Invoice, id=invoice_id, user=request.user)
+    if request.POST.get('status') == 'unpaid':
+        invoice.status = 'unpaid'
+        invoice.paid_date = None
+    else:
+        try:
+            paid_date = datetime.date.fromisoformat(request.POST.get('paid_date') or '')
+        except ValueError:
+            paid_date = datetime.date.today()
+        invoice.status = 'paid'
+        invoice.paid_date = paid_date
+    invoice.save(update_fields=['status', 'paid_date'])
+
+    if request.headers.get('x-requested-with') == 'XMLHttpRequest':
+        return JsonResponse({
+            'id': invoice.id,
+            'status': invoice.status,
+            'paid_date': invoice.paid_date.isoformat() if invoice.paid_date else None,
+        })
+    next_url = request.POST.get('next')
+    if next_url and url_has_allowed_host_and_scheme(next_url, allowed_hosts={request.get_host()}):
+        return redirect(next_url)
+    return redirect('receivables')
+
+
+@login_required
+@require_POST
+def mark_invoices_paid_bulk(request):
+    """
+    Mark several unpaid invoices paid at once (on paid_date, default today):
+    the ticked ones ('invoice' ids) or, with due_before, every unpaid
+    invoice due before that date.
+    """
+    try:
+        paid_date = datetime.date.fromisoformat(request.POST.get('paid_date') or '')
+    except ValueError:
+        paid_date = datetime.date.today()
+    invoices = unpaid_invoices(request.user.id)
+    due_before = _parse_date(request.POST.get('due_before'))
+    if due_before:
+        invoices = invoices.filter(pay_until__lt=due_before)
+    else:
+        invoice_ids = [value for value in request.POST.getlist('invoice') if value.isdigit()]
+        if not invoice_ids:
+            messages.error(request, 'Pasirinkite bent vieną sąskaitą.')
+            return redirect('receivables')
+        invoices = invoices.filter(id__in=invoice_ids)
+    count = mark_invoices_paid(invoices, paid_date)
+    messages.success(request, f'Apmokėtomis pažymėta sąskaitų: {count}.')
+    return redirect('receivables')
+
+
+@login_required
+def export_invoices(request):
+    """Stream the user's invoices and line items as CSV or XLSX, filtered by year, client and serija."""
+    export_format = request.GET.get('format', 'csv')
+    year = request.GET.get('year') or None
+    client_id = request.GET.get('client') or None
+    serija = request.GET.get('serija') or None
+    try:
+        rows = export_rows(request.user.id, year=year, client_id=client_id, serija=serija)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid filter'}, status=400)
+    filename = f"saskaitos_{year or 'visos'}"
+
+    if export_format == 'xlsx':
+        # openpyxl writes the workbook to disk, the response streams it from there
+        output = tempfile.TemporaryFile()
+        write_xlsx(rows, output)
+        output.seek(0)
+        return FileResponse(output, as_attachment=True, filename=f"{filename}.xlsx")
+
+    response = StreamingHttpResponse(iter_csv(rows), content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="{filename}.csv"'
+    return response
+
+@login_required
+def invoice_pdf(request, invoice_id):
+    """Download the invoice as a server-rendered PDF, served from the PDF cache when unchanged."""
+    invoice = get_object_or_404(
+        Invoice.objects.select_related('client', 'user__self_info'),
+        id=invoice_id,
+        user=request.user,
+    )
+    path = get_invoice_pdf(invoice)
+    filename = f"{invoice.serija}-{invoice.invoice_number}.pdf"
+    return FileResponse(open(path, 'rb'), content_type='application/pdf', filename=filename)
+
+@login_required
+def download_invoices_zip(request):
+    """Download the PDFs of all invoices of a year (optionally a single month) as one ZIP."""
+    try:
+        year = int(request.GET.get('year', datetime.date.today().year))
+        month = int(request.GET['month']) if request.GET.get('month') else None
+        start = datetime.date(year, month or 1, 1)
+        end = datetime.date(year, month, calendar.monthrange(year, month)[1]) if month else datetime.date(year, 12, 31)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid year or month'}, status=400)
+
+    invoices = Invoice.objects.filter(user=request.user, date__range=(start, end)).order_by('date', 'id')
+    filename = f"saskaitos_{year}" + (f"-{month:02d}" if month else "")
+    response = StreamingHttpResponse(iter_invoice_zip(invoices), content_type='application/zip')
+    response['Content-Disposition'] = f'attachment; filename="{filename}.zip"'
+    return response
+
+@login_required
+def invoice_preview(request, invoice_id):
+    """
+    Printable invoice. Answers 304 while the invoice is unchanged (ETag /
+    Last-Modified from Invoice.updated_at and the seller's
+    SelfInfo.updated_at) and otherwise renders it from the preview cache,
+    see invoices/preview.py.
+    """
+    stamps = (
+        Invoice.objects.filter(id=invoice_id, user=request.user)
+        .values_list('updated_at', 'user__self_info__updated_at').first()
+    )
+    if stamps is None:
+        raise Http404
+    updated_at, seller_updated_at = stamps
+    etag = quote_etag(preview_etag(invoice_id, request.user.id, updated_at, seller_updated_at))
+    last_modified = int(max(filter(None, stamps)).timestamp())
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        context = {
+            'invoice_id': invoice_id,
+            'document': get_preview_document(invoice_id, etag),
+        }
+        response = render(request, 'invoice_preview.html', context)
+    response.headers.setdefault('ETag', etag)
+    response.headers.setdefault('Last-Modified', http_date(last_modified))
+    patch_cache_control(response, private=True, max_age=0)
+    patch_vary_headers(response, ['Cookie'])
+    return response
 
 @login_required
 def my_info(request):
@@ -300,23 +804,59 @@ def my_info(request):
     }
     return render(request, 'my_info.html', context)
 
+CLIENTS_PAGE_SIZE = 50
+
+
 @login_required
 def clients(request):
     if request.method == 'POST':
         form = ClientForm(request.POST)
         if form.is_valid():
-            form.save()
+            client = form.save(commit=False)
+            client.user = request.user
+            client.save()
             return redirect('clients')
     else:
         form = ClientForm()
-    clients_list = Client.objects.all()
+    paginator = Paginator(Client.objects.filter(user=request.user).order_by('search_name', 'id'), CLIENTS_PAGE_SIZE)
+    page = paginator.get_page(request.GET.get('page'))
     context = {
         'form': form,
-        'clients': clients_list,
+        'clients': page,
+        'page': page,
         'active_page': 'clients',
     }
     return render(request, 'clients.html', context)
 
+
+def _client_search_params(request):
+    try:
+        limit = min(max(int(request.GET.get('limit', CLIENT_SEARCH_LIMIT)), 1), CLIENT_SEARCH_MAX_LIMIT)
+    except ValueError:
+        limit = CLIENT_SEARCH_LIMIT
+    return request.GET.get('q', '')[:100], limit
+
+
+def _client_search_etag(request):
+    # The user's client version changes with every client change (see signals.py)
+    query, limit = _client_search_params(request)
+    key = f"{request.user.id}:{get_client_version(request.user.id)}:{limit}:{search_key(query)}:{query.strip()}"
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()[:32]
+
+
+@login_required
+@condition(etag_func=_client_search_etag)
+def client_search(request):
+    """
+    Client typeahead: ?q=text&limit=N returns the user's best matching
+    clients as JSON. Unchanged results are answered with 304 via ETag.
+    """
+    query, limit = _client_search_params(request)
+    response = JsonResponse({'results': search_clients(request.user.id, query, limit)})
+    patch_cache_control(response, private=True, max_age=0)
+    patch_vary_headers(response, ['Cookie'])
+    return response
+
 @login_required
 def upload_invoice(request):
     if request.method == 'POST':
@@ -334,17 +874,18 @@ def upload_invoice(request):
             pay_until = invoice_date + datetime.timedelta(days=30)
             
             # Get client
-            client = get_object_or_404(Client, id=client_id)
+            client = get_object_or_404(Client, id=client_id, user=request.user)
             
-            # Create invoice
-            invoice = Invoice.objects.create(
-                user=request.user,
-                client=client,
-                invoice_number=invoice_number,
-                date=invoice_date,
-                pay_until=pay_until,
-                total_amount=total_amount
-            )
+            # Create invoice (the MonthlyIncome rollup is updated in the same transaction)
+            with transaction.atomic():
+                invoice = Invoice.objects.create(
+                    user=request.user,
+                    client=client,
+                    invoice_number=invoice_number,
+                    date=invoice_date,
+                    pay_until=pay_until,
+                    total_amount=total_amount
+                )
             
             return redirect('user_invoices')
         except Exception as e:
@@ -355,74 +896,68 @@ def upload_invoice(request):
 
 
 @login_required
-def calculate_taxes_ajax(request):
-    """AJAX endpoint for real-time tax calculations"""
-    if request.method == 'POST':
-        try:
-            income = Decimal(request.POST.get('income', '0'))
-            use_30_percent = request.POST.get('use_30_percent', 'true') == 'true'
-            expenses = Decimal(request.POST.get('expenses', '0')) if not use_30_percent else None
-            year = request.POST.get('year', None)  # Optional year for monthly breakdown
-            
-            # PSD is always self-paid as a global rule
-            psd_self_paid = True
-            
-            # Get user's activity start date
-            self_info = SelfInfo.objects.filter(user=request.user).first()
-            activity_start_date = self_info.activity_start_date if self_info else None
-            
-            # If year is provided, calculate PSD month by month from actual invoices
-            monthly_psd_data = None
-            if year:
-                try:
-                    year = int(year)
-                    monthly_invoices = []
-                    
-                    for month in range(1, 13):
-                        month_invoices = Invoice.objects.filter(
-                            user_id=request.user.id,
-                            date__year=year,
-                            date__month=month
-                        )
-                        month_income = sum(inv.total_amount for inv in month_invoices)
-                        monthly_invoices.append((month, month_income))
-                    
-                    # Calculate monthly PSD
-                    from .utils import calculate_monthly_psd
-                    monthly_psd_data = calculate_monthly_psd(monthly_invoices, use_30_percent)
-                    
-                except Exception as e:
-                    # If monthly calculation fails, fall back to annual average
-                    monthly_psd_data = None
-            
-            # Calculate taxes
-            result = calculate_taxes(
-                income=income,
-                expenses=expenses,
-                use_30_percent_rule=use_30_percent,
-                activity_start_date=activity_start_date,
-                psd_self_paid=psd_self_paid
-            )
-            
-            # If we have monthly PSD data, override the PSDI value
-            if monthly_psd_data:
-                result['psdi'] = Decimal(str(monthly_psd_data['annual_total']))
-                result['psdi_note'] = f"Savaimokestis skaičiuojamas kiekvieną mėnesį pagal faktines pajamas (suma: {monthly_psd_data['annual_total']}€/metus)"
-                result['psdi_monthly_breakdown'] = monthly_psd_data['monthly_breakdown']
-                
-                # Recalculate totals with the accurate monthly PSD
-                result['total_taxes'] = result['vsdi'] + result['psdi'] + result['gpm']
-                result['total_taxes_to_deduct'] = result['vsdi'] + result['gpm']  # PSD not deducted
-                result['net_income'] = income - result['expenses'] - result['total_taxes_to_deduct']
-            
-            # Convert Decimal to float for JSON
-            json_result = {
-                k: float(v) if isinstance(v, Decimal) else v 
-                for k, v in result.items()
-            }
-            
-            return JsonResponse(json_result)
-        except Exception as e:
-            return JsonResponse({'error': str(e)}, status=400)
-    
-    return JsonResponse({'error': 'Method not allowed'}, status=405)
+@require_POST
+def import_invoices_upload(request):
+    """Bulk import invoices from an uploaded CSV or JSON file."""
+    upload = request.FILES.get('file')
+    if not upload:
+        messages.error(request, 'Pasirinkite failą importui.')
+        return redirect('user_invoices')
+
+    file_format = 'json' if upload.name.lower().endswith(('.json', '.jsonl')) else 'csv'
+    stream = io.TextIOWrapper(upload.file, encoding='utf-8-sig', newline='')
+    try:
+        result = import_invoices(request.user.id, stream, file_format=file_format)
+    except UnicodeDecodeError:
+        messages.error(request, 'Failas turi būti UTF-8 koduotės.')
+        return redirect('user_invoices')
+
+    messages.success(
+        request,
+        f"Importuota sąskaitų: {result['invoices']}, eilučių: {result['line_items']}, klaidų: {len(result['errors'])}."
+    )
+    for row_number, message in result['errors'][:20]:
+        messages.error(request, f"Eilutė {row_number}: {message}")
+    if len(result['errors']) > 20:
+        messages.error(request, f"... ir dar {len(result['errors']) - 20} klaidų.")
+    return redirect('user_invoices')
+
+
+def _tax_result_json(result):
+    # Convert Decimal to float for JSON
+    return {
+        k: float(v) if isinstance(v, Decimal) else v 
+        for k, v in result.items()
+    }
+
+
+@login_required
+def tax_forecast(request):
+    """
+    Year-end income and tax forecast as JSON.
+
+    Query parameters: year (defaults to the current year) and method
+    (one of FORECAST_METHODS, defaults to trailing_average).
+    """
+    try:
+        year = int(request.GET.get('year') or datetime.date.today().year)
+    except ValueError:
+        return JsonResponse({'error': 'invalid year'}, status=400)
+    method = request.GET.get('method') or 'trailing_average'
+    if method not in FORECAST_METHODS:
+        return JsonResponse({'error': f"method must be one of: {', '.join(FORECAST_METHODS)}"}, status=400)
+
+    summary, _ = _dashboard(request.user.id, year)
+    activity_start_date = (
+        SelfInfo.objects.filter(user=request.user).values_list('activity_start_date', flat=True).first()
+    )
+    forecast = forecast_taxes(summary['monthly_income'], summary['prev_monthly_income'], year, method,
+                              activity_start_date=activity_start_date)
+    forecast['months'] = [_tax_result_json(month) for month in forecast['months']]
+    return JsonResponse(_tax_result_json(forecast))
+
+
+@staff_member_required
+def tax_cache_stats(request):
+    """Hit, miss and invalidation counters of the tax calculation cache."""
+    return JsonResponse(get_tax_cache_stats())
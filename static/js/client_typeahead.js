@@ -0,0 +1,126 @@
+// Client typeahead (templates/components/client_typeahead.html).
+// Clients are fetched from the client_search endpoint as the user types,
+// so pages never load the whole client list. Answers are kept per query
+// for the page's lifetime; the browser revalidates the rest with ETags.
+(function() {
+    const DEBOUNCE_MS = 150;
+
+    function setup(root) {
+        const idInput = root.querySelector('[data-client-id]');
+        const textInput = root.querySelector('[data-client-input]');
+        const list = root.querySelector('[data-client-results]');
+        const answers = new Map();
+        let results = [];
+        let active = -1;
+        let timer = null;
+        let controller = null;
+
+        function label(client) {
+            return client.company_name + ' (' + client.company_code + ')';
+        }
+
+        function validate() {
+            const picked = idInput.value !== '';
+            textInput.setCustomValidity(!picked && (textInput.required || textInput.value) ? 'Pasirinkite klientą iš sąrašo' : '');
+        }
+
+        function close() {
+            list.classList.add('hidden');
+            active = -1;
+        }
+
+        function render() {
+            list.innerHTML = '';
+            results.forEach((client, index) => {
+                const item = document.createElement('li');
+                item.textContent = label(client);
+                item.className = 'px-3 py-2 cursor-pointer text-sm ' + (index === active ? 'bg-indigo-50 text-indigo-700' : 'hover:bg-gray-50');
+                item.addEventListener('mousedown', event => {
+                    event.preventDefault();
+                    pick(client);
+                });
+                list.appendChild(item);
+            });
+            if (!results.length) {
+                const item = document.createElement('li');
+                item.textContent = 'Klientų nerasta';
+                item.className = 'px-3 py-2 text-sm text-gray-500';
+                list.appendChild(item);
+            }
+            list.classList.remove('hidden');
+        }
+
+        function pick(client) {
+            idInput.value = client.id;
+            textInput.value = client.company_name;
+            validate();
+            close();
+            idInput.dispatchEvent(new Event('change', {bubbles: true}));
+        }
+
+        function show(query, clients) {
+            if (query === textInput.value.trim()) {
+                results = clients;
+                active = clients.length ? 0 : -1;
+                render();
+            }
+        }
+
+        function search() {
+            const query = textInput.value.trim();
+            if (answers.has(query)) {
+                show(query, answers.get(query));
+                return;
+            }
+            if (controller) {
+                controller.abort();
+            }
+            controller = new AbortController();
+            fetch(root.dataset.url + '?q=' + encodeURIComponent(query), {signal: controller.signal, headers: {'X-Requested-With': 'XMLHttpRequest'}})
+                .then(response => response.json())
+                .then(data => {
+                    answers.set(query, data.results);
+                    show(query, data.results);
+                })
+                .catch(error => {
+                    if (error.name !== 'AbortError') {
+                        console.error('Client search error:', error);
+                    }
+                });
+        }
+
+        textInput.addEventListener('input', function() {
+            idInput.value = '';
+            validate();
+            clearTimeout(timer);
+            timer = setTimeout(search, DEBOUNCE_MS);
+        });
+        textInput.addEventListener('focus', function() {
+            if (!idInput.value) {
+                search();
+            }
+        });
+        textInput.addEventListener('blur', close);
+        textInput.addEventListener('keydown', function(event) {
+            if (list.classList.contains('hidden')) {
+                return;
+            }
+            if ((event.key === 'ArrowDown' || event.key === 'ArrowUp') && results.length) {
+                event.preventDefault();
+                const step = event.key === 'ArrowDown' ? 1 : -1;
+                active = (active + step + results.length) % results.length;
+                render();
+            } else if (event.key === 'Enter' && active >= 0) {
+                event.preventDefault();
+                pick(results[active]);
+            } else if (event.key === 'Escape') {
+                close();
+            }
+        });
+        validate();
+    }
+
+    document.addEventListener('DOMContentLoaded', function() {
+        document.querySelectorAll('[data-client-typeahead]').forEach(setup);
+    });
+})();
@@ -0,0 +1,247 @@
+/*
+ * Client-side version of calculate_taxes() and calculate_monthly_psd()
+ * from invoices/utils.py.
+ *
+ * Money is handled as BigInt cents and every Decimal quantize of the
+ * Python code is an exact integer division rounding halves away from zero
+ * (ROUND_HALF_UP), so results match the server to the cent. The rate table
+ * comes from the server (TaxRules.as_json()) once per page load.
+ *
+ * Results use the same keys as calculate_taxes() in Python. Checked
+ * against the Python implementation with `manage.py check_tax_js_parity`.
+ */
+(function (root) {
+    'use strict';
+
+    // Same forms as Python's Decimal() (and <input type=number>): sign, digits, point, exponent
+    const AMOUNT_PATTERN = /^([+-])?(\d*)(?:\.(\d*))?(?:[eE]([+-]?\d+))?$/;
+
+    function abs(value) {
+        return value < 0n ? -value : value;
+    }
+
+    // numerator / denominator rounded to an integer, halves away from zero
+    function roundDiv(numerator, denominator) {
+        const magnitude = (2n * abs(numerator) + denominator) / (2n * denominator);
+        return numerator < 0n ? -magnitude : magnitude;
+    }
+
+    // Exact fraction of a decimal string, e.g. '0.1252' -> {num: 1252n, den: 10000n}
+    function ratio(text) {
+        const match = AMOUNT_PATTERN.exec(String(text).trim());
+        const fraction = (match && match[3]) || '';
+        const exponent = BigInt((match && match[4]) || '0') - BigInt(fraction.length);
+        let num = BigInt((match[2] || '0') + fraction);
+        let den = 1n;
+        if (exponent >= 0n) {
+            num *= 10n ** exponent;
+        } else {
+            den = 10n ** -exponent;
+        }
+        return {num: match[1] === '-' ? -num : num, den: den};
+    }
+
+    // Amount in euros (string or number) to BigInt cents, rounded half up
+    // like _money() in invoices/utils.py
+    function toCents(value) {
+        const text = typeof value === 'number' ? value.toFixed(6) : String(value === null || value === undefined ? '' : value).trim();
+        const match = AMOUNT_PATTERN.exec(text);
+        if (!match || !(match[2] || match[3])) {
+            return 0n;
+        }
+        const amount = ratio(text);
+        return roundDiv(amount.num * 100n, amount.den);
+    }
+
+    function mulRate(cents, rate) {
+        return roundDiv(cents * rate.num, rate.den);
+    }
+
+    // part / income * 100 rounded half to even, like Decimal's default context
+    function percent(part, income) {
+        if (income <= 0n) {
+            return 0;
+        }
+        const numerator = abs(part) * 10000n;
+        let quotient = numerator / income;
+        const remainder = numerator % income;
+        if (2n * remainder > income || (2n * remainder === income && quotient % 2n === 1n)) {
+            quotient += 1n;
+        }
+        return Number(part < 0n ? -quotient : quotient) / 100;
+    }
+
+    function euros(cents) {
+        return Number(cents) / 100;
+    }
+
+    // Decimal string with two places, as str() of a quantized Decimal
+    function formatCents(cents) {
+        const sign = cents < 0n ? '-' : '';
+        const digits = abs(cents).toString().padStart(3, '0');
+        return sign + digits.slice(0, -2) + '.' + digits.slice(-2);
+    }
+
+    // str() of a Python float, which always keeps a decimal point
+    function formatFloat(value) {
+        const text = String(value);
+        return /^-?\d+$/.test(text) ? text + '.0' : text;
+    }
+
+    function compileRules(raw) {
+        return {
+            year: raw.year,
+            vsdiRate: ratio(raw.vsdi_rate),
+            psdiRate: ratio(raw.psdi_rate),
+            gpmRate: ratio(raw.gpm_rate),
+            expenseRate: ratio(raw.expense_rate),
+            gpmLimit: toCents(raw.gpm_limit),
+            mma: toCents(raw.mma),
+            minPsdMonthly: toCents(raw.min_psd_monthly),
+            minPsdMonthlyText: String(raw.min_psd_monthly)
+        };
+    }
+
+    function monthsSince(start, current) {
+        const [startYear, startMonth] = start.split('-').map(Number);
+        const [currentYear, currentMonth] = current.split('-').map(Number);
+        return (currentYear - startYear) * 12 + (currentMonth - startMonth);
+    }
+
+    /*
+     * options: income, expenses, use30PercentRule, activityStartDate and
+     * currentDate ('YYYY-MM-DD'), psdSelfPaid. rules: compileRules() result.
+     */
+    function calculateTaxes(options, rules) {
+        const use30 = options.use30PercentRule !== false;
+        const selfPaid = options.psdSelfPaid !== false;
+        const income = toCents(options.income);
+        const expenses = use30 ? mulRate(income, rules.expenseRate) : toCents(options.expenses || 0);
+        const profit = income - expenses;
+
+        // VSDI and PSDI base = 50% of profit
+        const base = roundDiv(profit, 2n);
+        const vsdiExempt = Boolean(options.activityStartDate) && monthsSince(options.activityStartDate, options.currentDate) < 12;
+        const vsdi = vsdiExempt ? 0n : mulRate(base, rules.vsdiRate);
+
+        const monthlyIncome = roundDiv(income, 12n);
+        let psdi;
+        let psdiNote;
+        if (monthlyIncome <= rules.mma) {
+            psdi = rules.minPsdMonthly * 12n;
+            psdiNote = selfPaid
+                ? `Minimalus savaimokestis ${rules.minPsdMonthlyText}€/mėn × 12 mėn (vid. pajamos ${formatCents(monthlyIncome)}€/mėn ≤ MMA)`
+                : `Minimalus PSD ${rules.minPsdMonthlyText}€/mėn × 12 mėn`;
+        } else if (selfPaid) {
+            const monthlyPsdi = mulRate(roundDiv(base, 12n), rules.psdiRate);
+            psdi = monthlyPsdi * 12n;
+            psdiNote = `Savaimokestis ${formatCents(monthlyPsdi)}€/mėn × 12 mėn (vid. pajamos ${formatCents(monthlyIncome)}€/mėn > MMA)`;
+        } else {
+            psdi = mulRate(base, rules.psdiRate);
+            psdiNote = 'Standartinis metinis skaičiavimas';
+        }
+
+        // Self-paid PSD is not deducted from the GPM base
+        const gpmBase = profit - vsdi - (selfPaid ? 0n : psdi);
+        const gpmTaxable = gpmBase < rules.gpmLimit ? gpmBase : rules.gpmLimit;
+        const gpm = mulRate(gpmTaxable, rules.gpmRate);
+
+        const totalTaxes = vsdi + psdi + gpm;
+        const totalToDeduct = selfPaid ? vsdi + gpm : totalTaxes;
+
+        return {
+            income: euros(income),
+            expenses: euros(expenses),
+            profit: euros(profit),
+            vsdi_base: euros(base),
+            psdi_base: euros(base),
+            vsdi: euros(vsdi),
+            psdi: euros(psdi),
+            psdi_is_self_paid: selfPaid,
+            psdi_note: psdiNote,
+            gpm_base: euros(gpmBase),
+            gpm_taxable: euros(gpmTaxable),
+            gpm: euros(gpm),
+            total_taxes: euros(totalTaxes),
+            total_taxes_to_deduct: euros(totalToDeduct),
+            net_income: euros(income - expenses - totalToDeduct),
+            vsdi_exempt: vsdiExempt,
+            income_vs_mma: income <= rules.mma ? 'below' : 'above',
+            tax_year: rules.year,
+            mma: euros(rules.mma),
+            mma_2025: euros(rules.mma),
+            min_psd_monthly: euros(rules.minPsdMonthly),
+            gpm_percent: percent(gpm, income),
+            vsdi_percent: percent(vsdi, income),
+            psdi_percent: percent(psdi, income),
+            total_percent: percent(totalTaxes, income)
+        };
+    }
+
+    // monthlyIncomes: list of [month, income] pairs
+    function calculateMonthlyPsd(monthlyIncomes, use30PercentRule, rules) {
+        let annualTotal = 0n;
+        const breakdown = monthlyIncomes.map(function ([month, value]) {
+            const income = toCents(value);
+            const expenses = use30PercentRule !== false ? mulRate(income, rules.expenseRate) : 0n;
+            const profit = income - expenses;
+            const psdiBase = roundDiv(profit, 2n);
+            let psd = rules.minPsdMonthly;
+            let calculationType = 'minimal';
+            if (income > rules.mma) {
+                const calculated = mulRate(psdiBase, rules.psdiRate);
+                if (calculated >= rules.minPsdMonthly) {
+                    psd = calculated;
+                    calculationType = 'calculated';
+                }
+            }
+            annualTotal += psd;
+            return {
+                month: month,
+                income: euros(income),
+                profit: euros(profit),
+                psdi_base: euros(psdiBase),
+                psd: euros(psd),
+                calculation_type: calculationType,
+                above_mma: income > rules.mma
+            };
+        });
+        return {
+            monthly_breakdown: breakdown,
+            annual_total: euros(annualTotal),
+            tax_year: rules.year,
+            mma: euros(rules.mma),
+            mma_2025: euros(rules.mma),
+            min_psd_monthly: euros(rules.minPsdMonthly)
+        };
+    }
+
+    // Same as apply_monthly_psd() in invoices/utils.py
+    function applyMonthlyPsd(result, monthlyPsd) {
+        const income = toCents(result.income);
+        const expenses = toCents(result.expenses);
+        const vsdi = toCents(result.vsdi);
+        const gpm = toCents(result.gpm);
+        const psdi = toCents(monthlyPsd.annual_total);
+        result.psdi = euros(psdi);
+        result.psdi_note = `Savaimokestis skaičiuojamas kiekvieną mėnesį pagal faktines pajamas (suma: ${formatFloat(monthlyPsd.annual_total)}€/metus)`;
+        result.psdi_monthly_breakdown = monthlyPsd.monthly_breakdown;
+        result.total_taxes = euros(vsdi + psdi + gpm);
+        result.total_taxes_to_deduct = euros(vsdi + gpm);
+        result.net_income = euros(income - expenses - vsdi - gpm);
+        return result;
+    }
+
+    const api = {
+        toCents: toCents,
+        compileRules: compileRules,
+        calculateTaxes: calculateTaxes,
+        calculateMonthlyPsd: calculateMonthlyPsd,
+        applyMonthlyPsd: applyMonthlyPsd
+    };
+    if (typeof module !== 'undefined' && module.exports) {
+        module.exports = api;
+    } else {
+        root.TaxCalculator = api;
+    }
+})(this);